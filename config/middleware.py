@@ -1,4 +1,19 @@
 import logging
+import tempfile
+import zlib
+
+from django.conf import settings
+from django.core.handlers.wsgi import LimitedStream
+from django.http import HttpResponse, HttpResponseBadRequest
+
+try:
+    import zstandard
+except ImportError:
+    # zstd request bodies are only accepted when the optional zstandard package is installed
+    zstandard = None
+
+DECOMPRESSION_ERRORS = (zlib.error,) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
 
 class ExceptionLoggingMiddleware(object):
 
@@ -14,3 +29,68 @@ class XForwardedForMiddleware():
             request.META["REMOTE_ADDR"] = parts[0]
 
 
+class DecompressRequestMiddleware(object):
+    """
+    Transparently decompresses request bodies sent with Content-Encoding: gzip, deflate (zlib) or
+    zstd (if the zstandard package is installed), so hubs on slow links can compress their uploads.
+
+    The body is decompressed a block at a time into a spooled temporary file, so memory use is
+    bounded, and the request is rejected with a 413 as soon as the decompressed size passes
+    settings.MAX_DECOMPRESSED_REQUEST_SIZE. Views see an ordinary uncompressed request.
+    """
+
+    BLOCK_SIZE = 64 * 1024
+
+    def process_request(self, request):
+        encoding = request.META.get("HTTP_CONTENT_ENCODING", "").strip().lower()
+        if not encoding or encoding == "identity":
+            return None
+
+        if encoding in ("gzip", "x-gzip", "deflate"):
+            blocks = self._zlib_blocks(request)
+        elif encoding == "zstd" and zstandard is not None:
+            blocks = self._zstd_blocks(request)
+        else:
+            return HttpResponse("Unsupported Content-Encoding", status=415)
+
+        limit = settings.MAX_DECOMPRESSED_REQUEST_SIZE
+        body = tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+        size = 0
+        try:
+            for block in blocks:
+                size += len(block)
+                if size > limit:
+                    body.close()
+                    return HttpResponse("Decompressed request body is too large", status=413)
+                body.write(block)
+        except DECOMPRESSION_ERRORS as e:
+            body.close()
+            return HttpResponseBadRequest("Could not decompress request body: {}".format(e))
+
+        body.seek(0)
+        request._stream = LimitedStream(body, size)
+        request._read_started = False
+        request.META["CONTENT_LENGTH"] = str(size)
+        request.META["HTTP_X_ORIGINAL_CONTENT_ENCODING"] = request.META.pop("HTTP_CONTENT_ENCODING")
+        return None
+
+    def _zlib_blocks(self, request):
+        # wbits 32 + MAX_WBITS accepts both gzip and zlib headers
+        decompressor = zlib.decompressobj(32 + zlib.MAX_WBITS)
+        while True:
+            data = request.read(self.BLOCK_SIZE)
+            if not data:
+                break
+            # max_length keeps a small, highly compressed block from expanding all at once
+            while data:
+                yield decompressor.decompress(data, self.BLOCK_SIZE)
+                data = decompressor.unconsumed_tail
+        yield decompressor.flush()
+
+    def _zstd_blocks(self, request):
+        reader = zstandard.ZstdDecompressor().stream_reader(request)
+        while True:
+            block = reader.read(self.BLOCK_SIZE)
+            if not block:
+                break
+            yield block
@@ -51,6 +51,7 @@ MIDDLEWARE_CLASSES = (
     # TODO project.middleware ???
     'config.middleware.ExceptionLoggingMiddleware',
     'config.middleware.XForwardedForMiddleware',
+    'config.middleware.DecompressRequestMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -189,3 +190,48 @@ GOD_KEY = env("GOD_KEY")
 DJANGO_SECURE_SSL_REDIRECT=False
 # django-allauth
 DJANGO_ACCOUNT_ALLOW_REGISTRATION=True
+
+# HUB DATA CONFIGURATION
+# ------------------------------------------------------------------------------
+# Largest single chunk (one line of a meeting log or datafile) accepted by the streaming upload endpoints
+MAX_CHUNK_SIZE = env.int("MAX_CHUNK_SIZE", 1024 * 1024)
+
+# Storage format for newly created DataFiles, "json" (one chunk per line) or "packed" (see openbadge/packed.py).
+# Existing files keep their format; use `manage.py convert_datafiles` to convert them
+DATAFILE_FORMAT = env("DATAFILE_FORMAT", default="json")
+
+# DataFiles are written in segments: a new segment file is started for each DATAFILE_SEGMENT_SECONDS period (UTC,
+# 0 for no time limit) or once the current one reaches DATAFILE_SEGMENT_MAX_SIZE bytes.
+# `manage.py prune_datafiles` drops old segments
+DATAFILE_SEGMENT_SECONDS = env.int("DATAFILE_SEGMENT_SECONDS", 24 * 60 * 60)
+DATAFILE_SEGMENT_MAX_SIZE = env.int("DATAFILE_SEGMENT_MAX_SIZE", 64 * 1024 * 1024)
+
+# Meeting logs and DataFile segments keep a sparse time index (<file>.idx, see openbadge/chunkindex.py) with an
+# entry for every CHUNK_INDEX_INTERVAL-th chunk, so time-range reads only parse the part of the file they need
+CHUNK_INDEX_INTERVAL = env.int("CHUNK_INDEX_INTERVAL", 100)
+
+# Write-behind ingestion. When set, hub uploads are pushed onto this queue and written by `manage.py drain_ingest`
+# instead of inside the request. redis://host:port/db or file:///path/to/dir, empty to ingest inline
+INGEST_QUEUE_URL = env("INGEST_QUEUE_URL", default="")
+# Number of streamed datafile lines pushed onto the ingest queue as a single item
+INGEST_QUEUE_BATCH = env.int("INGEST_QUEUE_BATCH", 1000)
+
+# Hub heartbeats (last_seen_ts etc.) are buffered and written out every HEARTBEAT_FLUSH_INTERVAL seconds as a single
+# UPDATE instead of on every hub request, see openbadge/heartbeat.py. 0 writes them straight away
+HEARTBEAT_FLUSH_INTERVAL = env.int("HEARTBEAT_FLUSH_INTERVAL", 5)
+
+# Hubs named by X-HUB-UUID are cached for HUB_CACHE_TIMEOUT seconds in the cache HUB_CACHE_ALIAS (see CACHES), so
+# authenticating a hub request usually costs no query, see openbadge/hubcache.py. Saving a hub only drops it from a
+# process-local cache in the process that saved it, run several workers with a shared one (production uses Redis)
+HUB_CACHE_ALIAS = env("HUB_CACHE_ALIAS", default="default")
+HUB_CACHE_TIMEOUT = env.int("HUB_CACHE_TIMEOUT", 60)
+
+# Badge status reports are kept as telemetry samples, which `manage.py rollup_telemetry` rolls up into 1-minute and
+# 1-hour summaries (see openbadge/telemetry.py). It drops samples after TELEMETRY_RAW_DAYS days, 1-minute summaries
+# after TELEMETRY_MINUTE_DAYS and 1-hour ones after TELEMETRY_HOUR_DAYS, 0 keeps them forever
+TELEMETRY_RAW_DAYS = env.int("TELEMETRY_RAW_DAYS", 7)
+TELEMETRY_MINUTE_DAYS = env.int("TELEMETRY_MINUTE_DAYS", 90)
+TELEMETRY_HOUR_DAYS = env.int("TELEMETRY_HOUR_DAYS", 0)
+
+# Largest request body accepted once a compressed (Content-Encoding: gzip/deflate/zstd) upload is decompressed
+MAX_DECOMPRESSED_REQUEST_SIZE = env.int("MAX_DECOMPRESSED_REQUEST_SIZE", 256 * 1024 * 1024)
@@ -21,8 +21,18 @@ CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         'LOCATION': ''
+    },
+    # shared by all the workers, so a saved hub is dropped from the cache for every one of them
+    'hubs': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': env('HUB_CACHE_URL', default='redis://redis:6379/1'),
+        'OPTIONS': {
+            # without Redis hubs are looked up in the database on every request
+            'IGNORE_EXCEPTIONS': True,
+        }
     }
 }
+HUB_CACHE_ALIAS = env('HUB_CACHE_ALIAS', default='hubs')
 
 # STATIC FILE CONFIGURATION
 # ------------------------------------------------------------------------------
@@ -12,7 +12,7 @@ from .common import *  # noqa
 # ------------------------------------------------------------------------------
 # Turn debug off so tests run faster
 DEBUG = False
-TEMPLATES[0]['OPTIONS']['debug'] = False
+TEMPLATE_DEBUG = False
 
 
 # Mail settings
@@ -37,6 +37,11 @@ CACHES = {
 # TESTING
 # ------------------------------------------------------------------------------
 TEST_RUNNER = 'django.test.runner.DiscoverRunner'
+# write hub heartbeats straight away rather than from a background thread
+HEARTBEAT_FLUSH_INTERVAL = 0
+# tests override these with temporary directories
+DATA_DIR = "/data/"
+MEETINGS_DIR = "../meetings/"
 
 
 # PASSWORD HASHING
@@ -49,9 +54,9 @@ PASSWORD_HASHERS = (
 # TEMPLATE LOADERS
 # ------------------------------------------------------------------------------
 # Keep templates in memory so tests run faster
-TEMPLATES[0]['OPTIONS']['loaders'] = [
-    ('django.template.loaders.cached.Loader', [
+TEMPLATE_LOADERS = (
+    ('django.template.loaders.cached.Loader', (
         'django.template.loaders.filesystem.Loader',
         'django.template.loaders.app_directories.Loader',
-    ]),
-]
+    )),
+)
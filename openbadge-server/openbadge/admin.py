@@ -7,8 +7,12 @@ from django.conf import settings
 from django.contrib import admin
 from django.contrib.admin.widgets import AdminTextareaWidget
 from django.contrib.auth import admin as auth_admin
+from django.core.paginator import Paginator
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.db.models import Count, DecimalField, ExpressionWrapper, F
 from django.utils.translation import ugettext_lazy as _
-from django.utils.html import format_html
+from django.utils.html import format_html, format_html_join
 from .models import OpenBadgeUser, Meeting, Member, Project, Hub
 
 
@@ -43,14 +47,8 @@ class SerializedFieldWidget(AdminTextareaWidget):
         return super(SerializedFieldWidget, self).render(name, simplejson.dumps(value, indent=4), attrs)
 
 
-class MemberInline(admin.TabularInline, GetLocalTimeMixin):
-    model = Member
-    extra = 3
+class MemberStatusMixin(GetLocalTimeMixin):
     warning_color = 'ff0000' #hexadecimal for the color of warning messages, currently bright red
-    fields = ('key', 'name', 'email', 'badge', 
-              'last_seen', 'voltage', 'last_audio', 'last_audio_ts',
-              'last_audio_ts_fract', 'last_proximity_ts')
-    readonly_fields = ('key', 'last_seen', 'last_audio', 'voltage')
 
     #if difference between now and last seen is more than 6 hours formats in color specified by warning_color
     def last_seen(self, obj):
@@ -65,9 +63,13 @@ class MemberInline(admin.TabularInline, GetLocalTimeMixin):
         else:
             return local_time
 
+    last_seen.admin_order_field = 'last_seen_ts'
+
     def last_audio(self, obj):
         return self.get_local_time(obj.last_audio_ts)
 
+    last_audio.admin_order_field = 'last_audio_ts'
+
     #if obj.last_voltage < 2.6, formats in color specified by warning_color
     def voltage(self, obj):
         if obj.last_voltage < 2.6:
@@ -79,67 +81,154 @@ class MemberInline(admin.TabularInline, GetLocalTimeMixin):
         else:
             return obj.last_voltage
 
-class MeetingInLine(admin.TabularInline, GetLocalTimeMixin):
-    model = Meeting
-    readonly_fields = ("uuid",)
+    voltage.admin_order_field = 'last_voltage'
 
 
-class HubInline(admin.TabularInline, GetLocalTimeMixin):
-    model = Hub
-
-    fields = ("name", "god", "uuid", "last_seen", "last_hub_time", "time_difference_in_seconds", "ip_address", "key")
-    readonly_fields = ("key", 'last_seen', "last_hub_time", "time_difference_in_seconds")
+class HubStatusMixin(GetLocalTimeMixin):
 
     def last_seen(self, obj):
         return self.get_local_time(obj.last_seen_ts)
 
+    last_seen.admin_order_field = 'last_seen_ts'
+
     def last_hub_time(self, obj):
         return self.get_local_time(obj.last_hub_time_ts)
 
     def time_difference_in_seconds(self, obj):
         return abs(obj.last_seen_ts - obj.last_hub_time_ts)
+
+
+class MemberInline(admin.TabularInline, MemberStatusMixin):
+    model = Member
+    extra = 3
+    fields = ('key', 'name', 'email', 'badge', 
+              'last_seen', 'voltage', 'last_audio', 'last_audio_ts',
+              'last_audio_ts_fract', 'last_proximity_ts')
+    readonly_fields = ('key', 'last_seen', 'last_audio', 'voltage')
+
+
+class MeetingInLine(admin.TabularInline, GetLocalTimeMixin):
+    model = Meeting
+    readonly_fields = ("uuid",)
+
+
+class HubInline(admin.TabularInline, HubStatusMixin):
+    model = Hub
+
+    fields = ("name", "god", "uuid", "last_seen", "last_hub_time", "time_difference_in_seconds", "ip_address", "key")
+    readonly_fields = ("key", 'last_seen', "last_hub_time", "time_difference_in_seconds")
         
 
 @register(Project)
 class ProjectAdmin(admin.ModelAdmin):
-    readonly_fields = ("key",)
+    readonly_fields = ("key", "related_lists")
     list_display = ('name', 'key', 'id', 'number_of_members', 'number_of_meetings', 'total_meeting_time')
     list_filter = ('name',)
     inlines = (MemberInline, HubInline, MeetingInLine)
+    # projects with more members, hubs or meetings than this link to their (paginated) admin lists instead
+    inline_limit = 50
     actions_on_top = True
 
     def get_queryset(self, request):
-        return Project.objects.prefetch_related("members", "hubs")
+        queryset = super(ProjectAdmin, self).get_queryset(request).annotate(
+            members_count=Count('members', distinct=True), hubs_count=Count('hubs', distinct=True))
+        # the meetings are summed in correlated subqueries: joined with the members too, the sum would be
+        # multiplied by their number
+        project = Project._meta.db_table
+        meeting = Meeting._meta.db_table
+        return queryset.extra(select={
+            "meetings_count": "SELECT COUNT(*) FROM {0} WHERE {0}.project_id = {1}.id".format(meeting, project),
+            "meeting_seconds": "SELECT COALESCE(SUM({0}.last_update_timestamp - {0}.start_time), 0) FROM {0} "
+                               "WHERE {0}.project_id = {1}.id AND {0}.end_time IS NOT NULL".format(meeting, project),
+        })
+
+    def related_counts(self, obj):
+        return [(Member, obj.members_count), (Hub, obj.hubs_count), (Meeting, obj.meetings_count)]
+
+    def get_inline_instances(self, request, obj=None):
+        inlines = super(ProjectAdmin, self).get_inline_instances(request, obj)
+        if obj is None:
+            return inlines
+        too_many = [model for model, count in self.related_counts(obj) if count > self.inline_limit]
+        return [inline for inline in inlines if inline.model not in too_many]
+
+    def related_lists(self, obj):
+        if obj.pk is None:
+            return ""
+        return format_html_join(", ", '<a href="{}?project__id__exact={}">{} {}</a>', (
+            (reverse("admin:openbadge_{}_changelist".format(model._meta.model_name)), obj.pk, count,
+             model._meta.verbose_name_plural)
+            for model, count in self.related_counts(obj)))
+
+    related_lists.short_description = 'Members, hubs and meetings'
 
     # def members_list(self, inst):
     #     return ", ".join([member.name for member in inst.members.all()])
     # #members_list.admin_order_field = 'members_list'
 
-    @staticmethod
-    def number_of_members(inst):
-        return len(inst.members.all())
+    def number_of_members(self, inst):
+        return inst.members_count
 
-    @staticmethod
-    def number_of_meetings(inst):
-        if inst.meetings.all():
-            return len([meeting.uuid for meeting in inst.meetings.all()])
-        return "NONE"
+    number_of_members.admin_order_field = 'members_count'
 
-    # number_of_meetings.admin_order_field = 'number_of_meetings' #Allows column order sorting
-    # number_of_meetings.short_description = 'Number of Meetings' #Renames column head
+    def number_of_meetings(self, inst):
+        return inst.meetings_count or "NONE"
 
-    @staticmethod
-    def total_meeting_time(inst):
-        if inst.meetings.all():
-            def time_diff(x):
-                if x.last_update_timestamp and x.start_time:
-                    return (x.last_update_timestamp - x.start_time)
-                return 0
+    number_of_meetings.admin_order_field = 'meetings_count'  # Allows column order sorting
+    # number_of_meetings.short_description = 'Number of Meetings'  # Renames column head
 
-            return timedelta(seconds = int(sum(
-                [time_diff(meeting) for meeting in inst.meetings.all() if meeting.end_time])))
+    def total_meeting_time(self, inst):
+        if inst.meetings_count:
+            return timedelta(seconds=int(inst.meeting_seconds))
         return "NONE"
 
+    total_meeting_time.admin_order_field = 'meeting_seconds'
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for big tables. COUNT(*) of a whole Postgres table reads all of it, so an unfiltered list
+    is counted from the planner's row estimate once that says there are more than exact_count_limit rows.
+    Filtered lists (which should be filtered on indexed columns) and other databases are counted exactly.
+    """
+    exact_count_limit = 10000
+
+    def _get_count(self):
+        if self._count is None:
+            self._count = self.estimated_count()
+            if self._count is None:
+                self._count = super(EstimatedCountPaginator, self)._get_count()
+        return self._count
+
+    count = property(_get_count)
+
+    def estimated_count(self):
+        queryset = self.object_list
+        if connection.vendor != "postgresql" or not hasattr(queryset, "query") or queryset.query.where:
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples FROM pg_class WHERE relname = %s", [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        if row is None or row[0] < self.exact_count_limit:
+            return None
+        return int(row[0])
+
+
+class StartedListFilter(admin.SimpleListFilter):
+    """meetings by start_time, which is a timestamp so date_hierarchy can't be used"""
+    title = _('started')
+    parameter_name = 'started'
+    periods = (('1', _('Past 24 hours'), 1), ('7', _('Past 7 days'), 7), ('30', _('Past 30 days'), 30))
+
+    def lookups(self, request, model_admin):
+        return [(value, title) for value, title, _days in self.periods]
+
+    def queryset(self, request, queryset):
+        for value, _title, days in self.periods:
+            if self.value() == value:
+                return queryset.filter(start_time__gte=int(time()) - days * 24 * 60 * 60)
+        return queryset
+
 
 @register(Meeting)
 class MeetingAdmin(admin.ModelAdmin, GetLocalTimeMixin):
@@ -149,29 +238,68 @@ class MeetingAdmin(admin.ModelAdmin, GetLocalTimeMixin):
                     'last_update', 'last_update_index',
                     'duration',
                     'is_complete')
+    list_select_related = ('project', 'hub')
+    list_filter = (StartedListFilter, 'is_complete', 'project', 'hub')
+    paginator = EstimatedCountPaginator
+    # the "N total" next to the search box would count the whole table again
+    show_full_result_count = False
     actions_on_top = True
 
+    def get_queryset(self, request):
+        return super(MeetingAdmin, self).get_queryset(request).annotate(duration_seconds=ExpressionWrapper(
+            F('last_update_timestamp') - F('start_time'),
+            output_field=DecimalField(max_digits=20, decimal_places=3)))
 
     def last_update(self, inst):
         if inst.last_update_timestamp:
             return self.get_local_time(inst.last_update_timestamp)
 
+    last_update.admin_order_field = 'last_update_timestamp'
+
     def start(self, inst):
         if inst.start_time:
             return self.get_local_time(inst.start_time)
 
+    start.admin_order_field = 'start_time'
+
     def end(self, inst):
         if inst.end_time:
             return self.get_local_time(inst.end_time)
 
+    end.admin_order_field = 'end_time'
 
     def project_name(self, inst):
         return inst.project.name
 
-    project_name.admin_order_field = 'project_name'
+    project_name.admin_order_field = 'project__name'
     project_name.short_description = 'Project'
 
     def duration(self, inst):
-        return timedelta(seconds=int(inst.last_update_timestamp - inst.start_time))
+        # null when either timestamp is
+        if inst.duration_seconds is not None:
+            return timedelta(seconds=int(inst.duration_seconds))
+
+    duration.admin_order_field = 'duration_seconds'
 
-    duration.admin_order_field = 'duration'
+
+@register(Member)
+class MemberAdmin(admin.ModelAdmin, MemberStatusMixin):
+    readonly_fields = ("key",)
+    list_display = ('name', 'email', 'badge', 'key', 'project', 'last_seen', 'voltage', 'last_audio')
+    list_select_related = ('project',)
+    list_filter = ('project',)
+    search_fields = ('name', 'email', 'badge', 'key')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions_on_top = True
+
+
+@register(Hub)
+class HubAdmin(admin.ModelAdmin, HubStatusMixin):
+    readonly_fields = ("key",)
+    list_display = ('name', 'uuid', 'key', 'project', 'god', 'last_seen', 'last_hub_time',
+                    'time_difference_in_seconds', 'ip_address')
+    list_select_related = ('project',)
+    list_filter = ('project', 'god')
+    search_fields = ('name', 'uuid', 'key')
+    actions_on_top = True
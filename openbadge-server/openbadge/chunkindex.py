@@ -0,0 +1,177 @@
+"""
+A sparse time index kept next to a chunk log (a meeting log or a DataFile segment) as <path>.idx, so
+a time-range read can seek close to the first chunk it needs instead of parsing the log from the start.
+
+Layout, all little-endian:
+
+    header   magic "OBIX", version, flags, chunks counted, log bytes covered, highest log_timestamp
+    records  byte offset, log_timestamp, log_index of every settings.CHUNK_INDEX_INTERVAL-th chunk
+
+The index is appended to as chunks are appended to the log and the header rewritten once per append.
+If the header doesn't match the log's size (the log was appended to without updating the index, or a
+write died half way), the index is rebuilt from the log the next time it is opened for appending.
+Readers can still use the part of a stale index that covers the start of the log.
+
+If chunks were ever appended out of log_timestamp order the index is flagged unordered and
+readers go back to scanning the whole log.
+"""
+import os
+import struct
+
+from django.conf import settings
+
+MAGIC = b"OBIX"
+VERSION = 1
+
+UNORDERED = 0x01
+
+HEADER = struct.Struct("<4sBBQQd")
+RECORD = struct.Struct("<Qdq")
+
+NO_LOG_INDEX = -(2 ** 63)
+"""stored in place of a missing log_index"""
+
+
+def index_path(path):
+    """where the index for the log at path is kept"""
+    return path + ".idx"
+
+
+class ChunkIndex(object):
+    """
+    Appends to a log's index. open() before appending to the log, add() each chunk appended,
+    then close() with the log's new size. `scan` is a callable yielding (offset, log_timestamp, log_index)
+    for every chunk in the log, used to rebuild the index when it is missing or stale.
+    """
+
+    def __init__(self, path, scan, interval=None):
+        self.path = path
+        self.scan = scan
+        self.interval = interval or settings.CHUNK_INDEX_INTERVAL
+        self.flags = 0
+        self.chunk_count = 0
+        self.max_log_timestamp = float("-inf")
+        self._file = None
+
+    def open(self):
+        log_size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        idx = index_path(self.path)
+        header = None
+        if os.path.exists(idx):
+            self._file = open(idx, "r+b")
+            header = _read_header(self._file)
+        else:
+            self._file = open(idx, "w+b")
+
+        if header is not None and header[3] == log_size:
+            self.flags, self.chunk_count, self.max_log_timestamp = header[0], header[1], header[2]
+            self._file.seek(0, 2)
+            return self
+
+        # missing or stale, start over
+        self._file.seek(0)
+        self._file.truncate()
+        self._file.write(HEADER.pack(MAGIC, VERSION, 0, 0, 0, 0.0))
+        self.flags = 0
+        self.chunk_count = 0
+        self.max_log_timestamp = float("-inf")
+        if log_size:
+            for offset, log_timestamp, log_index in self.scan(self.path):
+                self.add(offset, log_timestamp, log_index)
+            self._write_header(log_size)
+        return self
+
+    def add(self, offset, log_timestamp, log_index):
+        """records a chunk written to the log at byte `offset`"""
+        if log_timestamp < self.max_log_timestamp:
+            self.flags |= UNORDERED
+        else:
+            self.max_log_timestamp = log_timestamp
+        if self.chunk_count % self.interval == 0:
+            self._file.write(RECORD.pack(offset, log_timestamp, NO_LOG_INDEX if log_index is None else log_index))
+        self.chunk_count += 1
+
+    def close(self, log_size=None):
+        """
+        Writes the header for a log that is now log_size bytes. Without log_size the header is left alone,
+        so the index is rebuilt next time (use after a failed append).
+        """
+        if log_size is not None:
+            self._write_header(log_size)
+        self._file.close()
+        self._file = None
+
+    def _write_header(self, log_size):
+        end = self._file.tell()
+        self._file.seek(0)
+        self._file.write(HEADER.pack(MAGIC, VERSION, self.flags, self.chunk_count, log_size,
+                                     max(self.max_log_timestamp, 0.0)))
+        self._file.seek(end)
+
+
+def _read_header(f):
+    """(flags, chunk count, highest log_timestamp, log bytes covered) or None if f isn't an index"""
+    f.seek(0)
+    raw = f.read(HEADER.size)
+    if len(raw) < HEADER.size:
+        return None
+    magic, version, flags, chunk_count, log_size, max_log_timestamp = HEADER.unpack(raw)
+    if magic != MAGIC or version > VERSION:
+        return None
+    return flags, chunk_count, max_log_timestamp, log_size
+
+
+def build(path, scan):
+    """(re)builds the index for the log at path, e.g. after the whole log was replaced"""
+    idx = index_path(path)
+    if os.path.exists(idx):
+        os.remove(idx)
+    ChunkIndex(path, scan).open().close()
+
+
+def remove(path):
+    """removes the index for the log at path, if there is one"""
+    idx = index_path(path)
+    if os.path.exists(idx):
+        os.remove(idx)
+
+
+def lookup(path, start):
+    """
+    Returns (offset, ordered) for a read of the log at path starting at log_timestamp `start`:
+    every chunk with a log_timestamp >= start is at or after byte `offset` (None to read from the beginning),
+    and if `ordered` the chunks are known to be in log_timestamp order, so a read can stop at the first
+    chunk past the end of its range.
+    """
+    idx = index_path(path)
+    if not os.path.exists(idx):
+        return None, False
+
+    with open(idx, "rb") as f:
+        header = _read_header(f)
+        if header is None or header[0] & UNORDERED:
+            return None, False
+        log_size = os.path.getsize(path)
+        if header[3] > log_size:
+            # the log was replaced without rebuilding the index
+            return None, False
+        ordered = header[3] == log_size
+        if start is None:
+            return None, ordered
+
+        # last record before start
+        f.seek(0, 2)
+        lo, hi = 0, (f.tell() - HEADER.size) // RECORD.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            f.seek(HEADER.size + mid * RECORD.size)
+            offset, log_timestamp, _ = RECORD.unpack(f.read(RECORD.size))
+            if log_timestamp < start:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == 0:
+            return None, ordered
+        f.seek(HEADER.size + (lo - 1) * RECORD.size)
+        offset, _, _ = RECORD.unpack(f.read(RECORD.size))
+        return offset, ordered
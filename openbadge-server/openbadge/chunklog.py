@@ -0,0 +1,127 @@
+"""
+Helpers for the newline-delimited chunk logs written by the hubs.
+
+Each line of a meeting log or a DataFile is a single JSON object ("chunk"). Most of the
+time the server only needs a chunk's `log_timestamp` and `log_index`, so these helpers
+pull those two fields out of the raw bytes instead of decoding the whole object.
+"""
+import mmap
+import os
+import re
+
+import simplejson
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/jsonl", "application/x-jsonlines")
+"""Content types that select the streaming, line-per-chunk upload mode"""
+
+LOG_TIMESTAMP_RE = re.compile(br'"log_timestamp"\s*:\s*(-?[0-9][0-9.eE+-]*)')
+LOG_INDEX_RE = re.compile(br'"log_index"\s*:\s*(-?[0-9]+)')
+
+
+class ChunkError(ValueError):
+    """Raised when a raw line does not look like a chunk"""
+    pass
+
+
+def scan_chunk(line):
+    """
+    Returns (log_timestamp, log_index) for a raw chunk line without decoding it.
+    log_index is None if the chunk does not carry one.
+
+    Only checks that the line is brace-delimited and carries a log_timestamp,
+    the rest of the object is stored exactly as the hub sent it.
+    """
+    stripped = line.strip()
+    if not stripped.startswith(b"{") or not stripped.endswith(b"}"):
+        raise ChunkError("chunk is not a JSON object")
+
+    match = LOG_TIMESTAMP_RE.search(stripped)
+    if match is None:
+        raise ChunkError("chunk has no log_timestamp")
+    try:
+        log_timestamp = float(match.group(1))
+    except ValueError:
+        raise ChunkError("chunk has a malformed log_timestamp")
+
+    match = LOG_INDEX_RE.search(stripped)
+    log_index = int(match.group(1)) if match is not None else None
+
+    return log_timestamp, log_index
+
+
+def iter_lines(stream, max_line_size):
+    """
+    Yields the non-blank lines of a file-like object one at a time, so memory use is bounded
+    by max_line_size no matter how large the stream is.
+    Raises ChunkError if a single line is longer than max_line_size.
+    """
+    while True:
+        line = stream.readline(max_line_size + 1)
+        if not line:
+            return
+        if len(line) > max_line_size:
+            raise ChunkError("chunk is larger than {} bytes".format(max_line_size))
+        if line.strip():
+            yield line
+
+
+def is_ndjson(content_type):
+    """whether a request's Content-Type selects the streaming upload mode"""
+    return (content_type or "").split(";")[0].strip().lower() in NDJSON_CONTENT_TYPES
+
+
+class LogReader(object):
+    """
+    Reads a chunk log through a read-only mmap, so the file is paged in by the OS as it is walked
+    instead of being read into memory. Lines are sliced out of the map one at a time and chunks
+    decoded lazily, so only the chunk being looked at is ever held in memory.
+
+    Use as a context manager; the generators below must be consumed before it exits.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._map = None
+
+    def __enter__(self):
+        self._file = open(self.path, "rb")
+        if os.fstat(self._file.fileno()).st_size:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+        self._file = None
+
+    def iter_lines(self, offset=0):
+        """Yields (offset, line) for each line from byte offset on, line including its newline"""
+        log = self._map
+        if log is None:
+            return
+        size = len(log)
+        while offset < size:
+            end = log.find(b"\n", offset)
+            end = size if end == -1 else end + 1
+            yield offset, log[offset:end]
+            offset = end
+
+    def iter_chunks(self, offset=0, skip_first_line=False):
+        """
+        Yields the decoded chunks from byte offset on. Lines that aren't valid JSON are skipped,
+        a broken line shouldn't hide the rest of the log.
+        skip_first_line leaves out the meeting header line when reading from the start of a meeting log.
+        """
+        lines = self.iter_lines(offset)
+        if skip_first_line and offset == 0:
+            next(lines, None)
+        for _, line in lines:
+            if not line.strip():
+                continue
+            try:
+                yield simplejson.loads(line)
+            except ValueError:
+                pass
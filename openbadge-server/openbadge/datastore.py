@@ -0,0 +1,267 @@
+"""
+Reading and writing the chunk files behind a DataFile, in whichever storage format it uses.
+
+A DataFile's chunks live in time-bounded segment files (models.DataFileSegment), plus the single
+unsegmented file at DataFile.filepath that DataFiles created before segmenting was added still have.
+"""
+import os
+import time
+
+import simplejson
+
+from . import chunkindex, packed
+from .chunklog import ChunkError, LogReader, scan_chunk
+
+FORMAT_JSON = "json"
+"""One JSON object per line, exactly as the hubs send it"""
+
+FORMAT_PACKED = "packed"
+"""The binary format in packed.py"""
+
+FORMAT_EXTENSIONS = {
+    FORMAT_JSON: ".txt",
+    FORMAT_PACKED: ".obpk",
+}
+
+
+class DataFileWriter(object):
+    """
+    Appends chunks to a DataFile's file in its storage format.
+    Use as a context manager; keeps count of what was written so the caller can update the DataFile.
+    The file's chunkindex is kept up to date as chunks are written.
+    """
+
+    def __init__(self, path, storage_format, data_type):
+        self.path = path
+        self.storage_format = storage_format
+        self.data_type = data_type
+        self.chunks_written = 0
+        self.last_log_timestamp = None
+        self.last_log_index = None
+        self._file = None
+        self._index = None
+        self._offset = None
+
+    def __enter__(self):
+        self._index = open_index(self.path, self.storage_format)
+        self._file = open(self.path, "ab")
+        self._file.seek(0, 2)
+        if self.storage_format == FORMAT_PACKED and self._file.tell() == 0:
+            self._file.write(packed.file_header(self.data_type))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._file.close()
+        self._file = None
+        self._index.close(os.path.getsize(self.path))
+        self._index = None
+
+    def _written(self, log_timestamp, log_index):
+        # chunks without a numeric log_timestamp are left out of the index, as rebuilding it would
+        if log_timestamp is not None:
+            self._index.add(self._offset, log_timestamp, log_index)
+            self.last_log_timestamp = log_timestamp
+        self.chunks_written += 1
+        self.last_log_index = log_index
+
+    def write_chunk(self, chunk):
+        """appends a decoded chunk"""
+        self._offset = self._file.tell()
+        if self.storage_format == FORMAT_PACKED:
+            self._file.write(packed.encode_chunk(chunk))
+        else:
+            self._file.write(simplejson.dumps(chunk) + "\n")
+        self._written(*packed.chunk_position(chunk))
+
+    def write_line(self, line, log_timestamp, log_index):
+        """
+        appends a raw chunk line (as checked by chunklog.scan_chunk). JSON files get the line as-is,
+        packed files have to decode it first.
+        """
+        self._offset = self._file.tell()
+        if self.storage_format == FORMAT_PACKED:
+            self._file.write(packed.encode_chunk(simplejson.loads(line)))
+        else:
+            if not line.endswith(b"\n"):
+                line += b"\n"
+            self._file.write(line)
+        self._written(log_timestamp, log_index)
+
+    def size(self):
+        """current size of the file in bytes"""
+        return self._file.tell()
+
+
+class SegmentedWriter(object):
+    """
+    Appends chunks to a DataFile's segments. Chunks go to the DataFile's latest segment until one
+    falls in a later `period` (seconds, UTC aligned, 0 for no time limit) than the segment was
+    started for, or the segment has grown to `max_size` bytes; then a new segment is started.
+    Late chunks are added to the current segment rather than reopening an old one.
+
+    Same interface as DataFileWriter. Segment rows are saved on exit, including when writing
+    stopped part way through, since what was written is on disk either way; the counters are
+    merged with those of other uploads to the same segment (DataFileSegment.save_added).
+    """
+
+    def __init__(self, datafile, period, max_size):
+        self.datafile = datafile
+        self.period = period
+        self.max_size = max_size
+        self.chunks_written = 0
+        self.last_log_timestamp = None
+        self.last_log_index = None
+        self.segment = None
+        self._writer = None
+        self._touched = []
+
+    def __enter__(self):
+        if self.datafile.pk is None:
+            self.datafile.save()
+        self.segment = self.datafile.segments.order_by("-id").first()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._close_segment()
+        # in id order, so concurrent uploads lock the rows they share in the same order
+        for segment, chunk_count in sorted(self._touched, key=lambda touched: touched[0].pk):
+            segment.save_added(segment.chunk_count - chunk_count)
+        self._touched = []
+
+    def _close_segment(self):
+        if self._writer is not None:
+            self._writer.__exit__(None, None, None)
+            self._writer = None
+
+    def _period_start(self, log_timestamp):
+        if log_timestamp is None:
+            # no usable log_timestamp (legacy chunks), it stays with the current segment
+            return self.segment.period_start if self.segment is not None else 0
+        if not self.period:
+            return 0
+        return int(log_timestamp // self.period * self.period)
+
+    def _new_segment(self, period_start):
+        folder = self.datafile.segment_folder()
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        sequence = self.datafile.segments.filter(period_start=period_start).count()
+        filename = "{}-{:03d}{}".format(time.strftime("%Y%m%dT%H%M%SZ", time.gmtime(period_start)), sequence,
+                                        FORMAT_EXTENSIONS[self.datafile.storage_format])
+        return self.datafile.segments.create(filepath=os.path.join(folder, filename),
+                                             storage_format=self.datafile.storage_format,
+                                             period_start=period_start)
+
+    def _segment_writer(self, log_timestamp):
+        """the writer for the segment a chunk with this log_timestamp goes to"""
+        period_start = self._period_start(log_timestamp)
+        segment = self.segment
+        if segment is None or period_start > segment.period_start or segment.size >= self.max_size:
+            self._close_segment()
+            segment = self.segment = self._new_segment(period_start)
+
+        if self._writer is None:
+            self._writer = DataFileWriter(segment.filepath, segment.storage_format, self.datafile.data_type)
+            self._writer.__enter__()
+            if segment not in [touched for touched, _ in self._touched]:
+                # with its chunk_count before this upload added to it
+                self._touched.append((segment, segment.chunk_count))
+        return self._writer
+
+    def _written(self, log_timestamp, log_index):
+        self.segment.add_chunk(log_timestamp, log_index, self._writer.size())
+        self.chunks_written += 1
+        if log_timestamp is not None:
+            self.last_log_timestamp = log_timestamp
+        self.last_log_index = log_index
+
+    def write_chunk(self, chunk):
+        """appends a decoded chunk"""
+        log_timestamp, log_index = packed.chunk_position(chunk)
+        self._segment_writer(log_timestamp).write_chunk(chunk)
+        self._written(log_timestamp, log_index)
+
+    def write_line(self, line, log_timestamp, log_index):
+        """appends a raw chunk line (as checked by chunklog.scan_chunk), see DataFileWriter.write_line"""
+        self._segment_writer(log_timestamp).write_line(line, log_timestamp, log_index)
+        self._written(log_timestamp, log_index)
+
+
+def iter_positions(path, storage_format):
+    """Yields (byte offset, log_timestamp, log_index) for each chunk in a file, for building its chunkindex"""
+    if storage_format == FORMAT_PACKED:
+        with open(path, "rb") as f:
+            packed.read_header(f)
+            while True:
+                offset = f.tell()
+                record = packed.read_record(f)
+                if record is None:
+                    return
+                log_timestamp, log_index = packed.record_position(record)
+                yield offset, log_timestamp, log_index
+    else:
+        with LogReader(path) as log:
+            for offset, line in log.iter_lines():
+                try:
+                    log_timestamp, log_index = scan_chunk(line)
+                except ChunkError:
+                    continue
+                yield offset, log_timestamp, log_index
+
+
+def open_index(path, storage_format):
+    """opens the chunkindex of a file for appending, rebuilding it first if it is missing or out of date"""
+    return chunkindex.ChunkIndex(path, lambda p: iter_positions(p, storage_format)).open()
+
+
+def build_index(path, storage_format):
+    """rebuilds the chunkindex of a file from scratch, for when the whole file has been replaced"""
+    chunkindex.build(path, lambda p: iter_positions(p, storage_format))
+
+
+def iter_chunks(path, storage_format, start=None, end=None, skip_first_line=False):
+    """
+    Yields the chunk dicts stored in a file one at a time, whatever its format.
+    start and end optionally limit the chunks to a log_timestamp range; the file's chunkindex is used
+    to skip to the start of the range, and to stop at its end when the file is known to be in order.
+    skip_first_line leaves out the meeting header line at the start of a meeting log.
+    """
+    if not os.path.exists(path):
+        return
+
+    offset, ordered = chunkindex.lookup(path, start) if start is not None or end is not None else (None, False)
+
+    if storage_format == FORMAT_PACKED:
+        with open(path, "rb") as f:
+            chunks = packed.iter_chunks(f)
+            if offset is not None:
+                packed.read_header(f)
+                f.seek(offset)
+                chunks = _iter_records(f)
+            for chunk in _in_range(chunks, start, end, ordered):
+                yield chunk
+    else:
+        with LogReader(path) as log:
+            for chunk in _in_range(log.iter_chunks(offset or 0, skip_first_line), start, end, ordered):
+                yield chunk
+
+
+def _in_range(chunks, start, end, ordered):
+    for chunk in chunks:
+        if start is not None or end is not None:
+            log_timestamp = chunk.get("log_timestamp")
+            if log_timestamp is None or (start is not None and log_timestamp < start):
+                continue
+            if end is not None and log_timestamp > end:
+                if ordered:
+                    return
+                continue
+        yield chunk
+
+
+def _iter_records(f):
+    while True:
+        record = packed.read_record(f)
+        if record is None:
+            return
+        yield packed.decode_record(record)
@@ -1,10 +1,10 @@
 from functools import wraps
-import time
 
 from django.utils import timezone
 from django.conf import settings
 from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, HttpResponseNotFound
-from .models import Hub
+from . import heartbeat
+from .hubcache import get_request_hub
 
 
 class HttpResponseUnauthorized(HttpResponse):
@@ -25,11 +25,8 @@ def is_own_project(f):
         if god_key == settings.GOD_KEY:
             return f(request, project_key, *args, **kwargs)
 
-
-        hub_uuid = request.META.get("HTTP_X_HUB_UUID")
-        try:
-            hub = Hub.objects.prefetch_related("project").get(uuid=hub_uuid)
-        except Hub.DoesNotExist:
+        hub = get_request_hub(request)
+        if hub is None:
             return HttpResponseNotFound()
 
         hub_project_key = hub.project.key
@@ -44,25 +41,16 @@ def is_own_project(f):
 def require_hub_uuid(f):
     """
     Requires a hub to pass a valid hub uuid in the request header
-    Updates the hub's last_seen_ts field
-    Stores the hub_time if provided
+    Records a heartbeat for the hub (last_seen_ts, and hub_time if provided), see heartbeat.py
     """
 
     @wraps(f)
     def wrap(request, *args, **kwargs):
-        hub_uuid = request.META.get("HTTP_X_HUB_UUID")
-        try:
-            hub = Hub.objects.get(uuid=hub_uuid)
-        except Hub.DoesNotExist:
+        hub = get_request_hub(request)
+        if hub is None:
             return HttpResponseNotFound()
 
-        hub.last_seen_ts = int(time.time())
-
-        hub_time = request.META.get("HTTP_X_HUB_TIME")
-        if hub_time is not None:
-            hub.last_hub_time_ts = hub_time
-
-        hub.save()
+        heartbeat.record(hub.uuid, hub_time=request.META.get("HTTP_X_HUB_TIME"))
         return f(request, *args, **kwargs)
 
     return wrap
@@ -0,0 +1,112 @@
+"""
+Coalesced hub heartbeats.
+
+Every hub request used to save the whole Hub row just to move last_seen_ts along. Instead,
+record() keeps the latest heartbeat of each hub in a process-local buffer, and a background
+thread writes the buffer out every settings.HEARTBEAT_FLUSH_INTERVAL seconds as a single
+UPDATE, so Hub.last_seen_ts lags by at most that long. With an interval of 0 heartbeats are
+written straight away (tests, management commands).
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, DecimalField, F, GenericIPAddressField, Value, When
+
+from .models import Hub
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_pending = {}
+_flusher = None
+_flusher_pid = None
+
+
+def record(hub_uuid, hub_time=None, ip_address=None):
+    """notes that the hub was seen now, along with its clock time and address if known"""
+    try:
+        hub_time = Decimal(hub_time) if hub_time is not None else None
+    except InvalidOperation:
+        hub_time = None
+    seen = Decimal(int(time.time()))
+
+    with _lock:
+        previous = _pending.get(hub_uuid)
+        if previous is not None:
+            hub_time = hub_time if hub_time is not None else previous[1]
+            ip_address = ip_address if ip_address is not None else previous[2]
+        _pending[hub_uuid] = (seen, hub_time, ip_address)
+
+    if settings.HEARTBEAT_FLUSH_INTERVAL <= 0:
+        flush()
+    else:
+        _ensure_flusher()
+
+
+def flush():
+    """writes out the buffered heartbeats as one UPDATE. Returns the number of hubs updated"""
+    global _pending
+    with _lock:
+        pending, _pending = _pending, {}
+    if not pending:
+        return 0
+
+    seen_whens = []
+    hub_time_whens = []
+    ip_whens = []
+    for hub_uuid, (seen, hub_time, ip_address) in pending.items():
+        # last_seen_ts never goes backwards, another process may have flushed a later heartbeat
+        seen_whens.append(When(uuid=hub_uuid, last_seen_ts__lt=seen, then=Value(seen)))
+        if hub_time is not None:
+            hub_time_whens.append(When(uuid=hub_uuid, then=Value(hub_time)))
+        if ip_address is not None:
+            ip_whens.append(When(uuid=hub_uuid, then=Value(ip_address)))
+
+    decimal = DecimalField(max_digits=20, decimal_places=3)
+    updates = {"last_seen_ts": Case(*seen_whens, default=F("last_seen_ts"), output_field=decimal)}
+    if hub_time_whens:
+        updates["last_hub_time_ts"] = Case(*hub_time_whens, default=F("last_hub_time_ts"), output_field=decimal)
+    if ip_whens:
+        updates["ip_address"] = Case(*ip_whens, default=F("ip_address"), output_field=GenericIPAddressField())
+
+    return Hub.objects.filter(uuid__in=list(pending.keys())).update(**updates)
+
+
+def _flush_forever():
+    while True:
+        time.sleep(settings.HEARTBEAT_FLUSH_INTERVAL)
+        try:
+            flush()
+        except Exception:
+            logger.exception("Could not write hub heartbeats")
+        finally:
+            # this thread's connection would otherwise stay open between flushes
+            connection.close()
+
+
+def _ensure_flusher():
+    """starts the flush thread, once per process (worker processes are forked after import)"""
+    global _flusher, _flusher_pid
+    if _flusher is not None and _flusher_pid == os.getpid():
+        return
+    with _lock:
+        if _flusher is not None and _flusher_pid == os.getpid():
+            return
+        _flusher = threading.Thread(target=_flush_forever, name="heartbeat-flush")
+        _flusher.daemon = True
+        _flusher.start()
+        _flusher_pid = os.getpid()
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception:
+        logger.exception("Could not write hub heartbeats at exit")
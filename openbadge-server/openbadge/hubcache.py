@@ -0,0 +1,88 @@
+"""
+Resolving the hub behind a request's X-HUB-UUID header.
+
+The hub (with its project) is looked up once per request and kept on the request as `request.hub`,
+so the auth decorators, permissions and the view itself share one lookup. Across requests hubs are
+kept in the Django cache named by settings.HUB_CACHE_ALIAS for settings.HUB_CACHE_TIMEOUT seconds.
+Entries are dropped when a Hub is saved or deleted (see the receivers in models.py), and again once
+the transaction commits, as a request reading the hub before that puts the old one back.
+
+That only reaches every process when the cache is shared: production points the alias at Redis. With
+the process-local default (development and tests) other processes keep a moved or renamed hub until
+their entry times out.
+
+Cached hubs are for identifying the caller, treat them as read-only.
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import request_finished
+from django.db import transaction
+from django.dispatch import receiver
+
+_MISSING = object()
+
+# hubs changed inside the current request's transaction, without transaction.on_commit (Django < 1.9)
+_uncommitted = threading.local()
+
+
+def cache_key(hub_uuid):
+    return "openbadge:hub:{}".format(hub_uuid)
+
+
+def _cache():
+    return caches[settings.HUB_CACHE_ALIAS]
+
+
+def get_hub(hub_uuid):
+    """The Hub with this uuid, its project already loaded, or None if there isn't one"""
+    from .models import Hub
+
+    if not hub_uuid:
+        return None
+
+    hub = _cache().get(cache_key(hub_uuid))
+    if hub is None:
+        try:
+            hub = Hub.objects.select_related("project").get(uuid=hub_uuid)
+        except Hub.DoesNotExist:
+            return None
+        _cache().set(cache_key(hub_uuid), hub, settings.HUB_CACHE_TIMEOUT)
+    return hub
+
+
+def http_request(request):
+    """the HttpRequest under any rest_framework Requests wrapping it, to keep per-request state on"""
+    while hasattr(request, "_request"):
+        request = request._request
+    return request
+
+
+def get_request_hub(request):
+    """The hub named by the request's X-HUB-UUID header (or None), looked up at most once per request"""
+    request = http_request(request)
+    hub = getattr(request, "hub", _MISSING)
+    if hub is _MISSING:
+        hub = request.hub = get_hub(request.META.get("HTTP_X_HUB_UUID"))
+    return hub
+
+
+def forget(hub_uuid):
+    """drops a hub from the cache, after it changed"""
+    _cache().delete(cache_key(hub_uuid))
+    if hasattr(transaction, "on_commit"):
+        transaction.on_commit(lambda: _cache().delete(cache_key(hub_uuid)))
+    elif transaction.get_connection().in_atomic_block:
+        # ATOMIC_REQUESTS commits when the view returns, before the request finishes
+        if not hasattr(_uncommitted, "uuids"):
+            _uncommitted.uuids = set()
+        _uncommitted.uuids.add(hub_uuid)
+
+
+@receiver(request_finished)
+def forget_uncommitted(**kwargs):
+    uuids = getattr(_uncommitted, "uuids", None)
+    if uuids:
+        _cache().delete_many([cache_key(hub_uuid) for hub_uuid in uuids])
+        uuids.clear()
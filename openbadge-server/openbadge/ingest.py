@@ -0,0 +1,417 @@
+"""
+Appending hub uploads to meeting logs and DataFiles, either straight from the request or
+write-behind through a durable queue.
+
+When settings.INGEST_QUEUE_URL is set, POST /:project/meetings and POST /:project/datafiles only
+validate the request and push the chunks onto the queue; `manage.py drain_ingest` pops them in
+batches and does the file appends and Meeting/DataFile updates. Two queue backends exist:
+
+* redis://host:port/db  - a Redis list (the `redis` service in docker-compose.yml)
+* file:///some/dir      - one file per item in a directory, for tests and single-machine setups
+"""
+import itertools
+import logging
+import os
+import time
+from collections import OrderedDict
+
+import simplejson
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+
+from . import datastore
+from .chunklog import scan_chunk
+from .models import DataFile, Hub, Meeting, Project
+
+logger = logging.getLogger(__name__)
+
+
+##########################################################################################
+# Appending chunks
+##########################################################################################
+
+def append_meeting_chunks(meeting, chunks):
+    """
+    Appends raw chunk strings (as sent to POST /:project/meetings) to a meeting's log and
+    advances last_update_index/last_update_timestamp.
+    Returns False without writing anything if the first chunk doesn't follow on from the
+    meeting's last_update_index.
+    """
+    meeting.is_complete = False  # Make sure we always close a meeting with a PUT.
+    update_index = None
+    update_time = None
+
+    if chunks:
+        post_start_serial = simplejson.loads(chunks[0])['log_index']
+        if post_start_serial != meeting.last_update_index + 1:
+            meeting.save()
+            return False
+
+    log = meeting.log_file.file.name
+    index = datastore.open_index(log, datastore.FORMAT_JSON)
+    with open(log, 'ab') as f:
+        f.seek(0, 2)
+        for chunk in chunks:
+            chunk_obj = simplejson.loads(chunk)
+            update_time = chunk_obj['log_timestamp']
+            update_index = chunk_obj['log_index']
+            index.add(f.tell(), update_time, update_index)
+            f.write(chunk)
+            if meeting.header is not None and not meeting.header_complete:
+                meeting.update_header([chunk_obj])
+    index.close(os.path.getsize(log))
+
+    if update_time and update_index:
+        meeting.last_update_timestamp = update_time
+        meeting.last_update_index = update_index
+
+    meeting.save()
+    return True
+
+
+def decode_meeting_chunks(raw):
+    """
+    The `chunks` field of POST /:project/meetings (a JSON list of JSON chunk strings) as
+    [(chunk string, decoded chunk)]. Raises ValueError if it isn't one, or a chunk lacks its log_index or log_timestamp
+    """
+    chunks = simplejson.loads(raw) if isinstance(raw, basestring) else raw
+    if not isinstance(chunks, list):
+        raise ValueError("chunks is not a list")
+    decoded = []
+    for chunk in chunks:
+        if not isinstance(chunk, basestring):
+            raise ValueError("chunk is not a string")
+        chunk_obj = simplejson.loads(chunk)
+        if not isinstance(chunk_obj, dict) or not isinstance(chunk_obj.get("log_index"), (int, long)) \
+                or "log_timestamp" not in chunk_obj:
+            raise ValueError("chunk has no log_index or log_timestamp")
+        decoded.append((chunk, chunk_obj))
+    return decoded
+
+
+def decode_datafile_chunks(raw):
+    """
+    The `chunks` field of POST /:project/datafiles (a list of chunks, or the same as JSON) decoded.
+    Raises ValueError if it isn't one, or a chunk has no numeric log_timestamp
+    """
+    chunks = simplejson.loads(raw) if isinstance(raw, basestring) else raw
+    if not isinstance(chunks, list):
+        raise ValueError("chunks is not a list")
+    for chunk in chunks:
+        if not isinstance(chunk, dict) or isinstance(chunk.get("log_timestamp"), bool) \
+                or not isinstance(chunk.get("log_timestamp"), (int, long, float)):
+            raise ValueError("chunk has no log_timestamp")
+    return chunks
+
+
+def get_or_init_datafile(hub, project_key, data_type):
+    """
+    Returns the DataFile a hub's `data_type` chunks are appended to, creating (but not saving)
+    it and its folder if this is the first upload. Returns None if the file belongs to another hub.
+    """
+    datafile_uuid = hub.uuid + "_" + data_type
+
+    try:
+        datafile = DataFile.objects.get(uuid=datafile_uuid)
+        if datafile.hub.uuid != hub.uuid:
+            return None
+    except DataFile.DoesNotExist:
+        datafile = DataFile()
+        datafile.uuid = datafile_uuid
+        datafile.data_type = data_type
+        datafile.hub = hub
+        datafile.project = Project.objects.get(key=project_key)
+        # check if file destination exists, create if not
+        folder = "".join((settings.DATA_DIR, hub.project.key))
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        datafile.storage_format = settings.DATAFILE_FORMAT
+        datafile.filepath = "{}/{}{}".format(folder, datafile_uuid,
+                                             datastore.FORMAT_EXTENSIONS[datafile.storage_format])
+
+    return datafile
+
+
+##########################################################################################
+# Queues
+##########################################################################################
+
+class RedisIngestQueue(object):
+    """
+    A reliable queue on a Redis list. Popped items are moved to a processing list until they are
+    acked, so items a crashed drainer was working on are put back by requeue_unacked().
+    Only one drainer should run per queue.
+    """
+
+    REQUEUE_SCRIPT = """
+        local moved = 0
+        while redis.call('LLEN', KEYS[1]) > 0 do
+            redis.call('RPUSH', KEYS[2], redis.call('LPOP', KEYS[1]))
+            moved = moved + 1
+        end
+        return moved
+    """
+
+    def __init__(self, url, name="openbadge:ingest"):
+        # only needed when the queue is turned on
+        import redis
+
+        self.redis = redis.StrictRedis.from_url(url)
+        self.pending = name
+        self.processing = name + ":processing"
+        self.failed = name + ":failed"
+
+    def push(self, item):
+        self.redis.lpush(self.pending, simplejson.dumps(item))
+
+    def pop_batch(self, size):
+        """Returns up to `size` (handle, item) pairs, oldest first"""
+        pipe = self.redis.pipeline(transaction=False)
+        for _ in range(size):
+            pipe.rpoplpush(self.pending, self.processing)
+        return [(raw, simplejson.loads(raw)) for raw in pipe.execute() if raw is not None]
+
+    def ack(self, handles):
+        pipe = self.redis.pipeline(transaction=False)
+        for raw in handles:
+            pipe.lrem(self.processing, -1, raw)
+        pipe.execute()
+
+    def fail(self, handle):
+        """moves an item that can't be ingested out of the way so it can be looked at later"""
+        pipe = self.redis.pipeline()
+        pipe.lpush(self.failed, handle)
+        pipe.lrem(self.processing, -1, handle)
+        pipe.execute()
+
+    def requeue_unacked(self):
+        """puts items popped but never acked back at the front of the queue. Returns how many."""
+        return self.redis.eval(self.REQUEUE_SCRIPT, 2, self.processing, self.pending)
+
+    def depth(self):
+        return self.redis.llen(self.pending)
+
+
+class FileIngestQueue(object):
+    """
+    A queue kept as one JSON file per item in `directory`. Writes are atomic renames, so items
+    survive restarts; used in tests and when there is no Redis to hand.
+    """
+
+    _counter = itertools.count()
+
+    def __init__(self, directory):
+        self.pending = os.path.join(directory, "pending")
+        self.processing = os.path.join(directory, "processing")
+        self.failed = os.path.join(directory, "failed")
+        self.tmp = os.path.join(directory, "tmp")
+        for folder in (self.pending, self.processing, self.failed, self.tmp):
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+
+    def push(self, item):
+        name = "{:020d}-{}-{:08d}.json".format(int(time.time() * 1e6), os.getpid(), next(self._counter))
+        tmp_path = os.path.join(self.tmp, name)
+        with open(tmp_path, "w") as f:
+            simplejson.dump(item, f)
+        os.rename(tmp_path, os.path.join(self.pending, name))
+
+    def pop_batch(self, size):
+        """Returns up to `size` (handle, item) pairs, oldest first"""
+        batch = []
+        for name in sorted(os.listdir(self.pending))[:size]:
+            path = os.path.join(self.processing, name)
+            try:
+                os.rename(os.path.join(self.pending, name), path)
+            except OSError:
+                # claimed by somebody else
+                continue
+            with open(path) as f:
+                batch.append((name, simplejson.load(f)))
+        return batch
+
+    def ack(self, handles):
+        for name in handles:
+            os.remove(os.path.join(self.processing, name))
+
+    def fail(self, handle):
+        """moves an item that can't be ingested out of the way so it can be looked at later"""
+        os.rename(os.path.join(self.processing, handle), os.path.join(self.failed, handle))
+
+    def requeue_unacked(self):
+        """puts items popped but never acked back in the queue. Returns how many."""
+        names = os.listdir(self.processing)
+        for name in names:
+            os.rename(os.path.join(self.processing, name), os.path.join(self.pending, name))
+        return len(names)
+
+    def depth(self):
+        return len(os.listdir(self.pending))
+
+
+_queues = {}
+
+
+def get_ingest_queue():
+    """Returns the queue configured by settings.INGEST_QUEUE_URL, or None if uploads are ingested inline"""
+    url = settings.INGEST_QUEUE_URL
+    if not url:
+        return None
+
+    if url not in _queues:
+        if url.startswith(("redis://", "rediss://", "unix://")):
+            _queues[url] = RedisIngestQueue(url)
+        elif url.startswith("file://"):
+            _queues[url] = FileIngestQueue(url[len("file://"):])
+        else:
+            raise ImproperlyConfigured("INGEST_QUEUE_URL must be a redis:// or file:// url")
+    return _queues[url]
+
+
+def queue_meeting_chunks(queue, meeting, chunks):
+    """
+    Queues the chunks of a POST (as from decode_meeting_chunks) if they follow on from the meeting's log and what is
+    already queued for it (see Meeting.next_log_index), moving the meeting's queued_index past them. Like
+    append_meeting_chunks the meeting is reopened either way, and False is returned on a log mismatch.
+    Call outside a transaction: the push happens once the meeting is committed, so a push that never happens
+    is a gap the hub's next post is told about rather than an item for a meeting that was rolled back.
+    """
+    with transaction.atomic():
+        meeting = Meeting.objects.select_for_update().get(pk=meeting.pk)
+        meeting.is_complete = False  # Make sure we always close a meeting with a PUT.
+        if chunks and chunks[0][1]["log_index"] != meeting.next_log_index():
+            meeting.save()
+            return False
+        if chunks:
+            meeting.queued_index = chunks[-1][1]["log_index"]
+        meeting.save()
+
+    queue.push({"kind": "meeting", "meeting": meeting.uuid, "chunks": [chunk for chunk, _ in chunks]})
+    return True
+
+
+def queue_datafile_chunks(queue, hub, project_key, data_type, chunks=None, lines=None):
+    """queues either decoded chunks, or raw lines already checked with chunklog.scan_chunk"""
+    queue.push({
+        "kind": "datafile",
+        "hub": hub.uuid,
+        "project": project_key,
+        "data_type": data_type,
+        "chunks": chunks,
+        "lines": lines,
+    })
+
+
+##########################################################################################
+# Draining
+##########################################################################################
+
+def drain_batch(queue, batch):
+    """
+    Applies a batch popped from the queue, grouping items by meeting or DataFile so each file is
+    opened and each row saved once per batch. Each item is checked on its own, those that can't be
+    applied are moved to the queue's failed list. Returns the number of chunks written.
+    """
+    groups = OrderedDict()
+    for handle, item in batch:
+        if item.get("kind") == "meeting":
+            target = ("meeting", item["meeting"])
+        else:
+            target = ("datafile", item["hub"], item["project"], item["data_type"])
+        groups.setdefault(target, []).append((handle, item))
+
+    written = 0
+    for target, items in groups.items():
+        try:
+            with transaction.atomic():
+                if target[0] == "meeting":
+                    applied, failed, chunks_written = _drain_meeting(target[1], items)
+                else:
+                    applied, failed, chunks_written = _drain_datafile(target[1], target[2], target[3], items)
+        except Exception:
+            logger.exception("Could not ingest %s, moving %d items to failed", target, len(items))
+            applied, failed, chunks_written = [], [handle for handle, _ in items], 0
+        queue.ack(applied)
+        for handle in failed:
+            queue.fail(handle)
+        written += chunks_written
+    return written
+
+
+def _drain_meeting(meeting_uuid, items):
+    """
+    Appends the queued posts of a meeting that follow on from its log. Once one can't be appended, neither can
+    the ones after it: they are all failed and the meeting's queued_index is dropped, so the hub's next post is
+    told "log mismatch" and it resends the log with a PUT. Returns (applied handles, failed handles, chunks written)
+    """
+    try:
+        meeting = Meeting.objects.select_for_update().get(uuid=meeting_uuid)
+    except Meeting.DoesNotExist:
+        logger.warning("No meeting %s, moving %d items to failed", meeting_uuid, len(items))
+        return [], [handle for handle, _ in items], 0
+
+    # same continuity check POST /:project/meetings does, applied to each queued post in turn
+    accepted = []
+    applied = []
+    failed = []
+    expected = meeting.last_update_index
+    for handle, item in items:
+        if failed:
+            failed.append(handle)
+            continue
+        try:
+            chunks = decode_meeting_chunks(item.get("chunks"))
+        except ValueError as e:
+            logger.warning("Bad chunks for meeting %s: %s", meeting_uuid, e)
+            failed.append(handle)
+            continue
+        if chunks:
+            first_index = chunks[0][1]['log_index']
+            if first_index != expected + 1:
+                logger.warning("log mismatch for meeting %s, expected %s got %s", meeting_uuid, expected + 1,
+                               first_index)
+                failed.append(handle)
+                continue
+            expected = chunks[-1][1]['log_index']
+        accepted.extend(chunk for chunk, _ in chunks)
+        applied.append(handle)
+
+    if applied:
+        append_meeting_chunks(meeting, accepted)
+    if failed:
+        Meeting.objects.filter(pk=meeting.pk).update(queued_index=None)
+    return applied, failed, len(accepted)
+
+
+def _drain_datafile(hub_uuid, project_key, data_type, items):
+    """Appends the queued posts of a DataFile, failing those that don't check out. Returns as _drain_meeting"""
+    hub = Hub.objects.select_related("project").filter(uuid=hub_uuid).first()
+    datafile = get_or_init_datafile(hub, project_key, data_type) if hub is not None else None
+    if datafile is None:
+        logger.warning("hub %s cannot write to %s_%s, moving %d items to failed", hub_uuid, hub_uuid, data_type,
+                       len(items))
+        return [], [handle for handle, _ in items], 0
+
+    checked = []
+    failed = []
+    for handle, item in items:
+        try:
+            chunks = decode_datafile_chunks(item.get("chunks") or [])
+            lines = [line.encode("utf-8") for line in item.get("lines") or ()]
+            checked.append((handle, chunks, [(line,) + scan_chunk(line) for line in lines]))
+        except ValueError as e:
+            logger.warning("Bad chunks for %s_%s: %s", hub_uuid, data_type, e)
+            failed.append(handle)
+
+    with datafile.open_writer() as writer:
+        for _, chunks, lines in checked:
+            for chunk in chunks:
+                writer.write_chunk(chunk)
+            for line, log_timestamp, log_index in lines:
+                writer.write_line(line, log_timestamp, log_index)
+
+    if writer.last_log_timestamp is not None:
+        datafile.last_update_timestamp = writer.last_log_timestamp
+    datafile.save()
+    return [handle for handle, _, _ in checked], failed, writer.chunks_written
@@ -0,0 +1,66 @@
+"""
+Incremental JSON encoding for responses too big to build in memory, used with StreamingHttpResponse.
+
+The output is the same JSON the non-streaming endpoints returned, produced one meeting and one chunk
+at a time and handed to the server in blocks of about BLOCK_SIZE bytes.
+"""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+BLOCK_SIZE = 64 * 1024
+
+
+def dumps(value):
+    # same encoder as JsonResponse, so Decimals etc. come out as they always have
+    return json.dumps(value, cls=DjangoJSONEncoder)
+
+
+def buffered(pieces, block_size=BLOCK_SIZE):
+    """joins small strings into blocks of about block_size bytes"""
+    block = []
+    size = 0
+    for piece in pieces:
+        block.append(piece)
+        size += len(piece)
+        if size >= block_size:
+            yield "".join(block)
+            block = []
+            size = 0
+    if block:
+        yield "".join(block)
+
+
+def iter_meeting(meeting, get_file):
+    """the pieces of meeting.to_object(get_file)"""
+    meta = dumps(meeting.get_meta())
+    if not get_file:
+        yield '{"metadata": ' + meta + '}'
+        return
+
+    yield '{"metadata": ' + meta + ', "chunks": ['
+    separator = ""
+    for chunk in meeting.get_chunks():
+        yield separator + dumps(chunk)
+        separator = ", "
+    yield ']}'
+
+
+def iter_meeting_map(meetings, get_file):
+    """the pieces of {meeting.key: meeting.to_object(get_file), ...}"""
+    yield '{'
+    separator = ""
+    for meeting in meetings:
+        yield separator + dumps(meeting.key) + ': '
+        for piece in iter_meeting(meeting, get_file):
+            yield piece
+        separator = ", "
+    yield '}'
+
+
+def iter_meetings(meetings, get_file):
+    """the pieces of Project.get_meetings(get_file) for the given meetings"""
+    yield '{"meetings": '
+    for piece in iter_meeting_map(meetings, get_file):
+        yield piece
+    yield '}'
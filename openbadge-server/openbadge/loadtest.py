@@ -0,0 +1,332 @@
+"""
+Synthetic hub fleet, behind `manage.py loadtest`.
+
+Simulates a number of hubs, each carrying some badges, against a running server (e.g. `manage.py runserver`
+on the same database), speaking the protocol real hubs do:
+
+* register with PUT /:anyNumber/hubs (then they're moved into a project of their own, set up in the database)
+* poll GET /:projectKEY/hubs with the member sync token, meeting cursor and ETag of the last response
+* report their badges through MemberViewSet, one PATCH /badges/:key each, or one POST /badges/status
+* record a meeting: PUT /:projectKEY/meetings to start it, POST /:projectKEY/meetings chunks every round,
+  and a PUT that appends the last chunk and ends it
+* POST /:projectKEY/datafiles proximity chunks every round
+
+Each hub runs in its own thread over its own keep-alive connection, a round every `interval` seconds.
+Every request's latency is recorded per endpoint, for throughput and p50/p95/p99 latencies.
+"""
+import httplib
+import json
+import math
+import os
+import random
+import socket
+import threading
+import time
+import urllib
+import urlparse
+import uuid
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+
+from . import chunkindex
+from .models import Hub, Member, Project
+
+DEFAULT_PROJECT = "OB-DEFAULT"
+"""the project PUT /:anyNumber/hubs puts new hubs in"""
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(ordered, p):
+    """nearest-rank p-th percentile of a sorted list"""
+    if not ordered:
+        return None
+    return ordered[max(0, int(math.ceil(p / 100.0 * len(ordered))) - 1)]
+
+
+class Stats(object):
+    """latencies (and failures) of requests, by endpoint. Shared by the hubs' threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.started = None
+        self.finished = None
+
+    def start(self):
+        self.started = time.time()
+
+    def finish(self):
+        self.finished = time.time()
+
+    def add(self, endpoint, seconds, ok):
+        with self.lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + (0 if ok else 1)
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.time()) - self.started
+
+    def summary(self):
+        """[{"endpoint", "requests", "errors", "per_second", "p50", "p95", "p99", "max"}], latencies in ms"""
+        rows = []
+        with self.lock:
+            endpoints = sorted(self.latencies.items())
+        totals = []
+        for endpoint, latencies in endpoints + [("total", None)]:
+            if latencies is None:
+                latencies = totals
+                errors = sum(self.errors.values())
+            else:
+                totals.extend(latencies)
+                errors = self.errors[endpoint]
+            ordered = sorted(latencies)
+            row = {"endpoint": endpoint, "requests": len(ordered), "errors": errors,
+                   "per_second": len(ordered) / self.elapsed if self.elapsed else 0,
+                   "max": ordered[-1] * 1000 if ordered else None}
+            for p in PERCENTILES:
+                value = percentile(ordered, p)
+                row["p{}".format(p)] = value * 1000 if value is not None else None
+            rows.append(row)
+        return rows
+
+
+class Client(object):
+    """one hub's keep-alive connection to the server, timing each request into stats"""
+
+    def __init__(self, base_url, stats, hub_uuid, timeout=30):
+        url = urlparse.urlsplit(base_url)
+        connection_class = httplib.HTTPSConnection if url.scheme == "https" else httplib.HTTPConnection
+        self.connection = connection_class(url.hostname, url.port, timeout=timeout)
+        self.prefix = url.path.rstrip("/")
+        self.stats = stats
+        self.headers = {"X-APPKEY": settings.APP_KEY, "X-HUB-UUID": hub_uuid}
+
+    def request(self, endpoint, method, path, body=None, content_type=None, headers=None):
+        """(status, response headers, body), status None if the request failed outright"""
+        all_headers = dict(self.headers, **(headers or {}))
+        if content_type:
+            all_headers["Content-Type"] = content_type
+        start = time.time()
+        try:
+            self.connection.request(method, self.prefix + path, body, all_headers)
+            response = self.connection.getresponse()
+            content = response.read()
+        except (httplib.HTTPException, socket.error):
+            # start over on a new connection next time
+            self.connection.close()
+            self.stats.add(endpoint, time.time() - start, False)
+            return None, {}, ""
+        self.stats.add(endpoint, time.time() - start, response.status < 400)
+        return response.status, dict(response.getheaders()), content
+
+    def json(self, endpoint, method, path, data, headers=None):
+        return self.request(endpoint, method, path, json.dumps(data), "application/json", headers)
+
+    def form(self, endpoint, method, path, data):
+        return self.request(endpoint, method, path, urllib.urlencode(data), "application/x-www-form-urlencoded")
+
+    def multipart(self, endpoint, method, path, data):
+        return self.request(endpoint, method, path, encode_multipart(BOUNDARY, data), MULTIPART_CONTENT)
+
+    def close(self):
+        self.connection.close()
+
+
+def _chunk(chunk_type, log_index, data):
+    return {"type": chunk_type, "log_index": log_index, "log_timestamp": round(time.time(), 3), "data": data}
+
+
+class SimulatedHub(object):
+    """a hub and its badges ([(key, badge address)]), going through the rounds of a real one"""
+
+    def __init__(self, client, hub_uuid, project_key, badges, chunks=10, bulk_status=False):
+        self.client = client
+        self.uuid = hub_uuid
+        self.project_key = project_key
+        self.badges = badges
+        self.chunks = chunks
+        self.bulk_status = bulk_status
+        self.member_sync_token = "0"
+        self.meeting_cursor = None
+        self.etag = None
+        self.meeting_uuid = None
+        self.log_index = 0
+
+    def register(self):
+        self.client.request("PUT /:anyNumber/hubs", "PUT", "/0/hubs")
+
+    def poll(self):
+        headers = {"X-MEMBER-SYNC-TOKEN": self.member_sync_token}
+        if self.meeting_cursor is not None:
+            headers["X-MEETING-CURSOR"] = self.meeting_cursor
+        if self.etag is not None:
+            headers["If-None-Match"] = self.etag
+        status, headers, content = self.client.request(
+            "GET /:project/hubs", "GET", "/{}/hubs".format(self.project_key), headers=headers)
+        if status == 200:
+            hub = json.loads(content)
+            self.member_sync_token = hub["member_sync_token"]
+            self.meeting_cursor = hub["meeting_cursor"]
+            self.etag = headers.get("etag")
+
+    def report_badges(self):
+        now = time.time()
+        statuses = [{"key": key, "last_seen_ts": round(now, 3), "last_voltage": round(random.uniform(2.5, 3.2), 3),
+                     "last_proximity_ts": round(now, 3)} for key, _ in self.badges]
+        if self.bulk_status:
+            self.client.json("POST /badges/status", "POST", "/badges/status", {"badges": statuses})
+            return
+        for status in statuses:
+            self.client.json("PATCH /badges/:key", "PATCH", "/badges/{}".format(status.pop("key")), status)
+
+    def start_meeting(self):
+        self.meeting_uuid = "{}_{}".format(self.uuid, int(time.time() * 1000))
+        self.log_index = 0
+        header = _chunk("meeting started", 0, {"uuid": self.meeting_uuid, "log_version": "2.0",
+                                               "start_time": round(time.time(), 3)})
+        # with its first chunk, as a hub's log has. (put_meeting can't find the last line of a one-line log)
+        lines = [json.dumps(chunk) + "\n" for chunk in [header] + self.meeting_chunks(1)]
+        log = SimpleUploadedFile("log.txt", "".join(lines))
+        self.client.multipart("PUT /:project/meetings", "PUT", "/{}/meetings".format(self.project_key),
+                              {"file": log})
+
+    def meeting_chunks(self, count):
+        chunks = []
+        for _ in range(count):
+            self.log_index += 1
+            address = random.choice(self.badges)[1]
+            chunks.append(_chunk("audio received", self.log_index, {"member": address,
+                                                                    "samples": [random.randint(0, 255)] * 10}))
+        return chunks
+
+    def add_to_meeting(self):
+        chunks = [json.dumps(chunk) + "\n" for chunk in self.meeting_chunks(self.chunks)]
+        self.client.form("POST /:project/meetings", "POST", "/{}/meetings".format(self.project_key),
+                         {"uuid": self.meeting_uuid, "chunks": json.dumps(chunks)})
+
+    def end_meeting(self):
+        last = self.meeting_chunks(1)[0]
+        log = SimpleUploadedFile("log.txt", json.dumps(last) + "\n")
+        self.client.multipart("PUT /:project/meetings", "PUT", "/{}/meetings".format(self.project_key), {
+            "file": log, "uuid": self.meeting_uuid, "from_index": last["log_index"],
+            "is_complete": "true", "ending_method": "manual"})
+
+    def post_datafile(self):
+        chunks = []
+        for _ in range(self.chunks):
+            address = random.choice(self.badges)[1]
+            chunks.append(_chunk("proximity received", -1, {
+                "member": address, "badge_address": address, "timestamp": round(time.time()),
+                "voltage": round(random.uniform(2.5, 3.2), 2),
+                "rssi_distances": {other: {"count": random.randint(1, 30), "rssi": random.randint(-90, -40)}
+                                   for other in random.sample([a for _, a in self.badges], min(3, len(self.badges)))},
+            }))
+        self.client.form("POST /:project/datafiles", "POST", "/{}/datafiles".format(self.project_key),
+                         {"data_type": "proximity", "chunks": json.dumps(chunks)})
+
+    def round(self):
+        self.poll()
+        self.report_badges()
+        self.add_to_meeting()
+        self.post_datafile()
+
+
+class LoadTest(object):
+    """
+    A fleet of `hubs` simulated hubs with `badges` badges each, in a project of their own. setup() makes the
+    project and members in the database, register() has the hubs sign up over HTTP and moves them into the
+    project, run() goes through rounds until the time or number of rounds is up, cleanup() deletes it all.
+    """
+
+    def __init__(self, base_url, hubs=10, badges=10, interval=5.0, chunks=10, bulk_status=False):
+        self.base_url = base_url
+        self.hub_count = hubs
+        self.badge_count = badges
+        self.interval = interval
+        self.chunks = chunks
+        self.bulk_status = bulk_status
+        self.run_id = uuid.uuid4().hex[:8]
+        self.stats = Stats()
+        self.project = None
+        self.hubs = []
+
+    def setup(self):
+        Project.objects.get_or_create(name=DEFAULT_PROJECT)
+        self.project = Project.objects.create(name="loadtest-{}".format(self.run_id))
+        sync_seq = Project.next_member_sync_seq(self.project.id)
+        members = []
+        for h in range(self.hub_count):
+            for b in range(self.badge_count):
+                address = ":".join("{:02X}".format(random.randint(0, 255)) for _ in range(6))
+                members.append(Member(project=self.project, sync_seq=sync_seq, name="Hub {} badge {}".format(h, b),
+                                      email="{}-{}-{}@loadtest.invalid".format(self.run_id, h, b), badge=address))
+        Member.bulk_create_with_keys(members, batch_size=500)
+        Project.touch_rosters([self.project.id])
+
+        for h in range(self.hub_count):
+            hub_uuid = "loadtest-{}-{}".format(self.run_id, h)
+            badges = [(member.key, member.badge)
+                      for member in members[h * self.badge_count:(h + 1) * self.badge_count]]
+            client = Client(self.base_url, self.stats, hub_uuid)
+            self.hubs.append(SimulatedHub(client, hub_uuid, self.project.key, badges, chunks=self.chunks,
+                                          bulk_status=self.bulk_status))
+
+    def _in_threads(self, work):
+        threads = [threading.Thread(target=work, args=(hub,)) for hub in self.hubs]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def register(self):
+        self.stats.start()
+        # one at a time, a hub only registers once and a failed registration would fail everything it does after
+        for hub in self.hubs:
+            hub.register()
+        # saved one by one, so the roster is bumped and the server's cached copies are dropped
+        for hub in Hub.objects.filter(uuid__in=[hub.uuid for hub in self.hubs]):
+            hub.project = self.project
+            hub.name = "Load test"
+            hub.save()
+
+    def run(self, duration=None, rounds=None):
+        """rounds until duration seconds have passed or each hub has done `rounds` rounds. Returns the stats"""
+        deadline = time.time() + duration if duration else None
+
+        def simulate(hub):
+            # spread the hubs' rounds over the interval, as real ones are
+            time.sleep(random.uniform(0, self.interval))
+            hub.start_meeting()
+            done = 0
+            while (rounds is None or done < rounds) and (deadline is None or time.time() < deadline):
+                started = time.time()
+                hub.round()
+                done += 1
+                time.sleep(max(0, self.interval - (time.time() - started)))
+            hub.end_meeting()
+            hub.client.close()
+
+        self._in_threads(simulate)
+        self.stats.finish()
+        return self.stats
+
+    def cleanup(self):
+        """deletes the project, with the hubs, members, meetings and data files of the run, files included"""
+        if self.project is None:
+            return
+        paths = [meeting.log_file.path for meeting in self.project.meetings.all() if meeting.log_file]
+        for datafile in self.project.data.all():
+            for segment in datafile.segments.all():
+                segment.delete_file()
+            paths.append(datafile.filepath)
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+            chunkindex.remove(path)
+        self.project.delete()
@@ -0,0 +1,123 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from openbadge import chunkindex, datastore
+from openbadge.models import DataFile, DataFileSegment
+
+
+class Command(BaseCommand):
+    help = 'Converts DataFiles to the given storage format ("json" or "packed"). ' \
+           'Each file is rewritten next to the original, then swapped in and the original removed. ' \
+           'New segments are written in the new format too. Files modified in the last --min-age seconds are ' \
+           'skipped, as they may still be receiving uploads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--to', nargs=1, type=str, choices=datastore.FORMAT_EXTENSIONS.keys())
+
+        parser.add_argument('--project_key', nargs=1, type=str, help='Only convert this project\'s files (optional)')
+
+        parser.add_argument('--dry-run', action='store_true', dest='dry_run', default=False,
+                            help='List the files that would be converted without touching them')
+
+        parser.add_argument('--min-age', type=int, dest='min_age', default=300,
+                            help='Skip files modified less than this many seconds ago (default 300)')
+
+    def handle(self, *args, **options):
+        if not options["to"]:
+            raise CommandError("Wrong parameters, --to is required")
+        storage_format = options["to"][0]
+
+        datafiles = DataFile.objects.all()
+        segments = DataFileSegment.objects.exclude(storage_format=storage_format).select_related("datafile")
+        if options["project_key"]:
+            datafiles = datafiles.filter(project__key=options["project_key"][0])
+            segments = segments.filter(datafile__project__key=options["project_key"][0])
+
+        # (row, path, format, data_type) for every file to convert, the unsegmented DataFile files first.
+        # DataFiles created since segmenting was added don't have one
+        files = [(datafile, datafile.filepath, datafile.storage_format, datafile.data_type)
+                 for datafile in datafiles.exclude(storage_format=storage_format)
+                 if os.path.exists(datafile.filepath)]
+        files.extend((segment, segment.filepath, segment.storage_format, segment.datafile.data_type)
+                     for segment in segments)
+
+        size_before = 0
+        size_after = 0
+        skipped = []
+        for row, path, old_format, data_type in files:
+            if not os.path.exists(path):
+                self.stdout.write("Skipping {0}, {1} does not exist".format(row, path))
+                continue
+
+            max_length = row._meta.get_field("filepath").max_length
+            if len(self.converted_path(path, storage_format)) > max_length:
+                self.stdout.write("Skipping {0}, {1} would be longer than the {2} characters its filepath can "
+                                  "hold".format(row, self.converted_path(path, storage_format), max_length))
+                if isinstance(row, DataFile):
+                    skipped.append(row.pk)
+                continue
+
+            age = time.time() - os.path.getmtime(path)
+            if age < options["min_age"]:
+                self.stdout.write("Skipping {0}, {1} was modified {2:.0f} seconds ago and may still be receiving "
+                                  "uploads".format(row, path, age))
+                if isinstance(row, DataFile):
+                    skipped.append(row.pk)
+                continue
+
+            if options["dry_run"]:
+                self.stdout.write("Would convert {0} ({1} bytes)".format(path, os.path.getsize(path)))
+                continue
+
+            before, after = self.convert(row, old_format, storage_format, data_type)
+            size_before += before
+            size_after += after
+            self.stdout.write("Converted {0}: {1} -> {2} bytes".format(path, before, after))
+
+        if not options["dry_run"]:
+            # new segments are written in the new format too
+            # except those whose file is still in the old one
+            datafiles.exclude(storage_format=storage_format).exclude(pk__in=skipped).update(
+                storage_format=storage_format)
+
+        if size_before:
+            self.stdout.write("Done, {0} -> {1} bytes ({2:.1f}x)".format(
+                size_before, size_after, float(size_before) / max(size_after, 1)))
+
+    @staticmethod
+    def converted_path(path, storage_format):
+        return os.path.splitext(path)[0] + datastore.FORMAT_EXTENSIONS[storage_format]
+
+    @classmethod
+    def convert(cls, row, old_format, storage_format, data_type):
+        """rewrites a DataFile's unsegmented file or a DataFileSegment's file, row is either of them"""
+        old_path = row.filepath
+        size_before = os.path.getsize(old_path)
+        new_path = cls.converted_path(old_path, storage_format)
+        tmp_path = new_path + ".converting"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        with datastore.DataFileWriter(tmp_path, storage_format, data_type) as writer:
+            for chunk in datastore.iter_chunks(old_path, old_format):
+                writer.write_chunk(chunk)
+            size_after = writer.size()
+
+        with transaction.atomic():
+            # only the fields the conversion changes, the rest of the row belongs to the writers
+            row.filepath = new_path
+            row.storage_format = storage_format
+            update_fields = ["filepath", "storage_format"]
+            if isinstance(row, DataFileSegment):
+                row.size = size_after
+                update_fields.append("size")
+            row.save(update_fields=update_fields)
+            os.rename(tmp_path, new_path)
+            os.rename(chunkindex.index_path(tmp_path), chunkindex.index_path(new_path))
+
+        os.remove(old_path)
+        chunkindex.remove(old_path)
+        return size_before, size_after
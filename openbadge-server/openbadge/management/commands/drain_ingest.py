@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from openbadge.ingest import drain_batch, get_ingest_queue
+
+
+class Command(BaseCommand):
+    help = 'Appends hub uploads waiting on the ingest queue (settings.INGEST_QUEUE_URL) to their meeting logs ' \
+           'and DataFiles. Runs until stopped unless --once is given. Only run one drainer per queue.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, dest='batch_size',
+                            help='Number of queued uploads applied together')
+
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to wait when the queue is empty')
+
+        parser.add_argument('--once', action='store_true', default=False,
+                            help='Exit once the queue is empty')
+
+        parser.add_argument('--depth', action='store_true', default=False,
+                            help='Print the backlog depth (uploads waiting on the queue) and exit')
+
+    def handle(self, *args, **options):
+        queue = get_ingest_queue()
+        if queue is None:
+            raise CommandError("INGEST_QUEUE_URL is not set, uploads are ingested inline")
+
+        if options["depth"]:
+            self.stdout.write(str(queue.depth()))
+            return
+
+        requeued = queue.requeue_unacked()
+        if requeued:
+            self.stdout.write("Requeued {0} uploads left over from a previous run".format(requeued))
+
+        while True:
+            batch = queue.pop_batch(options["batch_size"])
+            if not batch:
+                if options["once"]:
+                    return
+                time.sleep(options["interval"])
+                continue
+
+            start = time.time()
+            chunks_written = drain_batch(queue, batch)
+            self.stdout.write("Drained {0} uploads ({1} chunks) in {2:.3f}s, backlog depth {3}".format(
+                len(batch), chunks_written, time.time() - start, queue.depth()))
@@ -1,25 +1,61 @@
+import os
+import time
+
 from django.core.management.base import BaseCommand, CommandError
-from openbadge.analysis import load_users_from_csv
+
+from openbadge.memberimport import FORMAT_CSV, FORMAT_JSON, READERS, MemberImport
+from openbadge.models import Project
+
 
 class Command(BaseCommand):
     help = 'Import members from a properly formatted CSV to the given project key. ' \
            'Users are identified by email addresses. Format:\n' \
            'email, group, name, badge\n' \
-           'Where "badge" is the MAC address, and "group" isn\'t currently used'
+           'Where "badge" is the MAC address, and "group" isn\'t currently used. ' \
+           'A .json/.ndjson file instead holds one {"email", "name", "badge"} object per line.'
 
     def add_arguments(self, parser):
         parser.add_argument('--project_key', nargs=1, type=str)
 
         parser.add_argument('--filename', nargs=1, type=str)
 
+        parser.add_argument('--format', choices=[FORMAT_CSV, FORMAT_JSON],
+                            help='File format, by default guessed from the file name')
+
+        parser.add_argument('--batch-size', type=int, default=500, dest='batch_size',
+                            help='Number of rows written together')
+
+        parser.add_argument('--update', action='store_true', default=False,
+                            help='Update the name and badge of members already in the project')
+
+        parser.add_argument('--dry-run', action='store_true', dest='dry_run', default=False,
+                            help='Check the file and count what would be imported without writing anything')
+
     def handle(self, *args, **options):
-        project_key = options["project_key"][0]
+        if not options["project_key"] or not options["filename"]:
+            raise CommandError("Wrong parameters, --project_key and --filename are required")
+        try:
+            project = Project.objects.get(key=options["project_key"][0])
+        except Project.DoesNotExist:
+            raise CommandError("No project with key {0}".format(options["project_key"][0]))
+
         filename = options["filename"][0]
+        file_format = options["format"]
+        if file_format is None:
+            extension = os.path.splitext(filename)[1].lower()
+            file_format = FORMAT_JSON if extension in (".json", ".ndjson", ".jsonl") else FORMAT_CSV
 
-        if (project_key is not None) and (filename is not None):
-            num_members = load_users_from_csv(project_key, filename)
-            self.stdout.write("Imported {0} new members successfully!".format(num_members))
+        def on_error(line_number, message):
+            self.stderr.write(u"Line {0}: {1}".format(line_number, message))
 
-        else:
-            self.stdout.write("Wrong parameters")
+        start = time.time()
+        with open(filename, "rb") as f:
+            result = MemberImport(project, batch_size=options["batch_size"], update=options["update"],
+                                  dry_run=options["dry_run"], on_error=on_error).run(READERS[file_format](f))
+        elapsed = time.time() - start
 
+        self.stdout.write("{0}{1} new members, {2} updated, {3} unchanged, {4} rejected".format(
+            "Dry run, would import " if options["dry_run"] else "Imported ",
+            result.created, result.updated, result.unchanged, result.failed))
+        self.stdout.write("{0} rows in {1:.2f}s ({2:.0f} rows/s)".format(
+            result.rows, elapsed, result.rows / elapsed if elapsed else 0))
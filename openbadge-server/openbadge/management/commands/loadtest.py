@@ -0,0 +1,79 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from openbadge.loadtest import PERCENTILES, LoadTest
+
+
+class Command(BaseCommand):
+    help = 'Simulates a fleet of hubs with their badges against a running server on this database ' \
+           '(e.g. manage.py runserver), then reports the throughput and p50/p95/p99 latency of each endpoint. ' \
+           'The hubs, badges and data of the run are deleted afterwards unless --keep is given.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000',
+                            help='Where the server is (default http://127.0.0.1:8000)')
+
+        parser.add_argument('--hubs', type=int, default=10, help='Number of hubs')
+
+        parser.add_argument('--badges', type=int, default=10, help='Number of badges on each hub')
+
+        parser.add_argument('--duration', type=float, default=60,
+                            help='Seconds to run for (default 60), unless --rounds is given')
+
+        parser.add_argument('--rounds', type=int,
+                            help='Have each hub do this many rounds instead of running for --duration')
+
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Seconds between the start of a hub\'s rounds (default 5)')
+
+        parser.add_argument('--chunks', type=int, default=10,
+                            help='Meeting and proximity chunks each hub sends per round (default 10)')
+
+        parser.add_argument('--bulk-status', action='store_true', dest='bulk_status', default=False,
+                            help='Report badges with one POST /badges/status per round instead of a PATCH each')
+
+        parser.add_argument('--json', dest='json_file',
+                            help='Also write the results to this file as JSON, to compare runs')
+
+        parser.add_argument('--keep', action='store_true', default=False,
+                            help='Keep the project, hubs, badges and data of the run')
+
+    def handle(self, *args, **options):
+        if options["hubs"] < 1 or options["badges"] < 1:
+            raise CommandError("--hubs and --badges must be at least 1")
+        if options["interval"] < 0 or options["chunks"] < 1:
+            raise CommandError("--interval can't be negative and --chunks must be at least 1")
+
+        loadtest = LoadTest(options["url"], hubs=options["hubs"], badges=options["badges"],
+                            interval=options["interval"], chunks=options["chunks"],
+                            bulk_status=options["bulk_status"])
+        loadtest.setup()
+        self.stdout.write("{0} hubs with {1} badges each in project {2}, against {3}".format(
+            options["hubs"], options["badges"], loadtest.project.key, options["url"]))
+        try:
+            loadtest.register()
+            stats = loadtest.run(duration=None if options["rounds"] else options["duration"],
+                                 rounds=options["rounds"])
+        finally:
+            if not options["keep"]:
+                loadtest.cleanup()
+
+        rows = stats.summary()
+        self.stdout.write("{0:<26} {1:>8} {2:>7} {3:>8} {4} {5:>8}  (ms)".format(
+            "endpoint", "requests", "errors", "req/s", " ".join("{:>8}".format("p{}".format(p)) for p in PERCENTILES),
+            "max"))
+        for row in rows:
+            latencies = [row["p{}".format(p)] for p in PERCENTILES] + [row["max"]]
+            self.stdout.write("{0:<26} {1:>8} {2:>7} {3:>8.1f} {4}".format(
+                row["endpoint"], row["requests"], row["errors"], row["per_second"],
+                " ".join("{:>8.1f}".format(value) if value is not None else "{:>8}".format("-")
+                         for value in latencies)))
+        self.stdout.write("{0:.1f}s".format(stats.elapsed))
+
+        if options["json_file"]:
+            with open(options["json_file"], "w") as f:
+                json.dump({"options": {name: options[name] for name in
+                                       ("url", "hubs", "badges", "duration", "rounds", "interval", "chunks",
+                                        "bulk_status")},
+                           "elapsed": stats.elapsed, "endpoints": rows}, f, indent=2)
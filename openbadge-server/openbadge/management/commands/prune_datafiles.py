@@ -0,0 +1,60 @@
+import calendar
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from openbadge.models import DataFileSegment
+
+
+class Command(BaseCommand):
+    help = 'Deletes DataFile segments whose chunks are all older than the given date or number of days. ' \
+           'Files written before DataFiles were segmented are never pruned.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', nargs=1, type=str,
+                            help='Drop segments ending before this UTC date (YYYY-MM-DD)')
+
+        parser.add_argument('--keep-days', nargs=1, type=int, dest='keep_days',
+                            help='Drop segments ending more than this many days ago')
+
+        parser.add_argument('--project_key', nargs=1, type=str, help='Only prune this project\'s files (optional)')
+
+        parser.add_argument('--data_type', nargs=1, type=str, help='Only prune this data type (optional)')
+
+        parser.add_argument('--dry-run', action='store_true', dest='dry_run', default=False,
+                            help='List the segments that would be deleted without touching them')
+
+    def handle(self, *args, **options):
+        if options["before"]:
+            try:
+                before = datetime.datetime.strptime(options["before"][0], "%Y-%m-%d")
+            except ValueError:
+                raise CommandError("--before must be a date like 2017-01-31")
+            cutoff = calendar.timegm(before.utctimetuple())
+        elif options["keep_days"]:
+            cutoff = time.time() - options["keep_days"][0] * 24 * 60 * 60
+        else:
+            raise CommandError("Wrong parameters, one of --before or --keep-days is required")
+
+        segments = DataFileSegment.objects.filter(last_log_timestamp__lt=cutoff).select_related("datafile")
+        if options["project_key"]:
+            segments = segments.filter(datafile__project__key=options["project_key"][0])
+        if options["data_type"]:
+            segments = segments.filter(datafile__data_type=options["data_type"][0])
+
+        dropped = 0
+        freed = 0
+        for segment in segments.order_by("id"):
+            if options["dry_run"]:
+                self.stdout.write("Would delete {0} ({1} chunks, {2} bytes)".format(
+                    segment.filepath, segment.chunk_count, segment.size))
+                continue
+
+            segment.delete_file()
+            segment.delete()
+            dropped += 1
+            freed += segment.size
+
+        if not options["dry_run"]:
+            self.stdout.write("Deleted {0} segments, {1} bytes".format(dropped, freed))
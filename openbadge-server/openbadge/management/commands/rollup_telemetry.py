@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from openbadge import telemetry
+
+
+class Command(BaseCommand):
+    help = 'Rolls badge telemetry samples up into 1-minute and 1-hour summaries, then drops samples and ' \
+           'summaries past their retention (TELEMETRY_RAW_DAYS etc.). Meant to run every few minutes from cron.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', nargs=1, type=float,
+                            help='Redo the rollups of this many past hours, to take in late samples (default 2)')
+
+        parser.add_argument('--no-prune', action='store_false', dest='prune', default=True,
+                            help='Only roll up, keep everything')
+
+    def handle(self, *args, **options):
+        hours = options["hours"][0] if options["hours"] else 2
+        if hours <= 0:
+            raise CommandError("--hours must be positive")
+
+        now = time.time()
+        since = now - hours * telemetry.HOUR
+        raw_cutoff = telemetry.retention_cutoffs(now)[0]
+        if raw_cutoff is not None:
+            # rolling up minutes whose samples are already gone would empty their rollups
+            since = max(since, raw_cutoff)
+
+        self.stdout.write("Wrote {0} 1-minute and {1} 1-hour rollups".format(*telemetry.rollup(since, now)))
+
+        if options["prune"]:
+            deleted = telemetry.prune(now)
+            self.stdout.write("Deleted {0} samples, {1} 1-minute and {2} 1-hour rollups".format(
+                deleted[0], deleted[telemetry.MINUTE], deleted[telemetry.HOUR]))
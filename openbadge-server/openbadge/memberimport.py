@@ -0,0 +1,160 @@
+"""
+Bulk member import, behind `manage.py importcsv`.
+
+Rows are read one at a time from a CSV (email, group, name, badge) or newline-delimited JSON file and written
+in batches: per batch, one query each to find the emails and badges already taken, one bulk INSERT (see
+BaseModel.bulk_create_with_keys) and, when updating, one UPDATE, so the import runs in constant memory whatever the
+size of the file. Members are identified by email.
+"""
+import csv
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models import Case, CharField, Value, When
+from django.utils import timezone
+
+from .models import Member, Project
+
+FORMAT_CSV = "csv"
+FORMAT_JSON = "json"
+
+
+def read_csv(f):
+    """(line number, row) of each line of email, group, name, badge. "group" isn't used"""
+    for line_number, fields in enumerate(csv.reader(f), 1):
+        if not any(field.strip() for field in fields):
+            continue
+        if line_number == 1 and fields[0].strip().lower() == "email":
+            continue  # header
+        fields = [field.decode("utf-8") for field in fields] + [u""] * (4 - len(fields))
+        yield line_number, {"email": fields[0], "name": fields[2], "badge": fields[3]}
+
+
+def read_json(f):
+    """(line number, row) of each line holding a JSON object with email, name and badge"""
+    for line_number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_number, row if isinstance(row, dict) else None
+
+
+READERS = {FORMAT_CSV: read_csv, FORMAT_JSON: read_json}
+
+
+def clean_row(row):
+    """the row's email, name and badge, stripped. Raises ValueError if they won't do"""
+    if row is None:
+        raise ValueError(u"not a JSON object")
+    cleaned = {name: unicode(row.get(name) or u"").strip() for name in ("email", "name", "badge")}
+    for name, value in cleaned.items():
+        if not value:
+            raise ValueError(u"no {}".format(name))
+        max_length = Member._meta.get_field(name).max_length
+        if len(value) > max_length:
+            raise ValueError(u"{} longer than {} characters".format(name, max_length))
+    try:
+        validate_email(cleaned["email"])
+    except ValidationError:
+        raise ValueError(u"bad email {}".format(cleaned["email"]))
+    return cleaned
+
+
+class MemberImport(object):
+    """
+    Imports rows into a project. Existing members (by email) are left alone unless update is set, in which case
+    their name and badge are updated. on_error(line_number, message) is told about each row that can't be
+    imported; the rest still are. With dry_run nothing is written, the counts say what would have been.
+    """
+
+    def __init__(self, project, batch_size=500, update=False, dry_run=False, on_error=None):
+        self.project = project
+        self.batch_size = batch_size
+        self.update = update
+        self.dry_run = dry_run
+        self.on_error = on_error or (lambda line_number, message: None)
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.failed = 0
+
+    @property
+    def rows(self):
+        return self.created + self.updated + self.unchanged + self.failed
+
+    def error(self, line_number, message):
+        self.failed += 1
+        self.on_error(line_number, message)
+
+    def run(self, rows):
+        batch = []
+        for line_number, row in rows:
+            try:
+                batch.append((line_number, clean_row(row)))
+            except ValueError as e:
+                self.error(line_number, e.args[0])
+                continue
+            if len(batch) >= self.batch_size:
+                self.write_batch(batch)
+                batch = []
+        if batch:
+            self.write_batch(batch)
+        return self
+
+    def write_batch(self, batch):
+        emails = set(row["email"] for _, row in batch)
+        badges = set(row["badge"] for _, row in batch)
+        existing = {member["email"]: member for member in Member.objects.filter(email__in=emails).values(
+            "id", "email", "project_id", "name", "badge")}
+        badge_owners = dict(Member.objects.filter(badge__in=badges).values_list("badge", "email"))
+
+        to_create = []
+        to_update = []
+        seen = set()
+        for line_number, row in batch:
+            if row["email"] in seen:
+                self.error(line_number, u"{} is in the file twice".format(row["email"]))
+                continue
+            member = existing.get(row["email"])
+            if member is not None and member["project_id"] != self.project.id:
+                # checked first, so the row doesn't claim its email or badge for the rows after it
+                self.error(line_number, u"{} is a member of another project".format(row["email"]))
+                continue
+            owner = badge_owners.get(row["badge"])
+            if owner is not None and owner != row["email"]:
+                self.error(line_number, u"badge {} already belongs to {}".format(row["badge"], owner))
+                continue
+            seen.add(row["email"])
+            badge_owners[row["badge"]] = row["email"]
+
+            if member is None:
+                to_create.append(row)
+            elif not self.update or (member["name"], member["badge"]) == (row["name"], row["badge"]):
+                self.unchanged += 1
+            else:
+                to_update.append((member["id"], row))
+
+        if not self.dry_run and (to_create or to_update):
+            self.save(to_create, to_update)
+        self.created += len(to_create)
+        self.updated += len(to_update)
+
+    @transaction.atomic
+    def save(self, to_create, to_update):
+        sync_seq = Project.next_member_sync_seq(self.project.id)
+        Member.bulk_create_with_keys([Member(project=self.project, sync_seq=sync_seq, **row) for row in to_create])
+        if to_update:
+            Member.objects.filter(id__in=[member_id for member_id, _ in to_update]).update(
+                name=Case(*[When(id=member_id, then=Value(row["name"])) for member_id, row in to_update],
+                          output_field=CharField()),
+                badge=Case(*[When(id=member_id, then=Value(row["badge"])) for member_id, row in to_update],
+                           output_field=CharField()),
+                sync_seq=sync_seq,
+                date_updated=timezone.now())
+        # bulk writes send no signals
+        Project.touch_rosters([self.project.id])
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('openbadge', '0002_datafile_project'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datafile',
+            name='storage_format',
+            field=models.CharField(default='json', max_length=16, choices=[('json', 'JSON lines'), ('packed', 'Packed binary')]),
+        ),
+    ]
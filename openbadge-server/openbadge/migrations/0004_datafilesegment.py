@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('openbadge', '0003_datafile_storage_format'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataFileSegment',
+            fields=[
+                ('id', models.AutoField(serialize=False, primary_key=True)),
+                ('key', models.CharField(db_index=True, unique=True, max_length=10, blank=True)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+                ('filepath', models.CharField(unique=True, max_length=255)),
+                ('storage_format', models.CharField(default='json', max_length=16, choices=[('json', 'JSON lines'), ('packed', 'Packed binary')])),
+                ('period_start', models.BigIntegerField(default=0)),
+                ('first_log_timestamp', models.DecimalField(null=True, max_digits=20, decimal_places=3, blank=True)),
+                ('last_log_timestamp', models.DecimalField(null=True, max_digits=20, decimal_places=3, blank=True)),
+                ('first_log_index', models.IntegerField(null=True, blank=True)),
+                ('last_log_index', models.IntegerField(null=True, blank=True)),
+                ('chunk_count', models.IntegerField(default=0)),
+                ('size', models.BigIntegerField(default=0)),
+                ('datafile', models.ForeignKey(related_name='segments', to='openbadge.DataFile')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='datafilesegment',
+            index_together=set([('datafile', 'first_log_timestamp'), ('datafile', 'last_log_timestamp')]),
+        ),
+    ]
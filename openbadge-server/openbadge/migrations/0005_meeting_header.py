@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('openbadge', '0004_datafilesegment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meeting',
+            name='header',
+            field=jsonfield.fields.JSONField(null=True, blank=True),
+        ),
+        migrations.AddField(
+            model_name='meeting',
+            name='header_complete',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def number_existing_members(apps, schema_editor):
+    # existing members count as changed since token 0
+    apps.get_model('openbadge', 'Member').objects.update(sync_seq=1)
+    apps.get_model('openbadge', 'Project').objects.update(member_sync_seq=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('openbadge', '0005_meeting_header'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='member_sync_seq',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='member',
+            name='sync_seq',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AlterIndexTogether(
+            name='member',
+            index_together=set([('project', 'date_updated'), ('project', 'sync_seq')]),
+        ),
+        migrations.RunPython(number_existing_members, migrations.RunPython.noop),
+    ]
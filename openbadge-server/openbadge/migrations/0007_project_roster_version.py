@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('openbadge', '0006_member_sync_seq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='roster_version',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='roster_updated',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
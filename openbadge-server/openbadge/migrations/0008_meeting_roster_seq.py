@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def number_completed_meetings(apps, schema_editor):
+    # existing completed meetings count as changed since cursor 0
+    apps.get_model('openbadge', 'Meeting').objects.filter(is_complete=True).update(roster_seq=1)
+    apps.get_model('openbadge', 'Project').objects.filter(roster_version=0).update(roster_version=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('openbadge', '0007_project_roster_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meeting',
+            name='roster_seq',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AlterIndexTogether(
+            name='meeting',
+            index_together=set([('hub', 'is_complete', 'roster_seq')]),
+        ),
+        migrations.RunPython(number_completed_meetings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('openbadge', '0008_meeting_roster_seq'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BadgeSample',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('seen_ts', models.DecimalField(max_digits=20, decimal_places=3, db_index=True)),
+                ('voltage', models.DecimalField(null=True, max_digits=5, decimal_places=3)),
+                ('minute_start', models.BigIntegerField()),
+                ('member', models.ForeignKey(related_name='samples', to='openbadge.Member')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BadgeRollup',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('resolution', models.IntegerField()),
+                ('period_start', models.BigIntegerField()),
+                ('hour_start', models.BigIntegerField()),
+                ('sample_count', models.IntegerField()),
+                ('voltage_count', models.IntegerField()),
+                ('voltage_sum', models.DecimalField(null=True, max_digits=16, decimal_places=3)),
+                ('voltage_min', models.DecimalField(null=True, max_digits=5, decimal_places=3)),
+                ('voltage_max', models.DecimalField(null=True, max_digits=5, decimal_places=3)),
+                ('first_seen_ts', models.DecimalField(max_digits=20, decimal_places=3)),
+                ('last_seen_ts', models.DecimalField(max_digits=20, decimal_places=3)),
+                ('member', models.ForeignKey(related_name='rollups', to='openbadge.Member')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='badgesample',
+            index_together=set([('member', 'seen_ts')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='badgerollup',
+            unique_together=set([('member', 'resolution', 'period_start')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='badgerollup',
+            index_together=set([('resolution', 'period_start')]),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('openbadge', '0009_badge_telemetry'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='meeting',
+            name='start_time',
+            field=models.DecimalField(null=True, max_digits=20, decimal_places=3, db_index=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='meeting',
+            index_together=set([('hub', 'is_complete', 'roster_seq'), ('project', 'start_time'),
+                                ('hub', 'start_time')]),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('openbadge', '0010_meeting_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meeting',
+            name='queued_index',
+            field=models.BigIntegerField(null=True, blank=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('openbadge', '0011_meeting_queued_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='meetings_reset_version',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -3,24 +3,33 @@ import datetime
 import os
 import pytz
 import random
-import json as simplejson
 import string
 import time
 
 
+from collections import Counter
 from decimal import Decimal
 
 from django.utils import timezone
 from django.conf import settings
 from django.contrib.auth import models as auth_models
 from django.core.files.storage import FileSystemStorage
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
 from jsonfield import JSONField
 from math import floor
 
+from . import chunkindex, datastore, hubcache
+from .chunklog import LogReader
+
+
+_random = random.SystemRandom()
+
 
 def key_generator(size=10, chars=string.ascii_uppercase + string.digits):
-    return ''.join(random.choice(chars) for _ in range(size))
+    return ''.join(_random.choice(chars) for _ in range(size))
 
 
 class BaseModel(models.Model):
@@ -33,17 +42,51 @@ class BaseModel(models.Model):
     date_created = models.DateTimeField(auto_now_add=True)
     date_updated = models.DateTimeField(auto_now=True)
 
+    KEY_RETRIES = 3
+    """How many keys save and bulk_create_with_keys try before giving up"""
+
     def generate_key(self, length=10):
+        """
+        Gives the instance a random key if it has none. With 36**10 possible keys a clash with an existing row is
+        too unlikely to look for on every save: the unique index refuses it, and save and bulk_create_with_keys retry.
+        """
         if not self.key:
-            for _ in range(10):
-                key = key_generator(length)
-                if not type(self).objects.filter(key=key).count():
-                    self.key = key
-                    break
+            self.key = key_generator(length)
+
+    @classmethod
+    def bulk_create_with_keys(cls, objs, batch_size=None, retries=KEY_RETRIES):
+        """bulk_create, giving the objects keys first. If a key turns out to be taken, tries again with new ones"""
+        for obj in objs:
+            obj.generate_key()
+        for attempt in range(retries):
+            try:
+                with transaction.atomic():
+                    return cls.objects.bulk_create(objs, batch_size=batch_size)
+            except IntegrityError:
+                keys = [obj.key for obj in objs]
+                clashes = set(cls.objects.filter(key__in=keys).values_list("key", flat=True))
+                clashes.update(key for key, count in Counter(keys).items() if count > 1)
+                if not clashes or attempt == retries - 1:
+                    raise
+                for obj in objs:
+                    if obj.key in clashes:
+                        obj.key = key_generator(len(obj.key))
 
     def save(self, *args, **kwargs):
+        """saves, giving a new object a key first. If that key turns out to be taken, tries again with new ones"""
+        if self.pk is not None or self.key:
+            self.generate_key()
+            return super(BaseModel, self).save(*args, **kwargs)
+
         self.generate_key()
-        super(BaseModel, self).save(*args, **kwargs)
+        for attempt in range(self.KEY_RETRIES):
+            try:
+                with transaction.atomic():
+                    return super(BaseModel, self).save(*args, **kwargs)
+            except IntegrityError:
+                if attempt == self.KEY_RETRIES - 1 or not type(self).objects.filter(key=self.key).exists():
+                    raise
+                self.key = key_generator(len(self.key))
 
     class Meta:
         abstract = True
@@ -116,9 +159,51 @@ class Project(BaseModel):
     name = models.CharField(max_length=64)
     """Human readable identifier for this project (Apple, Google, etc.)"""
 
+    member_sync_seq = models.BigIntegerField(default=0)
+    """Bumped every time one of the project's members is saved, see Member.sync_seq"""
+
+    roster_version = models.BigIntegerField(default=0)
+    """Bumped whenever the project's members, hubs or completed meetings change, for the ETags of /projects and /hubs"""
+
+    roster_updated = models.DateTimeField(default=timezone.now)
+    """When roster_version was last bumped"""
+
+    meetings_reset_version = models.BigIntegerField(default=0)
+    """The roster_version a completed meeting last left its hub's completed meetings at, see Hub.get_object"""
+
+    COUNTERS = ("member_sync_seq", "roster_version", "roster_updated", "meetings_reset_version")
+    """Only ever moved by UPDATEs (next_member_sync_seq, touch_rosters), never by saving the project"""
+
     def __unicode__(self):
         return unicode(self.name)
 
+    def save(self, *args, **kwargs):
+        # an instance read before a member or hub was saved mustn't put the counters back
+        if self.pk is not None and kwargs.get("update_fields") is None and not kwargs.get("force_insert"):
+            kwargs["update_fields"] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in self.COUNTERS]
+        super(Project, self).save(*args, **kwargs)
+
+    @classmethod
+    def next_member_sync_seq(cls, project_id):
+        """bumps the project's member_sync_seq for a member about to be saved, call inside a transaction"""
+        # the UPDATE locks the project row until commit, so members commit in sync_seq order
+        cls.objects.filter(pk=project_id).update(member_sync_seq=F("member_sync_seq") + 1)
+        return cls.objects.values_list("member_sync_seq", flat=True).get(pk=project_id)
+
+    @classmethod
+    def touch_rosters(cls, project_ids):
+        """bumps the roster_version of the given projects"""
+        if project_ids:
+            cls.objects.filter(pk__in=project_ids).update(roster_version=F("roster_version") + 1,
+                                                          roster_updated=timezone.now())
+
+    @classmethod
+    def reset_meetings(cls, project_ids):
+        """makes hubs with an older meeting_cursor get all their completed meetings again, call after touch_rosters"""
+        if project_ids:
+            cls.objects.filter(pk__in=project_ids).update(meetings_reset_version=F("roster_version"))
+
     def get_meetings(self, file):
         return {
             'meetings': {
@@ -170,37 +255,60 @@ class Hub(BaseModel):
     last_hub_time_ts = models.DecimalField(max_digits=20, decimal_places=3, default=Decimal(0))
     """ The clock time of the hub at the time of the last API request """
 
-    def get_object(self, last_update = None):
-        if last_update:
-            return {
-                "name": self.name,
-                "meetings": self.get_completed_meetings(),
-                "is_god": self.god,
-                'badge_map': {
-                    member.badge: {
-                        "name": member.name,
-                        "key": member.key
-                    } for member in self.project.members.all()
-                        if int(member.date_updated.strftime("%s")) > last_update
-                },
-                'members': {
-                    member.name: member.to_dict() for member in self.project.members.all()
-                            if int(member.date_updated.strftime("%s")) > last_update},
-                }
-        else:
-            return {
-                "name": self.name,
-                "meetings": self.get_completed_meetings(),
-                "is_god": self.god
-            }
+    def roster_state(self):
+        """what of this hub shows up in GET /:project/hubs"""
+        return self.project_id, self.name, self.god
+
+    def get_object(self, last_update=None, sync_token=None, meeting_cursor=None):
+        """
+        Hub metadata, plus the members of its project that changed since sync_token (a member_sync_token from an
+        earlier response) or, failing that, since the POSIX timestamp last_update. The completed meetings are all of
+        them (meetings_reset), or those changed since meeting_cursor (a meeting_cursor from an earlier response) unless
+        one was deleted or reopened since.
+        """
+        # read before the members and meetings, so one saved in between is sent again next time rather than missed
+        sync_seq, roster_version, reset_version = Project.objects.values_list(
+            "member_sync_seq", "roster_version", "meetings_reset_version").get(pk=self.project_id)
+        if meeting_cursor is not None and meeting_cursor < reset_version:
+            # a listed meeting is gone, only the whole list tells the hub which
+            meeting_cursor = None
+        obj = {
+            "name": self.name,
+            "meetings": self.get_completed_meetings(meeting_cursor),
+            "meetings_reset": meeting_cursor is None,
+            "meeting_cursor": str(roster_version),
+            "is_god": self.god,
+            "member_sync_token": str(sync_seq),
+        }
 
-    def get_completed_meetings(self):
+        if sync_token is not None:
+            if sync_token >= sync_seq:
+                # nothing changed, no need to ask
+                members = Member.objects.none()
+            else:
+                members = Member.objects.filter(project_id=self.project_id, sync_seq__gt=sync_token)
+        elif last_update:
+            since = datetime.datetime.fromtimestamp(last_update, pytz.utc)
+            members = Member.objects.filter(project_id=self.project_id, date_updated__gt=since)
+        else:
+            return obj
+
+        members = list(members.only("id", "key", "name", "badge"))
+        obj["badge_map"] = {member.badge: {"name": member.name, "key": member.key} for member in members}
+        obj["members"] = {member.name: member.to_dict() for member in members}
+        return obj
+
+    def get_completed_meetings(self, since=None):
+        """the hub's completed meetings, or only those completed or changed since the roster_version `since`"""
+        meetings = Meeting.objects.filter(hub_id=self.pk, is_complete=True)
+        if since is not None:
+            meetings = meetings.filter(roster_seq__gt=since)
         return {
-            meeting.key: {
-                "last_log_timestamp": meeting.last_update_timestamp,
-                "last_log_serial": meeting.last_update_index,
-                "is_complete": meeting.is_complete
-            } for meeting in self.meetings.all() if meeting.is_complete
+            meeting["key"]: {
+                "last_log_timestamp": meeting["last_update_timestamp"],
+                "last_log_serial": meeting["last_update_index"],
+                "is_complete": True
+            } for meeting in meetings.values("key", "last_update_timestamp", "last_update_index")
         }
 
     def __unicode__(self):
@@ -208,6 +316,13 @@ class Hub(BaseModel):
         return unicode(self.name)
 
 
+@receiver(post_save, sender=Hub)
+@receiver(post_delete, sender=Hub)
+def forget_cached_hub(sender, instance, **kwargs):
+    """a saved hub may have been renamed or moved to another project, see hubcache.py"""
+    hubcache.forget(instance.uuid)
+
+
 class Member(BaseModel):
     """Definition of a Member, who belongs to a Project, and owns a badge"""
 
@@ -224,6 +339,17 @@ class Member(BaseModel):
 
     project = models.ForeignKey(Project, related_name="members")
 
+    sync_seq = models.BigIntegerField(default=0)
+    """The project's member_sync_seq as of the last save, hubs sync the members changed since their last token"""
+
+    class Meta:
+        index_together = (("project", "date_updated"), ("project", "sync_seq"))
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            self.sync_seq = Project.next_member_sync_seq(self.project_id)
+            super(Member, self).save(*args, **kwargs)
+
     @classmethod
     def datetime_to_epoch(cls, d):
         """
@@ -244,6 +370,115 @@ class Member(BaseModel):
         """
         return cls.datetime_to_epoch(timezone.datetime.now_utc())
 
+    STATUS_FIELDS = (
+        ("last_audio_ts", ("last_audio_ts_fract",)),
+        ("last_proximity_ts", ()),
+        ("last_seen_ts", ("last_voltage",)),
+    )
+    """The status timestamps a hub reports for a badge, with the values that are only taken along with them"""
+
+    @classmethod
+    def apply_statuses(cls, statuses, project_id=None):
+        """
+        Applies badge status reports, dicts with the badge's "key" and any of STATUS_FIELDS. A timestamp (and the
+        values that go with it) only replaces an older one, in a single conditional UPDATE for all the badges, so
+        concurrent reports need no locks. Returns {key: [the timestamps that moved forward]} as of just before the
+        UPDATE, leaving out keys with no badge (in the project).
+        """
+        latest = cls._latest_statuses(statuses)
+        members = cls.objects.filter(key__in=list(latest.keys()))
+        if project_id is not None:
+            members = members.filter(project_id=project_id)
+        current = {member["key"]: member
+                   for member in members.values("id", "key", *[field for field, _ in cls.STATUS_FIELDS])}
+
+        results = {}
+        whens = {}
+        for key, report in latest.items():
+            if key not in current:
+                continue
+            results[key] = []
+            for field, _ in cls.STATUS_FIELDS:
+                if field not in report or report[field][0] <= current[key][field]:
+                    continue
+                value, companions = report[field]
+                results[key].append(field)
+                # another hub may have got there since the read, the UPDATE itself never goes backwards
+                condition = {"key": key, field + "__lt": value}
+                whens.setdefault(field, []).append(When(then=Value(value), **condition))
+                for name, companion in companions.items():
+                    whens.setdefault(name, []).append(When(then=Value(companion), **condition))
+
+        if whens:
+            cls.objects.filter(key__in=[key for key, moved in results.items() if moved]).update(
+                **cls._status_cases(whens))
+
+        # keep the history too, one sample per badge seen since its last report
+        BadgeSample.objects.bulk_create([
+            BadgeSample(member_id=current[key]["id"], seen_ts=latest[key]["last_seen_ts"][0],
+                        voltage=latest[key]["last_seen_ts"][1].get("last_voltage"),
+                        minute_start=int(latest[key]["last_seen_ts"][0]) // 60 * 60)
+            for key, moved in results.items() if "last_seen_ts" in moved
+        ])
+        return results
+
+    def apply_status(self, status):
+        """
+        apply_statuses for this one badge, a single UPDATE guarded by the timestamps so a report another hub already
+        made changes nothing (and records no sample). Moves this instance's fields along and returns the timestamps
+        that moved forward.
+        """
+        report = self._latest_statuses([status]).get(self.key, {})
+        moved = [field for field, _ in self.STATUS_FIELDS
+                 if field in report and report[field][0] > getattr(self, field)]
+        if not moved:
+            return []
+
+        whens = {}
+        guard = models.Q()
+        for field in moved:
+            value, companions = report[field]
+            guard |= models.Q(**{field + "__lt": value})
+            whens[field] = [When(then=Value(value), **{field + "__lt": value})]
+            for name, companion in companions.items():
+                whens[name] = [When(then=Value(companion), **{field + "__lt": value})]
+        if not Member.objects.filter(guard, pk=self.pk).update(**self._status_cases(whens)):
+            # another hub got there first
+            return []
+
+        for field in moved:
+            value, companions = report[field]
+            setattr(self, field, value)
+            for name, companion in companions.items():
+                setattr(self, name, companion)
+        if "last_seen_ts" in moved:
+            seen_ts, companions = report["last_seen_ts"]
+            BadgeSample.objects.create(member_id=self.pk, seen_ts=seen_ts, voltage=companions.get("last_voltage"),
+                                       minute_start=int(seen_ts) // 60 * 60)
+        return moved
+
+    @classmethod
+    def _latest_statuses(cls, statuses):
+        """{key: {field: (value, {companion: value})}}, the latest of each timestamp wins for a badge reported twice"""
+        latest = {}
+        for status in statuses:
+            report = latest.setdefault(status["key"], {})
+            for field, companions in cls.STATUS_FIELDS:
+                value = status.get(field)
+                if value is not None and (field not in report or value > report[field][0]):
+                    report[field] = value, {name: status[name] for name in companions if status.get(name) is not None}
+        return latest
+
+    @classmethod
+    def _status_cases(cls, whens):
+        """UPDATE arguments setting each field by its Whens, leaving it as it is otherwise"""
+        return {name: Case(*field_whens, default=F(name), output_field=cls._meta.get_field(name))
+                for name, field_whens in whens.items()}
+
+    def roster_state(self):
+        """what of this member shows up in the project's badge_map and members"""
+        return self.project_id, self.key, self.name, self.badge
+
     def to_dict(self):
         return dict(id=self.id,
                     name=self.name,
@@ -265,7 +500,7 @@ class Meeting(BaseModel):
     uuid = models.CharField(max_length=64, db_index=True, unique=True)
     """this will be something the phone can generate and give us, like [hub_uuid]-[start_time]"""
 
-    start_time = models.DecimalField(decimal_places=3, max_digits= 20, null=True)
+    start_time = models.DecimalField(decimal_places=3, max_digits= 20, null=True, db_index=True)
     """time they hit start"""
 
     end_time = models.DecimalField(decimal_places=3, max_digits= 20, null=True, blank=True)
@@ -291,49 +526,76 @@ class Meeting(BaseModel):
     hub = models.ForeignKey(Hub, related_name="meetings")
     """Used when checking if there are meetings we don't have"""
 
-    def __unicode__(self):
-        return unicode(self.project.name + "|" + str(self.start_time))
+    header = JSONField(null=True, blank=True)
+    """The log's first line plus the "members" who joined before any data, kept so get_meta doesn't open the log"""
 
-    def get_chunks(self):
-        """open and read this meeting's log_file"""
+    header_complete = models.BooleanField(default=False)
+    """Whether the log has got past its header lines, after which header can't change"""
 
-        chunks = []
+    roster_seq = models.BigIntegerField(default=0)
+    """The project's roster_version as of the meeting's last change to what hubs see, for Hub.get_completed_meetings"""
 
-        f = self.log_file
+    queued_index = models.BigIntegerField(null=True, blank=True)
+    """log_index of the last chunk POSTed onto the ingest queue, until the log is replaced or a queued post fails"""
 
-        f.readline()  # the first line will be info about the meeting
-        
+    class Meta:
+        # the rest are for the admin's meeting list, filtered by project or hub and date
+        index_together = (("hub", "is_complete", "roster_seq"), ("project", "start_time"), ("hub", "start_time"))
 
-        for line in f.readlines():
-            try:
-                chunk = simplejson.loads(line)
-                chunks.append(chunk)
-            except Exception:
-                #TODO this means we have some broken data or something,
-                # do we want to log an error or do something about it
-                pass
+    def __unicode__(self):
+        return unicode(self.project.name + "|" + str(self.start_time))
 
-        f.seek(0)
-        return chunks
+    def next_log_index(self):
+        """the log_index the next POSTed chunks have to start at, counting those still on the ingest queue"""
+        last = self.last_update_index
+        if self.queued_index is not None and self.queued_index > last:
+            last = self.queued_index
+        return last + 1
+
+    def roster_state(self):
+        """what of this meeting shows up in its hub's completed meetings, nothing until it is complete"""
+        if not self.is_complete:
+            return None
+        return self.project_id, self.hub_id, self.key, self.last_update_timestamp, self.last_update_index
+
+    def get_chunks(self, start=None, end=None):
+        """
+        read this meeting's log_file lazily, one chunk at a time (see chunklog.LogReader).
+        start and end optionally limit the chunks to a log_timestamp range, read using the log's chunkindex
+        """
+        return datastore.iter_chunks(self.log_file.path, datastore.FORMAT_JSON, start, end, skip_first_line=True)
+
+    def parse_header(self):
+        """(re)reads header from log_file, for when the whole log has been replaced"""
+        self.header = None
+        self.header_complete = False
+        with LogReader(self.log_file.path) as log:
+            self.update_header(log.iter_chunks())
+
+    def update_header(self, chunks):
+        """folds decoded chunks appended to the log into header, up to the first data chunk"""
+        for chunk in chunks:
+            if self.header_complete:
+                return
+            chunk_type = chunk.get("type", "")
+            if self.header is None:
+                self.header = dict(chunk, members=[])
+            elif "received" in chunk_type or "ended" in chunk_type:
+                self.header_complete = True
+            elif "member" in chunk_type and chunk["data"]["change"] == "join":
+                # the following few lines are members joining
+                self.header["members"].append(chunk["data"]["member_key"])
 
     def get_meta(self):
         """return the metadata for this meeting object"""
 
-        f = self.log_file
-        meta = simplejson.loads(f.readline())
-        line_type = meta["type"]
-        meta["members"] = []
-
-        # the following few lines are members joining
-        line = simplejson.loads(f.readline())
-        #TODO meetings with no data break this
-        while "received" not in line["type"] and "ended" not in line["type"]:
-            if "member" in line["type"] and line["data"]["change"] == "join":
-                meta["members"].append(line["data"]["member_key"])
-            try:
-                line = simplejson.loads(f.readline())
-            except ValueError as e:
-                break
+        if self.header is None:
+            # uploaded before the header was kept in the database
+            self.parse_header()
+            self.save(update_fields=["header", "header_complete"])
+
+        meta = dict(self.header)
+        meta["members"] = list(self.header["members"])
 
         #grab some additional metadata from the object
         meta['key'] = self.key
@@ -345,10 +607,16 @@ class Meeting(BaseModel):
         if self.is_complete:
             meta['end_time'] = float(self.end_time)
 
-        #return file pointer to beginning
-        f.seek(0)
         return meta
 
+    def get_high_water_mark(self):
+        """how much of this meeting's log the server has, so a hub knows where to resume uploading"""
+        return {
+            "last_log_index": self.last_update_index,
+            "last_log_timestamp": float(self.last_update_timestamp) if self.last_update_timestamp is not None else None,
+            "log_size": self.log_file.size if self.log_file else 0,
+        }
+
     def to_object(self, file):
         """Get an representation of this object for use with HTTP responses"""
 
@@ -356,12 +624,121 @@ class Meeting(BaseModel):
 
         if file:
             return {
-                "chunks": self.get_chunks(),
+                "chunks": list(self.get_chunks()),
                 "metadata":meta
             }
 
         return { "metadata": meta }
 
+
+class BadgeSample(models.Model):
+    """
+    One status report of a badge, kept for a while so battery drain and drop-outs can be looked at later.
+    Written in bulk by Member.apply_statuses, rolled up into BadgeRollups and pruned by `manage.py rollup_telemetry`.
+    """
+
+    member = models.ForeignKey(Member, related_name="samples")
+
+    seen_ts = models.DecimalField(max_digits=20, decimal_places=3, db_index=True)
+    """The badge's reported last_seen_ts"""
+
+    voltage = models.DecimalField(max_digits=5, decimal_places=3, null=True)
+    """The voltage reported along with it, if any"""
+
+    minute_start = models.BigIntegerField()
+    """seen_ts rounded down to the minute, what the 1-minute rollups group by"""
+
+    class Meta:
+        index_together = (("member", "seen_ts"),)
+
+
+class BadgeRollup(models.Model):
+    """A badge's samples over a minute or an hour, see telemetry.py"""
+
+    member = models.ForeignKey(Member, related_name="rollups")
+
+    resolution = models.IntegerField()
+    """Length of the period in seconds, 60 or 3600"""
+
+    period_start = models.BigIntegerField()
+    """Start of the period, epoch seconds"""
+
+    hour_start = models.BigIntegerField()
+    """period_start rounded down to the hour, what the 1-hour rollups group by"""
+
+    sample_count = models.IntegerField()
+    voltage_count = models.IntegerField()
+    """Number of samples with a voltage, voltage_sum / voltage_count is the mean"""
+
+    voltage_sum = models.DecimalField(max_digits=16, decimal_places=3, null=True)
+    voltage_min = models.DecimalField(max_digits=5, decimal_places=3, null=True)
+    voltage_max = models.DecimalField(max_digits=5, decimal_places=3, null=True)
+    first_seen_ts = models.DecimalField(max_digits=20, decimal_places=3)
+    last_seen_ts = models.DecimalField(max_digits=20, decimal_places=3)
+
+    class Meta:
+        unique_together = (("member", "resolution", "period_start"),)
+        index_together = (("resolution", "period_start"),)
+
+    def to_dict(self):
+        return {
+            "period_start": self.period_start,
+            "samples": self.sample_count,
+            "voltage_min": self.voltage_min,
+            "voltage_max": self.voltage_max,
+            "voltage_mean": self.voltage_sum / self.voltage_count if self.voltage_count else None,
+            "first_seen_ts": self.first_seen_ts,
+            "last_seen_ts": self.last_seen_ts,
+        }
+
+
+ROSTER_MODELS = (Hub, Member, Meeting)
+_UNKNOWN = object()
+
+
+def remember_roster_state(sender, instance, **kwargs):
+    instance._roster = instance.project_id, instance.roster_state()
+
+
+def touch_roster_on_save(sender, instance, created, **kwargs):
+    """bumps the roster_version of the projects the instance was in and is in now, if it changed what they show"""
+    # instances loaded with .only() are of a deferred subclass, which gets no post_init: they count as changed
+    project_id, state = (None, None) if created else getattr(instance, "_roster", (None, _UNKNOWN))
+    if instance.roster_state() != state:
+        Project.touch_rosters([pk for pk in set([project_id, instance.project_id]) if pk is not None])
+        if isinstance(instance, Meeting):
+            if state is not None and (state is _UNKNOWN or instance.roster_state() is None
+                                      or instance.roster_state()[:2] != state[:2]):
+                # reopened, or moved to another hub
+                Project.reset_meetings([project_id if project_id is not None else instance.project_id])
+            # the project row stays locked until commit, so meetings commit in roster_seq order
+            instance.roster_seq = Project.objects.values_list("roster_version", flat=True).get(
+                pk=instance.project_id)
+            Meeting.objects.filter(pk=instance.pk).update(roster_seq=instance.roster_seq)
+    instance._roster = instance.project_id, instance.roster_state()
+
+
+def touch_roster_on_delete(sender, instance, **kwargs):
+    if instance.roster_state() is not None:
+        Project.touch_rosters([instance.project_id])
+        if isinstance(instance, Meeting):
+            Project.reset_meetings([instance.project_id])
+
+
+# connected per model: a receiver for every sender would also cost every other model Django's fast deletes
+for roster_model in ROSTER_MODELS:
+    post_init.connect(remember_roster_state, sender=roster_model)
+    post_save.connect(touch_roster_on_save, sender=roster_model)
+    post_delete.connect(touch_roster_on_delete, sender=roster_model)
+
+
+@receiver(post_save, sender=Project)
+def touch_project_roster(sender, instance, created, **kwargs):
+    """a renamed project changes GET /projects and /hubs, a new one has no hubs to tell"""
+    if not created:
+        Project.touch_rosters([instance.pk])
+
+
 class DataFile(BaseModel):
     """
     Manage a single data file - data is provided by the Python Hubs
@@ -384,6 +761,11 @@ class DataFile(BaseModel):
     filepath = models.CharField(max_length=65, unique=True, blank=True)
     """Local reference to log file"""
 
+    storage_format = models.CharField(max_length=16, default=datastore.FORMAT_JSON,
+                                      choices=((datastore.FORMAT_JSON, "JSON lines"),
+                                               (datastore.FORMAT_PACKED, "Packed binary")))
+    """How the chunks in filepath are stored, see datastore.py"""
+
     hub = models.ForeignKey(Hub, related_name="data")
     """The Hub this DataFile belongs to"""
 
@@ -393,11 +775,57 @@ class DataFile(BaseModel):
     def __unicode__(self):
         return unicode(self.hub.name + "_" + str(self.data_type) + "_data")
 
+    def segment_folder(self):
+        """folder this DataFile's segments are written to, next to the unsegmented file at filepath"""
+        return os.path.splitext(self.filepath)[0]
+
+    def get_segments(self, start=None, end=None, from_index=None, to_index=None):
+        """
+        this DataFile's segments, oldest first, leaving out those entirely before start or after end,
+        or entirely outside the log_index range from_index..to_index
+        """
+        segments = self.segments.order_by("id")
+        if start is not None:
+            segments = segments.filter(last_log_timestamp__gte=start)
+        if end is not None:
+            segments = segments.filter(first_log_timestamp__lte=end)
+        if from_index is not None:
+            segments = segments.filter(last_log_index__gte=from_index)
+        if to_index is not None:
+            segments = segments.filter(first_log_index__lte=to_index)
+        return segments
+
+    def get_chunks(self, start=None, end=None, from_index=None, to_index=None):
+        """
+        read this DataFile's chunks, one at a time, whatever format they are stored in.
+        start and end optionally limit the chunks to a log_timestamp range, from_index and to_index to a
+        log_index range; segments outside them aren't opened, and each segment's chunkindex is used to
+        skip to the part of it that is needed
+        """
+        # the unsegmented file has no metadata, so always has to be read
+        paths = [(self.filepath, self.storage_format)]
+        paths.extend((segment.filepath, segment.storage_format)
+                     for segment in self.get_segments(start, end, from_index, to_index))
+
+        filter_index = from_index is not None or to_index is not None
+        for path, storage_format in paths:
+            for chunk in datastore.iter_chunks(path, storage_format, start, end):
+                if filter_index:
+                    log_index = chunk.get("log_index")
+                    if log_index is None or (from_index is not None and log_index < from_index) \
+                            or (to_index is not None and log_index > to_index):
+                        continue
+                yield chunk
+
+    def open_writer(self):
+        """returns a writer that appends to this DataFile's segments, saving the DataFile first if it is new"""
+        return datastore.SegmentedWriter(self, settings.DATAFILE_SEGMENT_SECONDS, settings.DATAFILE_SEGMENT_MAX_SIZE)
+
     def get_meta(self):
         """creates a json object of the metadata for this DataFile"""
         return {
-            'last_update_index': self.last_update_index,
-            'log_timestamp': self.last_update_timestamp,
+            'data_type': self.data_type,
+            'log_timestamp': float(self.last_update_timestamp) if self.last_update_timestamp is not None else None,
             'hub': self.hub.name
         }
 
@@ -406,9 +834,94 @@ class DataFile(BaseModel):
         """Get a representation of this object for use with HTTP responses"""
         if file:
             return {
-                "chunks": self.get_chunks(),
+                "chunks": list(self.get_chunks()),
                 "metadata": self.get_meta()
             }
         else:
-            return { "metadata": meta }
+            return { "metadata": self.get_meta() }
+
+
+class DataFileSegment(BaseModel):
+    """
+    A time-bounded piece of a DataFile, see datastore.SegmentedWriter.
+    Readers and retention jobs use the ranges below to find the segments they need without opening them.
+    """
+
+    datafile = models.ForeignKey(DataFile, related_name="segments")
+    """The DataFile this is a segment of"""
+
+    filepath = models.CharField(max_length=255, unique=True)
+    """Local reference to the segment file"""
+
+    storage_format = models.CharField(max_length=16, default=datastore.FORMAT_JSON,
+                                      choices=((datastore.FORMAT_JSON, "JSON lines"),
+                                               (datastore.FORMAT_PACKED, "Packed binary")))
+    """How the chunks in filepath are stored, see datastore.py"""
+
+    period_start = models.BigIntegerField(default=0)
+    """Start (unix time) of the period this segment was started for"""
+
+    first_log_timestamp = models.DecimalField(decimal_places=3, max_digits=20, null=True, blank=True)
+    """Lowest log_timestamp in the segment"""
+
+    last_log_timestamp = models.DecimalField(decimal_places=3, max_digits=20, null=True, blank=True)
+    """Highest log_timestamp in the segment"""
+
+    first_log_index = models.IntegerField(null=True, blank=True)
+    """Lowest log_index in the segment"""
+
+    last_log_index = models.IntegerField(null=True, blank=True)
+    """Highest log_index in the segment"""
+
+    chunk_count = models.IntegerField(default=0)
+    """Number of chunks in the segment"""
+
+    size = models.BigIntegerField(default=0)
+    """Size of the segment file in bytes"""
+
+    class Meta:
+        index_together = (("datafile", "first_log_timestamp"), ("datafile", "last_log_timestamp"))
+
+    def __unicode__(self):
+        return unicode(os.path.basename(self.filepath))
+
+    def add_chunk(self, log_timestamp, log_index, size):
+        """records a chunk appended to the segment file, which is now `size` bytes"""
+        if log_timestamp is not None:
+            if self.first_log_timestamp is None or log_timestamp < self.first_log_timestamp:
+                self.first_log_timestamp = log_timestamp
+            if self.last_log_timestamp is None or log_timestamp > self.last_log_timestamp:
+                self.last_log_timestamp = log_timestamp
+        if log_index is not None:
+            if self.first_log_index is None or log_index < self.first_log_index:
+                self.first_log_index = log_index
+            if self.last_log_index is None or log_index > self.last_log_index:
+                self.last_log_index = log_index
+        self.chunk_count += 1
+        self.size = size
+
+    def save_added(self, chunks_added):
+        """
+        saves what add_chunk recorded for the last `chunks_added` chunks, merged under a row lock with what
+        other writers appending to the segment saved in the meantime rather than overwriting it
+        """
+        with transaction.atomic():
+            row = DataFileSegment.objects.select_for_update().filter(pk=self.pk).first()
+            if row is None:
+                # pruned while we were writing
+                return
+            for name, pick in (("first_log_timestamp", min), ("last_log_timestamp", max),
+                               ("first_log_index", min), ("last_log_index", max)):
+                values = [value for value in (getattr(row, name), getattr(self, name)) if value is not None]
+                setattr(self, name, pick(values) if values else None)
+            self.chunk_count = row.chunk_count + chunks_added
+            self.size = max(row.size, self.size)
+            self.save(update_fields=["first_log_timestamp", "last_log_timestamp", "first_log_index",
+                                     "last_log_index", "chunk_count", "size"])
+
+    def delete_file(self):
+        """removes the segment file and its index, the row is left to the caller"""
+        if os.path.exists(self.filepath):
+            os.remove(self.filepath)
+        chunkindex.remove(self.filepath)
     
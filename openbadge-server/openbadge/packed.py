@@ -0,0 +1,404 @@
+"""
+Packed binary storage for DataFile chunks.
+
+A packed file starts with a small self-describing header:
+
+    b"OBPK" | version (uint8) | header length (uint16) | header (JSON)
+
+and is followed by one record per chunk:
+
+    record length (uint32) | log_timestamp (float64) | log_index (int64) | flags (uint8)
+    [ sample width (uint8) | sample count (varint) | samples ]            if flags & HAS_SAMPLES
+    [ entry count (varint) | (badge id, count, zigzag rssi) varints ]     if flags & HAS_RSSI
+    rest of the chunk (tagged values, see encode_value)
+
+log_timestamp and log_index are only stored in the head when they are numbers (log_index an int64);
+legacy chunks where they are missing, null or something else keep them as they are in the rest.
+
+All fixed-width integers are little-endian. The columns hubs always send are stored at fixed
+width, audio sample arrays are stored as the narrowest signed integer column that fits them
+(so they decode with array instead of a python loop) and proximity rssi_distances are stored as
+varints. Everything else is kept in a small tagged encoding, so chunks of any shape round-trip
+to the same dict the JSON format gives back.
+"""
+import struct
+import sys
+from array import array
+
+import simplejson
+
+MAGIC = b"OBPK"
+VERSION = 2
+"""2 added RAW_TIMESTAMP, version 1 files are read the same way"""
+
+HAS_LOG_INDEX = 0x01
+HAS_SAMPLES = 0x02
+HAS_RSSI = 0x04
+RAW_TIMESTAMP = 0x08
+"""log_timestamp is not a number, the head's is a placeholder and the chunk's own (if any) is in the rest"""
+
+INT64_MIN, INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+PREAMBLE = struct.Struct("<4sBH")
+RECORD_LENGTH = struct.Struct("<I")
+RECORD_HEAD = struct.Struct("<dqB")
+FLOAT = struct.Struct("<d")
+
+SAMPLE_WIDTHS = (
+    (1, "b", -2 ** 7, 2 ** 7 - 1),
+    (2, "h", -2 ** 15, 2 ** 15 - 1),
+    (4, "i", -2 ** 31, 2 ** 31 - 1),
+)
+"""(width in bytes, array typecode, min, max) for the sample columns, narrowest first"""
+SAMPLE_TYPECODES = dict((width, typecode) for width, typecode, _, _ in SAMPLE_WIDTHS)
+
+TAG_NULL, TAG_FALSE, TAG_TRUE, TAG_INT, TAG_FLOAT, TAG_STR, TAG_LIST, TAG_DICT, TAG_KNOWN = range(9)
+
+KNOWN_STRINGS = (
+    "type", "data", "timestamp", "member", "voltage", "badge_address", "sample_period", "num_samples",
+    "samples", "rssi_distances", "count", "rssi", "audio received", "proximity received",
+)
+"""Keys and values that show up in nearly every chunk. Stored as a one byte reference; append only!"""
+KNOWN_STRING_IDS = dict((s, i) for i, s in enumerate(KNOWN_STRINGS))
+
+
+class PackedFormatError(ValueError):
+    """Raised when a file or record is not in the packed format"""
+    pass
+
+
+def _write_varint(out, value):
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(buf, pos):
+    result = 0
+    shift = 0
+    while True:
+        try:
+            byte = buf[pos]
+        except IndexError:
+            raise PackedFormatError("truncated varint")
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _zigzag(value):
+    return (value << 1) if value >= 0 else ((-value) << 1) - 1
+
+
+def _unzigzag(value):
+    return (value >> 1) if not value & 1 else -((value + 1) >> 1)
+
+
+def _is_int(value):
+    return isinstance(value, (int, long)) and not isinstance(value, bool)
+
+
+def _is_number(value):
+    return _is_int(value) or isinstance(value, float)
+
+
+def chunk_position(chunk):
+    """
+    (log_timestamp, log_index) of a chunk as they are stored in the head of its record: log_timestamp is None
+    if it is missing or not a number, log_index is None if it is missing or not an int64
+    """
+    log_timestamp = chunk.get("log_timestamp")
+    log_index = chunk.get("log_index")
+    return (float(log_timestamp) if _is_number(log_timestamp) else None,
+            log_index if _is_int(log_index) and INT64_MIN <= log_index <= INT64_MAX else None)
+
+
+def encode_value(out, value):
+    """Appends a JSON-compatible value to out in the tagged encoding"""
+    if value is None:
+        out.append(TAG_NULL)
+    elif value is True:
+        out.append(TAG_TRUE)
+    elif value is False:
+        out.append(TAG_FALSE)
+    elif _is_int(value):
+        out.append(TAG_INT)
+        _write_varint(out, _zigzag(value))
+    elif isinstance(value, float):
+        out.append(TAG_FLOAT)
+        out.extend(FLOAT.pack(value))
+    elif isinstance(value, basestring):
+        if value in KNOWN_STRING_IDS:
+            out.append(TAG_KNOWN)
+            out.append(KNOWN_STRING_IDS[value])
+        else:
+            encoded = value.encode("utf-8") if isinstance(value, unicode) else value
+            out.append(TAG_STR)
+            _write_varint(out, len(encoded))
+            out.extend(encoded)
+    elif isinstance(value, (list, tuple)):
+        out.append(TAG_LIST)
+        _write_varint(out, len(value))
+        for item in value:
+            encode_value(out, item)
+    elif isinstance(value, dict):
+        out.append(TAG_DICT)
+        _write_varint(out, len(value))
+        for key, item in value.items():
+            encode_value(out, key)
+            encode_value(out, item)
+    else:
+        # anything else (e.g. Decimal) is stored the way the JSON format would store it
+        encode_value(out, simplejson.loads(simplejson.dumps(value)))
+
+
+def decode_value(buf, pos):
+    """Reads one tagged value from buf at pos. Returns (value, new position)"""
+    try:
+        tag = buf[pos]
+    except IndexError:
+        raise PackedFormatError("truncated record")
+    pos += 1
+
+    if tag == TAG_NULL:
+        return None, pos
+    if tag == TAG_TRUE:
+        return True, pos
+    if tag == TAG_FALSE:
+        return False, pos
+    if tag == TAG_INT:
+        value, pos = _read_varint(buf, pos)
+        return _unzigzag(value), pos
+    if tag == TAG_FLOAT:
+        if pos + FLOAT.size > len(buf):
+            raise PackedFormatError("truncated record")
+        return FLOAT.unpack_from(bytes(buf[pos:pos + FLOAT.size]))[0], pos + FLOAT.size
+    if tag == TAG_KNOWN:
+        try:
+            return KNOWN_STRINGS[buf[pos]], pos + 1
+        except IndexError:
+            raise PackedFormatError("unknown string reference")
+    if tag == TAG_STR:
+        length, pos = _read_varint(buf, pos)
+        if pos + length > len(buf):
+            raise PackedFormatError("truncated record")
+        return bytes(buf[pos:pos + length]).decode("utf-8"), pos + length
+    if tag == TAG_LIST:
+        length, pos = _read_varint(buf, pos)
+        items = []
+        for _ in range(length):
+            item, pos = decode_value(buf, pos)
+            items.append(item)
+        return items, pos
+    if tag == TAG_DICT:
+        length, pos = _read_varint(buf, pos)
+        items = {}
+        for _ in range(length):
+            key, pos = decode_value(buf, pos)
+            items[key], pos = decode_value(buf, pos)
+        return items, pos
+
+    raise PackedFormatError("unknown tag {}".format(tag))
+
+
+def _packable_samples(chunk):
+    """returns (width, array) for the chunk's sample list if it can be stored as a column, otherwise None"""
+    data = chunk.get("data")
+    if not isinstance(data, dict):
+        return None
+    samples = data.get("samples")
+    if not isinstance(samples, list) or not all(_is_int(sample) for sample in samples):
+        return None
+
+    low, high = (min(samples), max(samples)) if samples else (0, 0)
+    for width, typecode, type_min, type_max in SAMPLE_WIDTHS:
+        if type_min <= low and high <= type_max and array(typecode).itemsize == width:
+            column = array(typecode, samples)
+            if sys.byteorder != "little":
+                column.byteswap()
+            return width, column
+    return None
+
+
+def _packable_rssi(chunk):
+    """returns the chunk's rssi_distances as (badge id, count, rssi) tuples if they can be packed, otherwise None"""
+    data = chunk.get("data")
+    if not isinstance(data, dict):
+        return None
+    distances = data.get("rssi_distances")
+    if not isinstance(distances, dict):
+        return None
+
+    entries = []
+    for badge_id, distance in distances.items():
+        if not isinstance(distance, dict) or set(distance) != {"count", "rssi"}:
+            return None
+        count, rssi = distance["count"], distance["rssi"]
+        if not _is_int(count) or not _is_int(rssi) or count < 0:
+            return None
+        try:
+            numeric_id = int(badge_id)
+        except ValueError:
+            return None
+        if numeric_id < 0 or str(numeric_id) != badge_id:
+            return None
+        entries.append((numeric_id, count, rssi))
+    return entries
+
+
+def file_header(data_type):
+    """the bytes every packed file starts with"""
+    header = simplejson.dumps({
+        "version": VERSION,
+        "data_type": data_type,
+        "record": ["log_timestamp:f64", "log_index:i64", "flags:u8", "samples:int-column?", "rssi:varint?",
+                   "rest:tagged"],
+    }, separators=(",", ":")).encode("utf-8")
+    return PREAMBLE.pack(MAGIC, VERSION, len(header)) + header
+
+
+def read_header(f):
+    """
+    Reads the header at the start of a packed file, leaving f positioned at the first record.
+    Returns the decoded header dict.
+    """
+    preamble = f.read(PREAMBLE.size)
+    if len(preamble) != PREAMBLE.size:
+        raise PackedFormatError("file is too short to be a packed file")
+    magic, version, header_length = PREAMBLE.unpack(preamble)
+    if magic != MAGIC:
+        raise PackedFormatError("not a packed file")
+    if version > VERSION:
+        raise PackedFormatError("unsupported packed file version {}".format(version))
+    return simplejson.loads(f.read(header_length))
+
+
+def encode_chunk(chunk):
+    """Packs a single chunk dict into a length-prefixed record"""
+    rest = dict(chunk)
+    log_timestamp, log_index = chunk_position(chunk)
+
+    # anything that doesn't fit the head stays in the rest, so legacy chunks round-trip as they were
+    flags = 0
+    if log_timestamp is None:
+        flags |= RAW_TIMESTAMP
+    else:
+        del rest["log_timestamp"]
+    if log_index is not None:
+        flags |= HAS_LOG_INDEX
+        del rest["log_index"]
+
+    body = bytearray()
+    samples = _packable_samples(chunk)
+    if samples is not None:
+        flags |= HAS_SAMPLES
+        rest["data"] = dict(rest["data"])
+        del rest["data"]["samples"]
+
+        width, column = samples
+        body.append(width)
+        _write_varint(body, len(column))
+        body.extend(column.tostring())
+
+    rssi = _packable_rssi(chunk)
+    if rssi is not None:
+        flags |= HAS_RSSI
+        rest["data"] = dict(rest["data"])
+        del rest["data"]["rssi_distances"]
+
+        _write_varint(body, len(rssi))
+        for badge_id, count, value in rssi:
+            _write_varint(body, badge_id)
+            _write_varint(body, count)
+            _write_varint(body, _zigzag(value))
+
+    encode_value(body, rest)
+
+    head = RECORD_HEAD.pack(log_timestamp if log_timestamp is not None else 0.0,
+                            log_index if log_index is not None else 0, flags)
+    return RECORD_LENGTH.pack(len(head) + len(body)) + head + bytes(body)
+
+
+def decode_record(record):
+    """Unpacks the body of a record (without its length prefix) back into a chunk dict"""
+    if len(record) < RECORD_HEAD.size:
+        raise PackedFormatError("truncated record")
+    log_timestamp, log_index, flags = RECORD_HEAD.unpack_from(record)
+    buf = bytearray(record)
+    pos = RECORD_HEAD.size
+
+    samples = None
+    if flags & HAS_SAMPLES:
+        try:
+            width = buf[pos]
+            typecode = SAMPLE_TYPECODES[width]
+        except (IndexError, KeyError):
+            raise PackedFormatError("bad sample column")
+        count, pos = _read_varint(buf, pos + 1)
+        end = pos + width * count
+        if end > len(buf):
+            raise PackedFormatError("truncated record")
+        column = array(typecode)
+        column.fromstring(bytes(buf[pos:end]))
+        if sys.byteorder != "little":
+            column.byteswap()
+        samples = column.tolist()
+        pos = end
+
+    rssi = None
+    if flags & HAS_RSSI:
+        entries, pos = _read_varint(buf, pos)
+        rssi = {}
+        for _ in range(entries):
+            badge_id, pos = _read_varint(buf, pos)
+            count, pos = _read_varint(buf, pos)
+            value, pos = _read_varint(buf, pos)
+            rssi[str(badge_id)] = {"count": count, "rssi": _unzigzag(value)}
+
+    chunk, pos = decode_value(buf, pos)
+    if not flags & RAW_TIMESTAMP:
+        chunk["log_timestamp"] = log_timestamp
+    if flags & HAS_LOG_INDEX:
+        chunk["log_index"] = log_index
+    if samples is not None:
+        chunk["data"]["samples"] = samples
+    if rssi is not None:
+        chunk["data"]["rssi_distances"] = rssi
+    return chunk
+
+
+def record_position(record):
+    """(log_timestamp, log_index) of a record without decoding the rest of it, as chunk_position gives them"""
+    if len(record) < RECORD_HEAD.size:
+        raise PackedFormatError("truncated record")
+    log_timestamp, log_index, flags = RECORD_HEAD.unpack_from(record)
+    return (log_timestamp if not flags & RAW_TIMESTAMP else None,
+            log_index if flags & HAS_LOG_INDEX else None)
+
+
+def read_record(f):
+    """
+    Reads the next raw record from f. Returns None at the end of the file; a record cut
+    short by a crash mid-write is treated as the end of the file.
+    """
+    prefix = f.read(RECORD_LENGTH.size)
+    if len(prefix) < RECORD_LENGTH.size:
+        return None
+    length, = RECORD_LENGTH.unpack(prefix)
+    record = f.read(length)
+    if len(record) < length:
+        return None
+    return record
+
+
+def iter_chunks(f):
+    """Yields the chunk dicts stored in an open packed file, one at a time"""
+    read_header(f)
+    while True:
+        record = read_record(f)
+        if record is None:
+            return
+        yield decode_record(record)
@@ -1,9 +1,9 @@
 from django.utils import timezone
 from django.conf import settings
 from rest_framework import permissions
-import time
 
-from .models import Hub
+from . import heartbeat
+from .hubcache import get_request_hub
 
 
 class AppkeyRequired(permissions.BasePermission):
@@ -16,31 +16,20 @@ class AppkeyRequired(permissions.BasePermission):
 class HubUuidRequired(permissions.BasePermission):
     """
     Requires a valid Hub UUID be passed in the header
-    Also updates the heartbeat value for the hub that matches the UUID given
+    Also records a heartbeat for the hub that matches the UUID given, see heartbeat.py
     If HTTP_X_HUB_TIME is passed in the headers, updates last_hub_time
     """
 
     def has_permission(self, request, view):
-        hub_uuid = request.META.get("HTTP_X_HUB_UUID")
+        hub = get_request_hub(request)
         hub_time = request.META.get("HTTP_X_HUB_TIME")
-        try:
-            hub = Hub.objects.get(uuid=hub_uuid)
-        except Hub.DoesNotExist:
-           return False
-
-        hub.last_seen_ts = int(time.time())
-        if hub_time is not None:
-            hub.last_hub_time_ts = hub_time
+        if hub is None:
+            return False
 
         remote_addr = request.META.get("REMOTE_ADDR")
         x_forwarded = request.META.get("HTTP_X_FORWARDED_FOR")
-        if x_forwarded is not None:
-            hub.ip_address = x_forwarded
-        elif remote_addr is not None:
-            hub.ip_address = remote_addr
+        ip_address = x_forwarded if x_forwarded is not None else remote_addr
 
-        hub.save()
+        heartbeat.record(hub.uuid, hub_time=hub_time, ip_address=ip_address)
 
         return True
-
-
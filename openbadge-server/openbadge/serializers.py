@@ -3,6 +3,8 @@ import time
 
 from .models import Member, Project, Hub
 
+STATUS_NAMES = [name for field, companions in Member.STATUS_FIELDS for name in (field,) + companions]
+
 
 class MemberSerializer(serializers.ModelSerializer):
     project = serializers.PrimaryKeyRelatedField(queryset=Project.objects.all())
@@ -14,25 +16,22 @@ class MemberSerializer(serializers.ModelSerializer):
         read_only_fields = ('project', 'id', 'key')
 
     def update(self, instance, validated_data):
+        # only newer timestamps (and the values that go with them) are taken, in one conditional UPDATE so hubs
+        # reporting the same badge at once can't move it backwards
+        status = {name: validated_data[name] for name in STATUS_NAMES if validated_data.get(name) is not None}
+        status["key"] = instance.key
+        instance.apply_status(status)
+        return instance
 
-        # if we have an older audio_ts, update it
-        if validated_data.get('last_audio_ts') > instance.last_audio_ts:
-            instance.last_audio_ts = validated_data.get('last_audio_ts',
-                                                instance.last_audio_ts)
-            instance.last_audio_ts_fract = validated_data.get('last_audio_ts_fract',
-                                                instance.last_audio_ts_fract)
-
-        # if we have an older proximity_ts, update it
-        if validated_data.get('last_proximity_ts') > instance.last_proximity_ts:
-            instance.last_proximity_ts = validated_data.get('last_proximity_ts', instance.last_proximity_ts)
-
-        # if we have an older last_seen_ts, update it and voltage
-        if validated_data.get('last_seen_ts') > instance.last_seen_ts:
-            instance.last_seen_ts = validated_data.get('last_seen_ts', instance.last_seen_ts)
-            instance.last_voltage = validated_data.get('last_voltage', instance.last_voltage)
 
-        instance.save()
-        return instance
+class BadgeStatusSerializer(serializers.Serializer):
+    """One badge's report in a bulk status update, see Member.apply_statuses"""
+    key = serializers.CharField(max_length=10)
+    last_seen_ts = serializers.DecimalField(max_digits=20, decimal_places=3, required=False)
+    last_voltage = serializers.DecimalField(max_digits=5, decimal_places=3, required=False)
+    last_audio_ts = serializers.DecimalField(max_digits=20, decimal_places=3, required=False)
+    last_audio_ts_fract = serializers.DecimalField(max_digits=20, decimal_places=3, required=False)
+    last_proximity_ts = serializers.DecimalField(max_digits=20, decimal_places=3, required=False)
 
 
 class HubSerializer(serializers.ModelSerializer):
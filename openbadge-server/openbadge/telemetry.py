@@ -0,0 +1,124 @@
+"""
+Badge telemetry: the history of badges' voltage and last_seen_ts.
+
+Every status report that moves a badge's last_seen_ts forward is kept as a BadgeSample (see
+Member.apply_statuses). `manage.py rollup_telemetry` summarises the samples into 1-minute BadgeRollups,
+and those into 1-hour ones, then drops whatever is older than its retention (settings.TELEMETRY_*_DAYS).
+History queries are answered from the rollups, so they don't scan samples.
+"""
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+
+from .models import BadgeRollup, BadgeSample
+
+MINUTE = 60
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+RESOLUTIONS = {"raw": 0, "minute": MINUTE, "hour": HOUR}
+
+
+def _floor(ts, period):
+    return int(ts) // period * period
+
+
+def _insert_rollups(resolution, groups, period_key):
+    BadgeRollup.objects.bulk_create((
+        BadgeRollup(member_id=group["member"], resolution=resolution, period_start=group[period_key],
+                    hour_start=_floor(group[period_key], HOUR), sample_count=group["n"],
+                    voltage_count=group["voltage_n"], voltage_sum=group["voltage_total"],
+                    voltage_min=group["voltage_low"], voltage_max=group["voltage_high"],
+                    first_seen_ts=group["first_seen"], last_seen_ts=group["last_seen"])
+        for group in groups
+    ), batch_size=1000)
+
+
+@transaction.atomic
+def rollup(since, until):
+    """
+    (Re)computes the 1-minute rollups of the whole minutes in [since, until) from the samples, then the 1-hour
+    rollups of the hours those minutes fall in. Safe to run again over the same period, e.g. for late samples.
+    Returns the number of (minute, hour) rollups written.
+    """
+    since, until = _floor(since, MINUTE), _floor(until, MINUTE)
+    if since >= until:
+        return 0, 0
+
+    BadgeRollup.objects.filter(resolution=MINUTE, period_start__gte=since, period_start__lt=until).delete()
+    minutes = list(BadgeSample.objects.filter(minute_start__gte=since, minute_start__lt=until)
+                   .values("member", "minute_start")
+                   .annotate(n=Count("id"), voltage_n=Count("voltage"), voltage_total=Sum("voltage"),
+                             voltage_low=Min("voltage"), voltage_high=Max("voltage"),
+                             first_seen=Min("seen_ts"), last_seen=Max("seen_ts")))
+    _insert_rollups(MINUTE, minutes, "minute_start")
+
+    # whole hours, from the minute rollups of this run and those already there
+    since, until = _floor(since, HOUR), _floor(until + HOUR - 1, HOUR)
+    BadgeRollup.objects.filter(resolution=HOUR, period_start__gte=since, period_start__lt=until).delete()
+    hours = list(BadgeRollup.objects.filter(resolution=MINUTE, hour_start__gte=since, hour_start__lt=until)
+                 .values("member", "hour_start")
+                 .annotate(n=Sum("sample_count"), voltage_n=Sum("voltage_count"), voltage_total=Sum("voltage_sum"),
+                           voltage_low=Min("voltage_min"), voltage_high=Max("voltage_max"),
+                           first_seen=Min("first_seen_ts"), last_seen=Max("last_seen_ts")))
+    _insert_rollups(HOUR, hours, "hour_start")
+    return len(minutes), len(hours)
+
+
+def retention_cutoffs(now=None):
+    """{resolution: oldest period_start (or sample) to keep, or None to keep everything}"""
+    now = time.time() if now is None else now
+    days = {0: settings.TELEMETRY_RAW_DAYS, MINUTE: settings.TELEMETRY_MINUTE_DAYS,
+            HOUR: settings.TELEMETRY_HOUR_DAYS}
+    return {resolution: _floor(now - keep * DAY, MINUTE) if keep else None for resolution, keep in days.items()}
+
+
+def prune(now=None):
+    """drops samples and rollups past their retention. Returns {resolution: number of rows deleted}"""
+    deleted = {}
+    for resolution, cutoff in retention_cutoffs(now).items():
+        if cutoff is None:
+            deleted[resolution] = 0
+        elif resolution == 0:
+            deleted[resolution] = _count_delete(BadgeSample.objects.filter(seen_ts__lt=cutoff))
+        else:
+            deleted[resolution] = _count_delete(
+                BadgeRollup.objects.filter(resolution=resolution, period_start__lt=cutoff))
+    return deleted
+
+
+def _count_delete(queryset):
+    # Django 1.8's delete() doesn't say how many rows went
+    count = queryset.count()
+    queryset.delete()
+    return count
+
+
+def choose_resolution(start, end):
+    """the finest rollup that keeps a window to a few hundred points per badge"""
+    return MINUTE if end - start <= 12 * HOUR else HOUR
+
+
+def history(members, start, end, resolution):
+    """
+    {badge key: [points]} for the members over [start, end]. With a resolution of 0 the points are the samples
+    ({"seen_ts", "voltage"}), otherwise BadgeRollup.to_dict()s of that resolution.
+    """
+    keys = dict(members.values_list("id", "key"))
+    points = {key: [] for key in keys.values()}
+
+    if resolution == 0:
+        samples = (BadgeSample.objects.filter(member__in=list(keys), seen_ts__gte=start, seen_ts__lte=end)
+                   .order_by("member", "seen_ts").values_list("member", "seen_ts", "voltage"))
+        for member_id, seen_ts, voltage in samples.iterator():
+            points[keys[member_id]].append({"seen_ts": seen_ts, "voltage": voltage})
+        return points
+
+    rollups = (BadgeRollup.objects.filter(member__in=list(keys), resolution=resolution,
+                                          period_start__gte=_floor(start, resolution), period_start__lte=end)
+               .order_by("member", "period_start"))
+    for rollup in rollups.iterator():
+        points[keys[rollup.member_id]].append(rollup.to_dict())
+    return points
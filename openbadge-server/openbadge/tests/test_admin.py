@@ -0,0 +1,130 @@
+from datetime import timedelta
+import time
+
+from django.contrib import admin
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+
+from openbadge import models
+
+
+class TestProjectAdmin(TestCase):
+
+    def setUp(self):
+        self.admin = admin.site._registry[models.Project]
+        self.request = RequestFactory().get("/admin/openbadge/project/")
+        self.busy = models.Project.objects.create(name="busy")
+        self.idle = models.Project.objects.create(name="idle")
+        hub = models.Hub.objects.create(name="hub", uuid="hub", project=self.busy)
+        for n in range(3):
+            models.Member.objects.create(name="m{}".format(n), email="m{}@example.com".format(n),
+                                         badge="b{}".format(n), project=self.busy)
+        # 100s and 50s ended, the last still going so not counted in the time
+        for n, (start, last, end) in enumerate([(1000, 1100, 1100), (2000, 2050, 2060), (3000, 3500, None)]):
+            models.Meeting.objects.create(uuid="m{}".format(n), version=1, project=self.busy, hub=hub,
+                                          start_time=start, last_update_timestamp=last, end_time=end)
+
+    def test_columns_come_from_one_query(self):
+        with self.assertNumQueries(1):
+            projects = {project.name: project for project in self.admin.get_queryset(self.request)}
+            busy, idle = projects["busy"], projects["idle"]
+
+            self.assertEqual(self.admin.number_of_members(busy), 3)
+            self.assertEqual(busy.hubs_count, 1)
+            self.assertEqual(self.admin.number_of_meetings(busy), 3)
+            self.assertEqual(self.admin.total_meeting_time(busy), timedelta(seconds=150))
+            self.assertEqual(self.admin.number_of_members(idle), 0)
+            self.assertEqual(self.admin.number_of_meetings(idle), "NONE")
+            self.assertEqual(self.admin.total_meeting_time(idle), "NONE")
+
+    def test_columns_sort(self):
+        projects = self.admin.get_queryset(self.request).order_by("-meeting_seconds")
+        self.assertEqual([project.name for project in projects], ["busy", "idle"])
+        projects = self.admin.get_queryset(self.request).order_by("members_count")
+        self.assertEqual([project.name for project in projects], ["idle", "busy"])
+
+
+class TestMeetingAdmin(TestCase):
+
+    def setUp(self):
+        self.project = models.Project.objects.create(name="test-project")
+        self.hub = models.Hub.objects.create(name="hub", uuid="hub", project=self.project)
+        models.OpenBadgeUser.objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.login(username="admin", password="password")
+
+    def add_meetings(self, count, **fields):
+        for n in range(count):
+            models.Meeting.objects.create(uuid="m{}-{}".format(models.Meeting.objects.count(), n), version=1,
+                                          project=self.project, hub=self.hub, **fields)
+
+    def changelist(self, **params):
+        response = self.client.get("/admin/openbadge/meeting/", params)
+        self.assertEqual(response.status_code, 200)
+        return response.context["cl"]
+
+    def test_queries_do_not_grow_with_meetings(self):
+        self.add_meetings(2, start_time=1000, last_update_timestamp=1060)
+        with CaptureQueriesContext(connection) as few:
+            self.changelist()
+        self.add_meetings(5, start_time=1000)
+        with CaptureQueriesContext(connection) as more:
+            self.changelist()
+        self.assertEqual(len(more), len(few))
+
+    def test_sorting_and_filtering(self):
+        self.add_meetings(1, start_time=1000, last_update_timestamp=1060)
+        self.add_meetings(1, start_time=time.time(), last_update_timestamp=None)
+
+        # by project, duration (missing durations sorting wherever the database puts nulls) and start
+        self.assertEqual(self.changelist(o="2").result_count, 2)
+        self.assertEqual([meeting.duration_seconds for meeting in self.changelist(o="-8").result_list
+                          if meeting.duration_seconds is not None], [60])
+        self.assertEqual([meeting.start_time for meeting in self.changelist(o="-4").result_list][1], 1000)
+
+        cl = self.changelist(started="7", project__id__exact=self.project.id)
+        self.assertEqual([meeting.last_update_timestamp for meeting in cl.result_list], [None])
+
+        meeting_admin = admin.site._registry[models.Meeting]
+        durations = [meeting_admin.duration(meeting) for meeting in cl.root_queryset.order_by("start_time")]
+        self.assertEqual(durations, [timedelta(seconds=60), None])
+
+
+class TestProjectPage(TestCase):
+
+    def setUp(self):
+        self.project = models.Project.objects.create(name="test-project")
+        self.hub = models.Hub.objects.create(name="hub", uuid="hub", project=self.project)
+        for n in range(3):
+            models.Member.objects.create(name="m{}".format(n), email="m{}@example.com".format(n),
+                                         badge="b{}".format(n), project=self.project)
+        models.OpenBadgeUser.objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.login(username="admin", password="password")
+
+    def get(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_small_projects_keep_their_inlines(self):
+        response = self.get("/admin/openbadge/project/{}/".format(self.project.id))
+        self.assertContains(response, 'id="members-group"')
+        self.assertContains(response, 'id="hubs-group"')
+        self.assertContains(response, "/admin/openbadge/member/?project__id__exact={}".format(self.project.id))
+
+    def test_large_projects_link_to_the_lists(self):
+        project_admin = admin.site._registry[models.Project]
+        project_admin.inline_limit, limit = 2, project_admin.inline_limit
+        self.addCleanup(setattr, project_admin, "inline_limit", limit)
+
+        response = self.get("/admin/openbadge/project/{}/".format(self.project.id))
+        self.assertNotContains(response, 'id="members-group"')
+        self.assertContains(response, 'id="hubs-group"')
+        self.assertContains(response, "3 members")
+
+        members = self.get("/admin/openbadge/member/?project__id__exact={}".format(self.project.id))
+        self.assertEqual(members.context["cl"].result_count, 3)
+        self.get("/admin/openbadge/hub/?project__id__exact={}".format(self.project.id))
+
+    def test_new_project_page(self):
+        self.get("/admin/openbadge/project/add/")
@@ -0,0 +1,77 @@
+from django.test import TestCase
+from django.test.utils import override_settings
+import simplejson as json
+
+import os
+import shutil
+import tempfile
+
+from openbadge import chunkindex, datastore
+
+
+class TestChunkIndex(TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(CHUNK_INDEX_INTERVAL=10)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.data_dir)
+
+    def make_chunks(self, count, start=1000):
+        return [{"log_timestamp": start + i * 0.5, "log_index": i, "data": {"samples": [i, i + 1]}}
+                for i in range(count)]
+
+    def write(self, path, storage_format, chunks):
+        with datastore.DataFileWriter(path, storage_format, "audio") as writer:
+            for chunk in chunks:
+                writer.write_chunk(chunk)
+
+    def test_range_reads(self):
+        chunks = self.make_chunks(1000)
+        for storage_format in (datastore.FORMAT_JSON, datastore.FORMAT_PACKED):
+            path = os.path.join(self.data_dir, "log." + storage_format)
+            self.write(path, storage_format, chunks[:500])
+            self.write(path, storage_format, chunks[500:])
+
+            offset, ordered = chunkindex.lookup(path, 1300)
+            self.assertTrue(ordered)
+            self.assertGreater(offset, os.path.getsize(path) / 2)
+
+            result = list(datastore.iter_chunks(path, storage_format, 1300, 1310))
+            self.assertEqual(result, [chunk for chunk in chunks if 1300 <= chunk["log_timestamp"] <= 1310])
+            self.assertEqual(list(datastore.iter_chunks(path, storage_format, 5000)), [])
+            self.assertEqual(list(datastore.iter_chunks(path, storage_format, end=1001)), chunks[:3])
+
+    def test_one_entry_per_interval(self):
+        path = os.path.join(self.data_dir, "log.txt")
+        self.write(path, datastore.FORMAT_JSON, self.make_chunks(95))
+        index_size = os.path.getsize(chunkindex.index_path(path))
+        self.assertEqual(index_size, chunkindex.HEADER.size + 10 * chunkindex.RECORD.size)
+
+    def test_stale_index_is_rebuilt(self):
+        chunks = self.make_chunks(100)
+        path = os.path.join(self.data_dir, "log.txt")
+        self.write(path, datastore.FORMAT_JSON, chunks[:50])
+        # appended behind the index's back
+        with open(path, "ab") as f:
+            for chunk in chunks[50:80]:
+                f.write(json.dumps(chunk) + "\n")
+        self.assertFalse(chunkindex.lookup(path, 1030)[1])
+        self.assertEqual(list(datastore.iter_chunks(path, datastore.FORMAT_JSON, 1030)), chunks[60:80])
+
+        self.write(path, datastore.FORMAT_JSON, chunks[80:])
+        offset, ordered = chunkindex.lookup(path, 1045)
+        self.assertTrue(ordered)
+        self.assertEqual(list(datastore.iter_chunks(path, datastore.FORMAT_JSON, 1045)), chunks[90:])
+
+    def test_unordered_log_is_scanned(self):
+        chunks = self.make_chunks(50)
+        path = os.path.join(self.data_dir, "log.txt")
+        self.write(path, datastore.FORMAT_JSON, chunks[25:] + chunks[:25])
+
+        self.assertEqual(chunkindex.lookup(path, 1020), (None, False))
+        self.assertEqual(list(datastore.iter_chunks(path, datastore.FORMAT_JSON, 1005, 1020)),
+                         chunks[25:41] + chunks[10:25])
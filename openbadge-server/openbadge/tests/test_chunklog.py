@@ -0,0 +1,35 @@
+from django.test import TestCase
+
+import os
+import shutil
+import tempfile
+
+from openbadge.chunklog import LogReader
+
+
+class TestLogReader(TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.data_dir, "log.txt")
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def write(self, data):
+        with open(self.path, "wb") as f:
+            f.write(data)
+
+    def test_lines_and_offsets(self):
+        self.write(b'{"a": 1}\n\nnot json\n{"a": 2}')
+        with LogReader(self.path) as log:
+            self.assertEqual(list(log.iter_lines()),
+                             [(0, b'{"a": 1}\n'), (9, b'\n'), (10, b'not json\n'), (19, b'{"a": 2}')])
+            self.assertEqual(list(log.iter_chunks()), [{"a": 1}, {"a": 2}])
+            self.assertEqual(list(log.iter_chunks(skip_first_line=True)), [{"a": 2}])
+            self.assertEqual(list(log.iter_chunks(offset=19)), [{"a": 2}])
+
+    def test_empty_file(self):
+        self.write(b"")
+        with LogReader(self.path) as log:
+            self.assertEqual(list(log.iter_chunks()), [])
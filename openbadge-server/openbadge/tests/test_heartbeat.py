@@ -0,0 +1,52 @@
+from decimal import Decimal
+import time
+
+from django.conf import settings
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from openbadge import heartbeat, models
+
+APP_KEY = settings.APP_KEY
+
+
+class TestHeartbeat(TestCase):
+
+    def setUp(self):
+        heartbeat.flush()
+        self.project = models.Project.objects.create(name="test-project")
+        self.hubs = [models.Hub.objects.create(name="hub{}".format(n), uuid="hub{}".format(n), project=self.project)
+                     for n in range(3)]
+
+    def get(self, path, hub, **headers):
+        return self.client.get(path, HTTP_X_APPKEY=APP_KEY, HTTP_X_HUB_UUID=hub.uuid, **headers)
+
+    # a long interval, so the background thread never gets to flush during the test
+    @override_settings(HEARTBEAT_FLUSH_INTERVAL=3600)
+    def test_heartbeats_are_coalesced(self):
+        for hub in self.hubs:
+            # HubUuidRequired, then require_hub_uuid
+            self.get('/badges/', hub, HTTP_X_HUB_TIME="1478807000.5", REMOTE_ADDR="10.0.0.1")
+            self.get('/{}/members'.format(self.project.key), hub)
+        for hub in models.Hub.objects.all():
+            self.assertEqual(hub.last_seen_ts, 0)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(heartbeat.flush(), 3)
+
+        for hub in models.Hub.objects.all():
+            self.assertGreaterEqual(hub.last_seen_ts, int(time.time()) - 5)
+            self.assertEqual(hub.last_hub_time_ts, Decimal("1478807000.5"))
+            self.assertEqual(hub.ip_address, "10.0.0.1")
+
+    @override_settings(HEARTBEAT_FLUSH_INTERVAL=3600)
+    def test_last_seen_never_goes_backwards(self):
+        later = int(time.time()) + 1000
+        models.Hub.objects.filter(uuid="hub0").update(last_seen_ts=later)
+        heartbeat.record("hub0")
+        heartbeat.flush()
+        self.assertEqual(models.Hub.objects.get(uuid="hub0").last_seen_ts, later)
+
+    def test_written_straight_away_without_interval(self):
+        self.get('/{}/members'.format(self.project.key), self.hubs[0])
+        self.assertNotEqual(models.Hub.objects.get(uuid="hub0").last_seen_ts, 0)
@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from openbadge import hubcache, models
+
+APP_KEY = settings.APP_KEY
+
+
+class TestHubCache(TestCase):
+
+    def setUp(self):
+        self.project = models.Project.objects.create(name="test-project")
+        self.other_project = models.Project.objects.create(name="other-project")
+        self.hub = models.Hub.objects.create(name="hub", uuid="cached-hub", project=self.project)
+        # as if the request creating the hub had finished, TestCase never commits
+        request_finished.send(sender=self.__class__)
+
+    def get(self, path):
+        return self.client.get(path, HTTP_X_APPKEY=APP_KEY, HTTP_X_HUB_UUID=self.hub.uuid)
+
+    def hub_queries(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get(path)
+        self.assertEqual(response.status_code, 200)
+        return [query for query in queries.captured_queries if 'FROM "openbadge_hub"' in query["sql"]]
+
+    def test_hub_is_looked_up_once(self):
+        path = '/{}/hubs'.format(self.project.key)
+        # is_own_project, require_hub_uuid and the view share one lookup
+        self.assertEqual(len(self.hub_queries(path)), 1)
+        self.assertEqual(len(self.hub_queries(path)), 0)
+
+    def test_saved_hub_is_forgotten(self):
+        path = '/{}/hubs'.format(self.project.key)
+        self.assertEqual(self.get(path).status_code, 200)
+
+        self.hub.project = self.other_project
+        self.hub.save()
+        self.assertEqual(self.get(path).status_code, 401)
+        self.assertEqual(self.get('/{}/hubs'.format(self.other_project.key)).status_code, 200)
+
+        self.hub.delete()
+        self.assertIsNone(hubcache.get_hub("cached-hub"))
+
+    def test_forgotten_again_after_commit(self):
+        path = '/{}/hubs'.format(self.project.key)
+        stale = hubcache.get_hub(self.hub.uuid)
+        self.hub.project = self.other_project
+        self.hub.save()
+        # another request reading the hub before this transaction commits
+        hubcache._cache().set(hubcache.cache_key(self.hub.uuid), stale)
+
+        request_finished.send(sender=self.__class__)
+        self.assertEqual(self.get(path).status_code, 401)
+
+    def test_unknown_hub(self):
+        response = self.client.get('/{}/hubs'.format(self.project.key),
+                                   HTTP_X_APPKEY=APP_KEY, HTTP_X_HUB_UUID="no-such-hub")
+        self.assertEqual(response.status_code, 404)
+        self.assertIsNone(hubcache.get_hub(None))
@@ -0,0 +1,170 @@
+from django.contrib.auth.models import AnonymousUser
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, RequestFactory, override_settings
+import simplejson as json
+from django.conf import settings
+
+import io
+import os
+import shutil
+import tempfile
+
+from openbadge import views
+from openbadge import models
+from openbadge.ingest import get_ingest_queue
+APP_KEY = settings.APP_KEY
+TESTDATA_DIR = os.path.join(os.path.dirname(__file__), "testdata")
+
+
+class TestIngestQueue(TestCase):
+    """
+    Uploads made while INGEST_QUEUE_URL is set are queued, and written by drain_ingest
+    """
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            DATA_DIR=os.path.join(self.tmp_dir, "data") + "/",
+            MEDIA_ROOT=os.path.join(self.tmp_dir, "media") + "/",
+            INGEST_QUEUE_URL="file://" + os.path.join(self.tmp_dir, "queue"))
+        self.settings_override.enable()
+
+        self.project = models.Project.objects.create(name="test-project")
+        self.hub = models.Hub.objects.create(name="hub", uuid="hub", project=self.project)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.tmp_dir)
+
+    def drain(self):
+        call_command("drain_ingest", once=True, stdout=io.BytesIO())
+
+    def read_testdata(self, entry_type, data_type):
+        with open(os.path.join(TESTDATA_DIR, "{}_{}_entry.txt".format(entry_type, data_type)), "rb") as f:
+            return f.read()
+
+    def test_datafile_uploads_are_queued(self):
+        body = self.read_testdata("multi", "proximity")
+        request = self.factory.post('/{}/datafiles?data_type=proximity'.format(self.project.key), body,
+                                    content_type="application/x-ndjson",
+                                    HTTP_X_HUB_UUID=self.hub.uuid, HTTP_X_APPKEY=APP_KEY)
+        request.user = AnonymousUser()
+        resp_json = json.loads(views.post_datafile(request, self.project.key).content)
+        self.assertEqual(resp_json["status"], "queued")
+        self.assertEqual(resp_json["chunks_queued"], len(body.splitlines()))
+
+        chunks = [json.loads(line) for line in self.read_testdata("single", "proximity").splitlines()]
+        request = self.factory.post('/{}/datafiles'.format(self.project.key),
+                                    {"data_type": "proximity", "chunks": json.dumps(chunks)},
+                                    HTTP_X_HUB_UUID=self.hub.uuid, HTTP_X_APPKEY=APP_KEY)
+        request.user = AnonymousUser()
+        self.assertEqual(json.loads(views.post_datafile(request, self.project.key).content)["status"], "queued")
+
+        self.assertFalse(models.DataFile.objects.exists())
+        self.assertTrue(get_ingest_queue().depth() > 0)
+
+        self.drain()
+
+        self.assertEqual(get_ingest_queue().depth(), 0)
+        datafile = models.DataFile.objects.get(uuid="hub_proximity")
+        expected = [json.loads(line) for line in body.splitlines()] + chunks
+        self.assertEqual(list(datafile.get_chunks()), expected)
+        self.assertEqual(float(datafile.last_update_timestamp), expected[-1]["log_timestamp"])
+
+    def test_meeting_uploads_are_queued(self):
+        header = json.dumps({"type": "meeting started", "data": {"uuid": "m1", "log_version": "2.0"}}) + "\n"
+        meeting = models.Meeting(uuid="m1", version="2.0", project=self.project, hub=self.hub,
+                                 last_update_index=0)
+        meeting.log_file.save("m1.txt", ContentFile(header))
+
+        def post(first, last):
+            chunks = [json.dumps({"log_index": i, "log_timestamp": 1000.0 + i}) + "\n" for i in range(first, last)]
+            request = self.factory.post('/{}/meetings'.format(self.project.key),
+                                        {"uuid": "m1", "chunks": json.dumps(chunks)},
+                                        HTTP_X_HUB_UUID=self.hub.uuid, HTTP_X_APPKEY=APP_KEY)
+            request.user = AnonymousUser()
+            return json.loads(views.post_meeting(request, self.project.key).content)
+
+        meeting.is_complete = True
+        meeting.save()
+        self.assertEqual(post(1, 5)["status"], "queued")
+        # reopened, as appending inline does
+        self.assertFalse(models.Meeting.objects.get(uuid="m1").is_complete)
+        self.assertEqual(post(5, 9)["status"], "queued")
+        # doesn't follow on from what is queued, the hub is told straight away
+        self.assertEqual(post(20, 22)["status"], "log mismatch")
+        self.assertEqual(models.Meeting.objects.get(uuid="m1").queued_index, 8)
+
+        self.drain()
+
+        meeting = models.Meeting.objects.get(uuid="m1")
+        self.assertEqual(meeting.last_update_index, 8)
+        self.assertEqual(float(meeting.last_update_timestamp), 1008.0)
+        with open(meeting.log_file.path) as f:
+            self.assertEqual(len(f.readlines()), 9)
+
+    def test_bad_meeting_post_fails_the_ones_after_it(self):
+        header = json.dumps({"type": "meeting started", "data": {"uuid": "m1", "log_version": "2.0"}}) + "\n"
+        meeting = models.Meeting(uuid="m1", version="2.0", project=self.project, hub=self.hub,
+                                 last_update_index=0, queued_index=9)
+        meeting.log_file.save("m1.txt", ContentFile(header))
+
+        def chunks(first, last):
+            return [json.dumps({"log_index": i, "log_timestamp": 1000.0 + i}) + "\n" for i in range(first, last)]
+
+        queue = get_ingest_queue()
+        queue.push({"kind": "meeting", "meeting": "m1", "chunks": chunks(1, 3)})
+        queue.push({"kind": "meeting", "meeting": "m1", "chunks": ["not json"]})
+        queue.push({"kind": "meeting", "meeting": "m1", "chunks": chunks(3, 5)})
+        queue.push({"kind": "datafile", "hub": "hub", "project": self.project.key, "data_type": "audio",
+                    "chunks": [{"log_timestamp": 1.0, "log_index": 1}], "lines": None})
+
+        self.drain()
+
+        self.assertEqual(queue.depth(), 0)
+        meeting = models.Meeting.objects.get(uuid="m1")
+        self.assertEqual(meeting.last_update_index, 2)
+        # so the hub's next post gets "log mismatch"
+        self.assertIsNone(meeting.queued_index)
+        self.assertEqual(meeting.next_log_index(), 3)
+        self.assertEqual(len(os.listdir(os.path.join(self.tmp_dir, "queue", "failed"))), 2)
+        self.assertEqual(list(models.DataFile.objects.get(uuid="hub_audio").get_chunks()),
+                         [{"log_timestamp": 1.0, "log_index": 1}])
+
+    def test_stream_line_that_is_not_utf8(self):
+        body = b'{"log_timestamp": 1.0, "log_index": 1, "data": "\xff"}\n{"log_timestamp": 2.0, "log_index": 2}\n'
+        request = self.factory.post('/{}/datafiles?data_type=audio'.format(self.project.key), body,
+                                    content_type="application/x-ndjson",
+                                    HTTP_X_HUB_UUID=self.hub.uuid, HTTP_X_APPKEY=APP_KEY)
+        request.user = AnonymousUser()
+        resp_json = json.loads(views.post_datafile(request, self.project.key).content)
+        self.assertEqual((resp_json["status"], resp_json["chunks_queued"]), ("queued", 2))
+
+        self.drain()
+
+        chunks = list(models.DataFile.objects.get(uuid="hub_audio").get_chunks())
+        self.assertEqual([chunk["log_index"] for chunk in chunks], [1, 2])
+        self.assertEqual(chunks[0]["data"], u"\ufffd")
+
+    def test_bad_datafile_posts_are_not_queued(self):
+        request = self.factory.post('/{}/datafiles'.format(self.project.key),
+                                    {"data_type": "proximity", "chunks": json.dumps([{"log_index": 1}])},
+                                    HTTP_X_HUB_UUID=self.hub.uuid, HTTP_X_APPKEY=APP_KEY)
+        request.user = AnonymousUser()
+        self.assertEqual(json.loads(views.post_datafile(request, self.project.key).content)["status"], "failed")
+        self.assertEqual(get_ingest_queue().depth(), 0)
+
+    def test_unacked_uploads_are_requeued(self):
+        queue = get_ingest_queue()
+        queue.push({"kind": "datafile", "hub": "hub", "project": self.project.key, "data_type": "audio",
+                    "chunks": [{"log_timestamp": 1.0, "log_index": 1}], "lines": None})
+        # popped by a drainer that died before acking
+        self.assertEqual(len(queue.pop_batch(10)), 1)
+        self.assertEqual(queue.depth(), 0)
+
+        self.drain()
+
+        self.assertEqual(list(models.DataFile.objects.get(uuid="hub_audio").get_chunks()),
+                         [{"log_timestamp": 1.0, "log_index": 1}])
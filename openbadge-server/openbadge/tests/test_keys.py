@@ -0,0 +1,51 @@
+from django.db import IntegrityError
+from django.test import TestCase
+
+from openbadge import models
+
+
+class TestKeys(TestCase):
+
+    def setUp(self):
+        self.project = models.Project.objects.create(name="test-project")
+
+    def test_save_does_not_look_keys_up(self):
+        hub = models.Hub(name="hub", uuid="hub", project=self.project)
+        # just the INSERT (and the roster update) in a savepoint, no checking of the key
+        with self.assertNumQueries(4):
+            hub.save()
+        self.assertRegexpMatches(hub.key, r"^[A-Z0-9]{10}$")
+
+    def test_save_retries_taken_key(self):
+        models.Hub.objects.create(name="first", uuid="first", key="TAKEN00000", project=self.project)
+        keys = iter(["TAKEN00000", "FRESH00000"])
+        key_generator = models.key_generator
+        models.key_generator = lambda size=10: next(keys)
+        try:
+            hub = models.Hub.objects.create(name="hub", uuid="hub", project=self.project)
+        finally:
+            models.key_generator = key_generator
+        self.assertEqual(hub.key, "FRESH00000")
+        self.assertEqual(models.Hub.objects.get(uuid="hub").key, "FRESH00000")
+
+    def test_save_raises_other_errors(self):
+        models.Hub.objects.create(name="first", uuid="first", project=self.project)
+        with self.assertRaises(IntegrityError):
+            models.Hub.objects.create(name="again", uuid="first", project=self.project)
+
+    def test_bulk_create_retries_taken_keys(self):
+        models.Hub.objects.create(name="first", uuid="first", key="TAKEN00000", project=self.project)
+        hubs = [models.Hub(name="hub{}".format(n), uuid="hub{}".format(n), project=self.project) for n in range(5)]
+        hubs[2].key = "TAKEN00000"
+
+        models.Hub.bulk_create_with_keys(hubs)
+        keys = list(models.Hub.objects.values_list("key", flat=True))
+        self.assertEqual(len(set(keys)), 6)
+        self.assertNotEqual(hubs[2].key, "TAKEN00000")
+        self.assertTrue(all(len(key) == 10 for key in keys))
+
+    def test_bulk_create_raises_other_errors(self):
+        models.Hub.objects.create(name="first", uuid="first", project=self.project)
+        hubs = [models.Hub(name="again", uuid="first", project=self.project)]
+        with self.assertRaises(IntegrityError):
+            models.Hub.bulk_create_with_keys(hubs)
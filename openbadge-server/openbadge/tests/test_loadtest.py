@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+
+from django.test import LiveServerTestCase, SimpleTestCase
+from django.test.utils import override_settings
+
+from openbadge import heartbeat, loadtest, models
+
+
+class TestPercentile(SimpleTestCase):
+
+    def test_nearest_rank(self):
+        values = range(1, 101)
+        self.assertEqual(loadtest.percentile(values, 50), 50)
+        self.assertEqual(loadtest.percentile(values, 99), 99)
+        self.assertEqual(loadtest.percentile([7], 95), 7)
+        self.assertIsNone(loadtest.percentile([], 50))
+
+
+class TestLoadTest(LiveServerTestCase):
+
+    def setUp(self):
+        heartbeat.flush()
+        self.media_root = tempfile.mkdtemp() + "/"
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def run_fleet(self, **options):
+        fleet = loadtest.LoadTest(self.live_server_url, hubs=2, badges=3, interval=0, chunks=4, **options)
+        fleet.setup()
+        fleet.register()
+        stats = fleet.run(rounds=2)
+        return fleet, {row["endpoint"]: row for row in stats.summary()}
+
+    def test_fleet_follows_the_protocol(self):
+        fleet, rows = self.run_fleet()
+
+        self.assertEqual(rows["total"]["errors"], 0)
+        self.assertEqual(rows["PUT /:anyNumber/hubs"]["requests"], 2)
+        self.assertEqual(rows["GET /:project/hubs"]["requests"], 4)
+        self.assertEqual(rows["PATCH /badges/:key"]["requests"], 2 * 2 * 3)
+        # start and end of each hub's meeting
+        self.assertEqual(rows["PUT /:project/meetings"]["requests"], 4)
+        self.assertEqual(rows["POST /:project/meetings"]["requests"], 4)
+        self.assertEqual(rows["POST /:project/datafiles"]["requests"], 4)
+        self.assertLessEqual(rows["total"]["p50"], rows["total"]["p99"])
+
+        self.assertEqual(fleet.project.hubs.count(), 2)
+        for meeting in fleet.project.meetings.all():
+            self.assertTrue(meeting.is_complete)
+            # the first chunk (with the header), 2 rounds of 4 chunks and the last one
+            self.assertEqual(meeting.last_update_index, 10)
+        self.assertFalse(fleet.project.members.filter(last_seen_ts=0).exists())
+
+        paths = [meeting.log_file.path for meeting in fleet.project.meetings.all()]
+        for datafile in fleet.project.data.all():
+            paths.extend(segment.filepath for segment in datafile.segments.all())
+        self.assertTrue(paths)
+        self.assertTrue(all(os.path.exists(path) for path in paths))
+
+        fleet.cleanup()
+        self.assertFalse([path for path in paths if os.path.exists(path)])
+        self.assertFalse(models.Project.objects.filter(id=fleet.project.id).exists())
+        self.assertFalse(models.Hub.objects.filter(uuid__startswith="loadtest-").exists())
+
+    def test_bulk_status(self):
+        fleet, rows = self.run_fleet(bulk_status=True)
+        self.assertEqual(rows["total"]["errors"], 0)
+        self.assertEqual(rows["POST /badges/status"]["requests"], 4)
+        self.assertNotIn("PATCH /badges/:key", rows)
@@ -0,0 +1,98 @@
+# coding=utf-8
+import io
+import os
+import shutil
+import tempfile
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from openbadge import memberimport, models
+
+
+class TestMemberImport(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.project = models.Project.objects.create(name="test-project")
+        self.other = models.Project.objects.create(name="other-project")
+        models.Member.objects.create(name="Old", email="old@example.com", badge="AA:00", project=self.project)
+        models.Member.objects.create(name="Else", email="else@example.com", badge="BB:00", project=self.other)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp_dir, name)
+        with io.open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+    def run_import(self, lines, **kwargs):
+        errors = []
+        result = memberimport.MemberImport(self.project, on_error=lambda *error: errors.append(error), **kwargs)
+        with open(self.write("members.csv", u"\n".join(lines) + u"\n"), "rb") as f:
+            result.run(memberimport.read_csv(f))
+        return result, errors
+
+    def test_batches(self):
+        lines = [u"email,group,name,badge"] + [u"m{0}@example.com,,Member {0},CC:{0:02d}".format(n)
+                                               for n in range(25)]
+        # per batch of 10: emails, badges, then in a savepoint the sync sequence (update + read), the insert in a
+        # savepoint of its own and the roster
+        with self.assertNumQueries(3 * 10):
+            result, errors = self.run_import(lines, batch_size=10)
+        self.assertEqual((result.created, result.failed, errors), (25, 0, []))
+        self.assertEqual(models.Member.objects.filter(project=self.project).count(), 26)
+
+        member = models.Member.objects.get(email="m7@example.com")
+        self.assertEqual((member.name, member.badge, len(member.key)), ("Member 7", "CC:07", 10))
+        self.assertGreater(member.sync_seq, 0)
+        self.assertEqual(len(set(models.Member.objects.values_list("key", flat=True))), 27)
+
+    def test_rejected_rows(self):
+        result, errors = self.run_import([
+            u"new@example.com,,Zoë,DD:00",
+            u"not-an-email,,Bad,DD:01",
+            u"taken@example.com,,Taken,AA:00",
+            u"else@example.com,,Else,EE:00",
+            u"new@example.com,,Twice,DD:02",
+            u"nobadge@example.com,,No Badge",
+        ])
+        self.assertEqual(sorted(line for line, _ in errors), [2, 3, 4, 5, 6])
+        self.assertEqual((result.created, result.failed), (1, 5))
+        self.assertEqual(models.Member.objects.get(email="new@example.com").name, u"Zoë")
+
+    def test_other_project_row_claims_nothing(self):
+        result, errors = self.run_import([
+            u"else@example.com,,Else,FF:00",
+            u"fresh@example.com,,Fresh,FF:00",
+        ])
+        self.assertEqual([line for line, _ in errors], [1])
+        self.assertEqual((result.created, result.failed), (1, 1))
+        self.assertEqual(models.Member.objects.get(email="fresh@example.com").badge, "FF:00")
+
+    def test_update_and_dry_run(self):
+        lines = [u"old@example.com,,Renamed,AA:01", u"new@example.com,,New,DD:00"]
+        result, _ = self.run_import(lines, update=True, dry_run=True)
+        self.assertEqual((result.created, result.updated), (1, 1))
+        self.assertFalse(models.Member.objects.filter(email="new@example.com").exists())
+        self.assertEqual(models.Member.objects.get(email="old@example.com").name, "Old")
+
+        result, _ = self.run_import(lines)
+        self.assertEqual((result.created, result.unchanged), (1, 1))
+        self.assertEqual(models.Member.objects.get(email="old@example.com").name, "Old")
+
+        result, _ = self.run_import(lines, update=True)
+        self.assertEqual((result.updated, result.unchanged), (1, 1))
+        old = models.Member.objects.get(email="old@example.com")
+        self.assertEqual((old.name, old.badge), ("Renamed", "AA:01"))
+
+    def test_command_with_json(self):
+        path = self.write("members.ndjson", u'{"email": "j@example.com", "name": "J", "badge": "FF:00"}\n[1]\n')
+        out, err = StringIO(), StringIO()
+        call_command("importcsv", project_key=[self.project.key], filename=[path], stdout=out, stderr=err)
+        self.assertIn("Imported 1 new members, 0 updated, 0 unchanged, 1 rejected", out.getvalue())
+        self.assertIn("Line 2: not a JSON object", err.getvalue())
+        self.assertTrue(models.Member.objects.filter(email="j@example.com", project=self.project).exists())
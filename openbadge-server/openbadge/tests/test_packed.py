@@ -0,0 +1,144 @@
+from django.test import TestCase
+import simplejson as json
+
+import io
+import os
+import shutil
+import tempfile
+
+from django.core.management import call_command
+
+from openbadge import models, packed
+
+TESTDATA_DIR = os.path.join(os.path.dirname(__file__), "testdata")
+
+
+class TestPacked(TestCase):
+
+    def load_chunks(self, entry_type, data_type):
+        with open(os.path.join(TESTDATA_DIR, "{}_{}_entry.txt".format(entry_type, data_type)), "rb") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def pack(self, chunks):
+        return packed.file_header("test") + b"".join(packed.encode_chunk(chunk) for chunk in chunks)
+
+    def test_round_trip(self):
+        for data_type in ["audio", "proximity"]:
+            for entry_type in ["single", "multi"]:
+                chunks = self.load_chunks(entry_type, data_type)
+                self.assertEqual(list(packed.iter_chunks(io.BytesIO(self.pack(chunks)))), chunks)
+
+    def test_smaller_than_json(self):
+        for data_type in ["audio", "proximity"]:
+            chunks = self.load_chunks("multi", data_type)
+            json_size = sum(len(json.dumps(chunk)) + 1 for chunk in chunks)
+            self.assertLess(len(self.pack(chunks)) * 2, json_size)
+
+    def test_unusual_chunks(self):
+        chunks = [
+            {"type": "custom", "log_timestamp": 1.5, "data": {"samples": [1, "two"], "nested": [None, True, 2.5]}},
+            {"type": u"caf\xe9", "log_timestamp": 2, "log_index": -1,
+             "data": {"samples": [2 ** 20, -2 ** 20], "rssi_distances": {"abc": {"count": 1, "rssi": -50}}}},
+            {"type": "proximity received", "log_timestamp": 3.25, "log_index": 7,
+             "data": {"samples": [], "rssi_distances": {"12": {"count": 3, "rssi": -70}}}},
+        ]
+        self.assertEqual(list(packed.iter_chunks(io.BytesIO(self.pack(chunks)))), chunks)
+
+    def test_legacy_positions(self):
+        chunks = [
+            {"type": "audio received", "data": {"samples": [1, 2]}},
+            {"type": "audio received", "log_timestamp": None, "log_index": None},
+            {"type": "audio received", "log_timestamp": "1500000000.5", "log_index": "12"},
+            {"type": "audio received", "log_timestamp": 1500000001.5, "log_index": 2 ** 70},
+            {"type": "audio received", "log_timestamp": 1500000002, "log_index": 3.0},
+        ]
+        data = self.pack(chunks)
+        self.assertEqual(list(packed.iter_chunks(io.BytesIO(data))), chunks)
+
+        f = io.BytesIO(data)
+        packed.read_header(f)
+        positions = [packed.record_position(packed.read_record(f)) for _ in chunks]
+        self.assertEqual(positions, [(None, None), (None, None), (None, None), (1500000001.5, None),
+                                     (1500000002.0, None)])
+
+    def test_header(self):
+        f = io.BytesIO(self.pack([]))
+        header = packed.read_header(f)
+        self.assertEqual(header["data_type"], "test")
+        self.assertEqual(header["version"], packed.VERSION)
+
+        with self.assertRaises(packed.PackedFormatError):
+            packed.read_header(io.BytesIO(b'{"type": "audio received"}\n'))
+
+    def test_truncated_record_ends_file(self):
+        chunks = self.load_chunks("multi", "proximity")
+        data = self.pack(chunks)
+        self.assertEqual(list(packed.iter_chunks(io.BytesIO(data[:-3]))), chunks[:-1])
+
+
+class TestConvertDatafiles(TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        project = models.Project.objects.create(name="test-project")
+        hub = models.Hub.objects.create(name="hub", uuid="hub", project=project)
+        self.datafile = models.DataFile.objects.create(uuid="hub_audio", data_type="audio", hub=hub, project=project,
+                                                       filepath=os.path.join(self.data_dir, "hub_audio.txt"))
+        shutil.copy(os.path.join(TESTDATA_DIR, "multi_audio_entry.txt"), self.datafile.filepath)
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def test_convert_and_back(self):
+        chunks = list(self.datafile.get_chunks())
+
+        call_command("convert_datafiles", to=["packed"], min_age=0, stdout=io.BytesIO())
+        datafile = models.DataFile.objects.get(pk=self.datafile.pk)
+        self.assertEqual(datafile.storage_format, "packed")
+        self.assertEqual(list(datafile.get_chunks()), chunks)
+        self.assertFalse(os.path.exists(self.datafile.filepath))
+
+        call_command("convert_datafiles", to=["json"], min_age=0, stdout=io.BytesIO())
+        datafile = models.DataFile.objects.get(pk=self.datafile.pk)
+        self.assertEqual(datafile.filepath, self.datafile.filepath)
+        self.assertEqual(list(datafile.get_chunks()), chunks)
+
+    def test_legacy_chunks(self):
+        chunks = [
+            {"type": "audio received", "log_index": 1, "data": {"samples": [1, 2]}},
+            {"type": "audio received", "log_timestamp": None, "log_index": None},
+            {"type": "audio received", "log_timestamp": "soon", "log_index": "2"},
+            {"type": "audio received", "log_timestamp": 1500000000.5, "log_index": 3},
+        ]
+        with open(self.datafile.filepath, "wb") as f:
+            for chunk in chunks:
+                f.write(json.dumps(chunk) + "\n")
+
+        call_command("convert_datafiles", to=["packed"], min_age=0, stdout=io.BytesIO())
+        datafile = models.DataFile.objects.get(pk=self.datafile.pk)
+        self.assertEqual(datafile.storage_format, "packed")
+        self.assertEqual(list(datafile.get_chunks()), chunks)
+
+        call_command("convert_datafiles", to=["json"], min_age=0, stdout=io.BytesIO())
+        datafile = models.DataFile.objects.get(pk=self.datafile.pk)
+        self.assertEqual(list(datafile.get_chunks()), chunks)
+
+    def test_recently_modified_is_skipped(self):
+        out = io.BytesIO()
+        call_command("convert_datafiles", to=["packed"], stdout=out)
+        self.assertIn("may still be receiving uploads", out.getvalue())
+        datafile = models.DataFile.objects.get(pk=self.datafile.pk)
+        self.assertEqual((datafile.filepath, datafile.storage_format), (self.datafile.filepath, "json"))
+
+    def test_path_too_long_is_skipped(self):
+        # one character short of what the converted path needs
+        filepath = os.path.join(self.data_dir, "hub_audio".ljust(65 - len(self.data_dir) - 5, "x") + ".txt")
+        os.rename(self.datafile.filepath, filepath)
+        models.DataFile.objects.filter(pk=self.datafile.pk).update(filepath=filepath)
+
+        out = io.BytesIO()
+        call_command("convert_datafiles", to=["packed"], min_age=0, stdout=out)
+        self.assertIn("longer than the 65 characters", out.getvalue())
+        datafile = models.DataFile.objects.get(pk=self.datafile.pk)
+        self.assertEqual((datafile.filepath, datafile.storage_format), (filepath, "json"))
+        self.assertTrue(os.path.exists(filepath))
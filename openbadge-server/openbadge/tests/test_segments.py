@@ -0,0 +1,135 @@
+from django.test import TestCase
+from django.test.utils import override_settings
+import simplejson as json
+
+import io
+import os
+import shutil
+import tempfile
+
+from django.core.management import call_command
+
+from openbadge import models
+
+DAY = 24 * 60 * 60
+START = 1478736000  # 2016-11-10T00:00:00Z
+
+
+class TestDataFileSegments(TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        project = models.Project.objects.create(name="test-project")
+        hub = models.Hub.objects.create(name="hub", uuid="hub", project=project)
+        self.datafile = models.DataFile(uuid="hub_audio", data_type="audio", hub=hub, project=project,
+                                        filepath=os.path.join(self.data_dir, "hub_audio.txt"))
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def make_chunks(self, start, count, step=60):
+        return [{"log_timestamp": start + i * step, "log_index": i, "data": {"samples": [i] * 10}}
+                for i in range(count)]
+
+    def write(self, chunks):
+        with self.datafile.open_writer() as writer:
+            for chunk in chunks:
+                writer.write_chunk(chunk)
+        return writer
+
+    def test_one_segment_per_day(self):
+        chunks = self.make_chunks(START, 3 * 24, step=60 * 60)
+        self.write(chunks)
+
+        segments = list(self.datafile.get_segments())
+        self.assertEqual(len(segments), 3)
+        for day, segment in enumerate(segments):
+            self.assertEqual(segment.period_start, START + day * DAY)
+            self.assertEqual(segment.chunk_count, 24)
+            self.assertEqual(float(segment.first_log_timestamp), START + day * DAY)
+            self.assertEqual(float(segment.last_log_timestamp), START + day * DAY + 23 * 60 * 60)
+            self.assertEqual(segment.first_log_index, day * 24)
+            self.assertEqual(segment.last_log_index, day * 24 + 23)
+            self.assertEqual(segment.size, os.path.getsize(segment.filepath))
+        self.assertTrue(segments[0].filepath.endswith("20161110T000000Z-000.txt"))
+        self.assertEqual(list(self.datafile.get_chunks()), chunks)
+
+    def test_appends_continue_current_segment(self):
+        chunks = self.make_chunks(START, 20)
+        self.write(chunks[:10])
+        self.write(chunks[10:])
+
+        segment = self.datafile.segments.get()
+        self.assertEqual(segment.chunk_count, 20)
+        self.assertEqual(segment.last_log_index, 19)
+        self.assertEqual(list(self.datafile.get_chunks()), chunks)
+
+    def test_concurrent_appends_are_merged(self):
+        chunks = self.make_chunks(START, 20)
+        self.write(chunks[:1])
+        first = self.datafile.open_writer()
+        second = models.DataFile.objects.get(pk=self.datafile.pk).open_writer()
+        with first:
+            with second:
+                for chunk in chunks[10:]:
+                    second.write_chunk(chunk)
+            for chunk in chunks[1:10]:
+                first.write_chunk(chunk)
+
+        segment = self.datafile.segments.get()
+        self.assertEqual(segment.chunk_count, 20)
+        self.assertEqual((segment.first_log_index, segment.last_log_index), (0, 19))
+        self.assertEqual(float(segment.last_log_timestamp), START + 19 * 60)
+        self.assertEqual(segment.size, os.path.getsize(segment.filepath))
+
+    def test_rolls_over_on_size(self):
+        chunks = self.make_chunks(START, 100)
+        with override_settings(DATAFILE_SEGMENT_MAX_SIZE=1000):
+            self.write(chunks)
+
+        segments = list(self.datafile.get_segments())
+        self.assertGreater(len(segments), 1)
+        self.assertEqual(sum(segment.chunk_count for segment in segments), 100)
+        self.assertEqual(list(self.datafile.get_chunks()), chunks)
+
+    def test_time_range_skips_segments(self):
+        chunks = self.make_chunks(START, 3 * 24, step=60 * 60)
+        self.write(chunks)
+
+        start = START + DAY + 60 * 60
+        end = START + 2 * DAY - 1
+        self.assertEqual(self.datafile.get_segments(start, end).count(), 1)
+        self.assertEqual(list(self.datafile.get_chunks(start, end)),
+                         [chunk for chunk in chunks if start <= chunk["log_timestamp"] <= end])
+
+    def test_unsegmented_file_is_read_first(self):
+        old_chunks = self.make_chunks(START - DAY, 5)
+        with open(self.datafile.filepath, "w") as f:
+            for chunk in old_chunks:
+                f.write(json.dumps(chunk) + "\n")
+        new_chunks = self.make_chunks(START, 5)
+        self.write(new_chunks)
+
+        self.assertEqual(list(self.datafile.get_chunks()), old_chunks + new_chunks)
+
+    def test_prune(self):
+        self.write(self.make_chunks(START, 3 * 24, step=60 * 60))
+        paths = [segment.filepath for segment in self.datafile.get_segments()]
+
+        call_command("prune_datafiles", before=["2016-11-12"], stdout=io.BytesIO())
+        self.assertEqual(self.datafile.segments.count(), 1)
+        self.assertFalse(os.path.exists(paths[0]))
+        self.assertFalse(os.path.exists(paths[1]))
+        self.assertTrue(os.path.exists(paths[2]))
+
+    def test_convert_segments(self):
+        chunks = self.make_chunks(START, 2 * 24, step=60 * 60)
+        self.write(chunks)
+
+        call_command("convert_datafiles", to=["packed"], min_age=0, stdout=io.BytesIO())
+        datafile = models.DataFile.objects.get(pk=self.datafile.pk)
+        self.assertEqual(datafile.storage_format, "packed")
+        for segment in datafile.get_segments():
+            self.assertEqual(segment.storage_format, "packed")
+            self.assertEqual(segment.size, os.path.getsize(segment.filepath))
+        self.assertEqual(list(datafile.get_chunks()), chunks)
@@ -0,0 +1,84 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils.six import StringIO
+import simplejson as json
+
+from openbadge import models, telemetry
+
+APP_KEY = settings.APP_KEY
+# a whole hour, so the rollups line up
+T0 = 1478800800
+
+
+class TestTelemetry(TestCase):
+
+    def setUp(self):
+        self.project = models.Project.objects.create(name="test-project")
+        self.hub = models.Hub.objects.create(name="hub", uuid="telemetry-hub", project=self.project)
+        self.members = [models.Member.objects.create(name="M{}".format(n), email="m{}@example.com".format(n),
+                                                     badge="badge{}".format(n), project=self.project, last_seen_ts=0)
+                        for n in range(2)]
+
+    def report(self, seen_ts, voltage, members=None):
+        response = self.client.post('/badges/status', json.dumps([
+            {"key": member.key, "last_seen_ts": str(seen_ts), "last_voltage": str(voltage)}
+            for member in members or self.members
+        ]), content_type="application/json", HTTP_X_HUB_UUID=self.hub.uuid, HTTP_X_APPKEY=APP_KEY)
+        self.assertEqual(response.status_code, 200)
+
+    def get(self, **params):
+        response = self.client.get('/{}/telemetry'.format(self.project.key), params,
+                                   HTTP_X_HUB_UUID=self.hub.uuid, HTTP_X_APPKEY=APP_KEY)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def test_samples_and_rollups(self):
+        # every 20 seconds for two hours, voltage dropping 0.001 a report
+        for n in range(360):
+            self.report(T0 + n * 20, Decimal("3.000") - Decimal(n) / 1000)
+        # a report that doesn't move last_seen_ts forward isn't a sample
+        self.report(T0, "1.0")
+        self.assertEqual(models.BadgeSample.objects.count(), 720)
+
+        self.assertEqual(telemetry.rollup(T0, T0 + 2 * telemetry.HOUR), (240, 4))
+        # again, same result
+        self.assertEqual(telemetry.rollup(T0 + 30 * 60, T0 + 2 * telemetry.HOUR), (180, 4))
+        self.assertEqual(models.BadgeRollup.objects.count(), 244)
+
+        hour = models.BadgeRollup.objects.get(member=self.members[0], resolution=telemetry.HOUR, period_start=T0)
+        self.assertEqual((hour.sample_count, hour.voltage_max, hour.voltage_min), (180, 3, Decimal("2.821")))
+        self.assertEqual((hour.first_seen_ts, hour.last_seen_ts), (T0, T0 + 179 * 20))
+        self.assertEqual(hour.to_dict()["voltage_mean"], Decimal("2.9105"))
+
+        body = self.get(start=T0, end=T0 + 2 * telemetry.HOUR, badges=self.members[1].key)
+        self.assertEqual(body["resolution"], telemetry.MINUTE)
+        self.assertEqual(list(body["badges"].keys()), [self.members[1].key])
+        self.assertEqual(len(body["badges"][self.members[1].key]), 120)
+
+        body = self.get(start=T0, end=T0 + 2 * telemetry.DAY)
+        self.assertEqual(body["resolution"], telemetry.HOUR)
+        self.assertEqual([point["samples"] for point in body["badges"][self.members[0].key]], [180, 180])
+
+        body = self.get(start=T0 + 60, end=T0 + 100, resolution="raw")
+        self.assertEqual([point["seen_ts"] for point in body["badges"][self.members[0].key]],
+                         ["1478800860.000", "1478800880.000", "1478800900.000"])
+
+    @override_settings(TELEMETRY_RAW_DAYS=1, TELEMETRY_MINUTE_DAYS=2, TELEMETRY_HOUR_DAYS=0)
+    def test_retention(self):
+        for days in (3, 1.5, 0.5):
+            self.report(T0 - days * telemetry.DAY, "3.0", self.members[:1])
+        telemetry.rollup(T0 - 4 * telemetry.DAY, T0)
+
+        self.assertEqual(telemetry.prune(T0), {0: 2, telemetry.MINUTE: 1, telemetry.HOUR: 0})
+        self.assertEqual(models.BadgeSample.objects.count(), 1)
+        self.assertEqual(models.BadgeRollup.objects.filter(resolution=telemetry.MINUTE).count(), 2)
+        self.assertEqual(models.BadgeRollup.objects.filter(resolution=telemetry.HOUR).count(), 3)
+
+    def test_command(self):
+        out = StringIO()
+        call_command("rollup_telemetry", stdout=out)
+        self.assertIn("Deleted 0 samples", out.getvalue())
@@ -1,13 +1,26 @@
 from django.contrib.auth.models import AnonymousUser
-from django.test import TestCase, RequestFactory
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, RequestFactory, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
 import simplejson as json
 from django.conf import settings
+from django.http import JsonResponse
 
+from decimal import Decimal
 import os
 import glob
+import gzip
+import io
+import shutil
+import tempfile
+import time
+import zlib
 
+from config import middleware
+from openbadge import hubcache
 from openbadge import views
 from openbadge import models
+from openbadge import chunkindex
 APP_KEY = settings.APP_KEY
 PROJECT_DIR = os.path.expanduser("~/openbadge-server/{}")
 INPUT_FILE = PROJECT_DIR.format(
@@ -178,3 +191,716 @@ class TestDatafile(TestCase):
         for data_file in data_files:
             self.assertTrue(os.path.exists(data_file))
 
+
+TESTDATA_DIR = os.path.join(os.path.dirname(__file__), "testdata")
+
+
+class TestDatafileStream(TestCase):
+    """
+    Tests for the newline-delimited (Content-Type: application/x-ndjson) datafile upload mode
+    """
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.data_dir = tempfile.mkdtemp() + "/"
+        self.settings_override = override_settings(DATA_DIR=self.data_dir)
+        self.settings_override.enable()
+
+        self.project = models.Project.objects.create(name="test-project")
+        self.hub = models.Hub.objects.create(name=_hub_name("one"), uuid=_hub_name("one"),
+                                             project=self.project)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.data_dir)
+
+    def read_testdata(self, entry_type, data_type):
+        with open(os.path.join(TESTDATA_DIR, "{}_{}_entry.txt".format(entry_type, data_type)), "rb") as f:
+            return f.read()
+
+    def post_stream(self, data_type, body):
+        request = self.factory.post(
+                    '/{}/datafiles?data_type={}'.format(self.project.key, data_type),
+                    body,
+                    content_type="application/x-ndjson",
+                    HTTP_X_HUB_UUID=self.hub.uuid,
+                    HTTP_X_APPKEY=APP_KEY)
+        request.user = AnonymousUser()
+        return json.loads(views.post_datafile(request, self.project.key).content)
+
+    def read_datafile(self, data_type):
+        datafile = models.DataFile.objects.get(uuid=self.hub.uuid + "_" + data_type)
+        return b"".join(open(segment.filepath, "rb").read() for segment in datafile.get_segments())
+
+    def test_stream_writes_original_bytes(self):
+        for data_type in ["audio", "proximity"]:
+            body = self.read_testdata("multi", data_type)
+            resp_json = self.post_stream(data_type, body)
+
+            self.assertEqual(resp_json["status"], "success")
+            self.assertEqual(resp_json["chunks_written"], resp_json["chunks_received"])
+            self.assertEqual(self.read_datafile(data_type).strip(), body.strip())
+
+            datafile = models.DataFile.objects.get(uuid=self.hub.uuid + "_" + data_type)
+            last_chunk = json.loads(body.strip().splitlines()[-1])
+            self.assertEqual(float(datafile.last_update_timestamp), last_chunk["log_timestamp"])
+
+    def test_stream_appends(self):
+        body = self.read_testdata("single", "audio")
+        self.post_stream("audio", body)
+        self.post_stream("audio", body)
+
+        lines = self.read_datafile("audio").splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[0], lines[1])
+
+    def test_stream_skips_malformed_chunks(self):
+        body = self.read_testdata("single", "audio").strip() + b"\nnot a chunk\n{\"no\": \"timestamp\"}\n"
+        resp_json = self.post_stream("audio", body)
+
+        self.assertEqual(resp_json["chunks_received"], 3)
+        self.assertEqual(resp_json["chunks_written"], 1)
+
+    def test_stream_matches_json_upload(self):
+        body = self.read_testdata("multi", "proximity")
+        self.post_stream("proximity", body)
+
+        chunks = [json.loads(line) for line in body.splitlines() if line.strip()]
+        request = self.factory.post(
+                    '/{}/datafiles'.format(self.project.key),
+                    {"data_type": "audio", "chunks": json.dumps(chunks)},
+                    HTTP_X_HUB_UUID=self.hub.uuid,
+                    HTTP_X_APPKEY=APP_KEY)
+        request.user = AnonymousUser()
+        views.post_datafile(request, self.project.key)
+
+        streamed = [json.loads(line) for line in self.read_datafile("proximity").splitlines()]
+        posted = [json.loads(line) for line in self.read_datafile("audio").splitlines()]
+        self.assertEqual(streamed, posted)
+
+    def test_stream_packed_format(self):
+        body = self.read_testdata("multi", "audio")
+        with override_settings(DATAFILE_FORMAT="packed"):
+            resp_json = self.post_stream("audio", body)
+        self.assertEqual(resp_json["chunks_written"], resp_json["chunks_received"])
+
+        datafile = models.DataFile.objects.get(uuid=self.hub.uuid + "_audio")
+        self.assertEqual(datafile.storage_format, "packed")
+        self.assertTrue(datafile.segments.get().filepath.endswith(".obpk"))
+        self.assertEqual(list(datafile.get_chunks()), [json.loads(line) for line in body.splitlines()])
+
+    def test_stream_requires_data_type(self):
+        request = self.factory.post(
+                    '/{}/datafiles'.format(self.project.key),
+                    self.read_testdata("single", "audio"),
+                    content_type="application/x-ndjson",
+                    HTTP_X_HUB_UUID=self.hub.uuid,
+                    HTTP_X_APPKEY=APP_KEY)
+        request.user = AnonymousUser()
+        self.assertEqual(views.post_datafile(request, self.project.key).status_code, 400)
+
+
+class TestDatafileRead(TestCase):
+    """
+    GET /:project/datafiles streams stored chunks back as newline-delimited JSON
+    """
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp() + "/"
+        self.settings_override = override_settings(DATA_DIR=self.data_dir)
+        self.settings_override.enable()
+
+        self.project = models.Project.objects.create(name="test-project")
+        self.hubs = [models.Hub.objects.create(name=_hub_name(name), uuid=_hub_name(name), project=self.project)
+                     for name in ("one", "two")]
+
+        self.chunks = [{"type": "audio received", "log_timestamp": 1000.0 + i, "log_index": i, "data": {"n": i}}
+                       for i in range(50)]
+        for hub in self.hubs:
+            for data_type in ("audio", "proximity"):
+                datafile = models.DataFile(uuid=hub.uuid + "_" + data_type, data_type=data_type, hub=hub,
+                                           project=self.project, filepath="{}{}_{}.txt".format(
+                                               self.data_dir, hub.uuid, data_type))
+                with datafile.open_writer() as writer:
+                    for chunk in self.chunks:
+                        writer.write_chunk(chunk)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.data_dir)
+
+    def get(self, headers=None, **params):
+        headers = headers or {"HTTP_X_HUB_UUID": self.hubs[0].uuid}
+        response = self.client.get('/{}/datafiles'.format(self.project.key), params, HTTP_X_APPKEY=APP_KEY,
+                                   **headers)
+        if response.status_code != 200:
+            return response.status_code, None
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        return response.status_code, [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+
+    def test_filters(self):
+        status, chunks = self.get(hub=self.hubs[1].uuid, data_type="proximity", start=1010, end=1019.5)
+        self.assertEqual(status, 200)
+        self.assertEqual([chunk["log_index"] for chunk in chunks], list(range(10, 20)))
+        self.assertTrue(all(chunk["hub"] == self.hubs[1].uuid and chunk["data_type"] == "proximity"
+                            for chunk in chunks))
+
+        status, chunks = self.get(data_type="audio", from_index=45)
+        self.assertEqual([(chunk["hub"], chunk["log_index"]) for chunk in chunks],
+                         [(hub.uuid, i) for hub in self.hubs for i in range(45, 50)])
+
+    def test_everything(self):
+        status, chunks = self.get()
+        self.assertEqual(len(chunks), 4 * len(self.chunks))
+
+    def test_god_key(self):
+        status, chunks = self.get(headers={"HTTP_X_GODKEY": settings.GOD_KEY}, to_index=0)
+        self.assertEqual(status, 200)
+        self.assertEqual(len(chunks), 4)
+
+    def test_other_project_hub(self):
+        other = models.Project.objects.create(name="other-project")
+        hub = models.Hub.objects.create(name=_hub_name("other"), uuid=_hub_name("other"), project=other)
+        status, _ = self.get(headers={"HTTP_X_HUB_UUID": hub.uuid})
+        self.assertEqual(status, 401)
+
+    def test_bad_range(self):
+        status, _ = self.get(start="yesterday")
+        self.assertEqual(status, 400)
+
+
+class TestMeetingDelta(TestCase):
+    """
+    PUT /:project/meetings with from_index / from_offset only appends the tail of the log
+    """
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.media_root = tempfile.mkdtemp() + "/"
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+        self.project = models.Project.objects.create(name="test-project")
+        self.hub = models.Hub.objects.create(name=_hub_name("one"), uuid=_hub_name("one"),
+                                             project=self.project)
+
+        self.lines = [json.dumps({"type": "meeting started", "log_index": 0, "log_timestamp": 1000.0,
+                                  "data": {"uuid": "m1", "log_version": "2.0", "start_time": 1000.0}}) + "\n"]
+        self.lines += [json.dumps({"type": "member changed", "log_index": i, "log_timestamp": 1000.0 + i,
+                                   "data": {"change": "join", "member_key": "M{}".format(i)}}) + "\n"
+                       for i in range(1, 20)]
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def put(self, lines, **data):
+        upload = SimpleUploadedFile("log.txt", "".join(lines).encode("utf-8"))
+        data.update({"file": upload})
+        request = self.factory.generic('PUT', '/{}/meetings'.format(self.project.key),
+                                       encode_multipart(BOUNDARY, data),
+                                       content_type=MULTIPART_CONTENT,
+                                       HTTP_X_HUB_UUID=self.hub.uuid,
+                                       HTTP_X_APPKEY=APP_KEY)
+        request.user = AnonymousUser()
+        return json.loads(views.put_meeting(request, self.project.key).content)
+
+    def read_log(self):
+        with open(models.Meeting.objects.get(uuid="m1").log_file.path) as f:
+            return f.readlines()
+
+    def test_full_upload_reports_high_water_mark(self):
+        resp_json = self.put(self.lines[:10])
+        self.assertEqual(resp_json["last_log_index"], 9)
+        self.assertEqual(resp_json["log_size"], len("".join(self.lines[:10])))
+
+    def test_append_from_index(self):
+        self.put(self.lines[:10])
+        # overlaps with what the server has, only 10.. should be appended
+        resp_json = self.put(self.lines[5:], uuid="m1", from_index=5)
+
+        self.assertEqual(resp_json["chunks_appended"], 10)
+        self.assertEqual(resp_json["last_log_index"], 19)
+        self.assertEqual(self.read_log(), self.lines)
+        self.assertEqual(models.Meeting.objects.get(uuid="m1").last_update_index, 19)
+
+    def test_append_from_offset(self):
+        self.put(self.lines[:10])
+        offset = len("".join(self.lines[:8]))
+        resp_json = self.put(self.lines[8:], uuid="m1", from_offset=offset)
+
+        self.assertEqual(resp_json["last_log_index"], 19)
+        self.assertEqual(resp_json["log_size"], len("".join(self.lines)))
+        self.assertEqual(self.read_log(), self.lines)
+
+    def test_gap_is_a_mismatch(self):
+        self.put(self.lines[:10])
+        resp_json = self.put(self.lines[12:], uuid="m1", from_index=12)
+
+        self.assertEqual(resp_json["status"], "log mismatch")
+        self.assertEqual(resp_json["last_log_index"], 9)
+        self.assertEqual(self.read_log(), self.lines[:10])
+
+        resp_json = self.put(self.lines[12:], uuid="m1", from_offset=resp_json["log_size"] + 1)
+        self.assertEqual(resp_json["status"], "log mismatch")
+
+    def test_completes_meeting(self):
+        self.put(self.lines[:10])
+        self.put(self.lines[10:], uuid="m1", from_index=10, is_complete="true", ending_method="manual")
+
+        meeting = models.Meeting.objects.get(uuid="m1")
+        self.assertTrue(meeting.is_complete)
+        self.assertEqual(float(meeting.end_time), 1019.0)
+
+    def test_chunks_and_meta(self):
+        self.put(self.lines)
+        meeting = models.Meeting.objects.get(uuid="m1")
+
+        chunks = meeting.get_chunks()
+        self.assertFalse(isinstance(chunks, list))
+        self.assertEqual(list(chunks), [json.loads(line) for line in self.lines[1:]])
+
+        meta = meeting.get_meta()
+        self.assertEqual(meta["data"]["uuid"], "m1")
+        self.assertEqual(meta["members"], ["M{}".format(i) for i in range(1, 20)])
+        self.assertEqual(meta["log_index"], 19)
+
+    def test_header_is_stored(self):
+        received = json.dumps({"type": "audio received", "log_index": 20, "log_timestamp": 1020.0,
+                               "data": {"member": "M1"}}) + "\n"
+        late_join = json.dumps({"type": "member changed", "log_index": 21, "log_timestamp": 1021.0,
+                                "data": {"change": "join", "member_key": "M21"}}) + "\n"
+        self.put(self.lines[:5])
+        self.assertEqual(models.Meeting.objects.get(uuid="m1").header["members"], ["M1", "M2", "M3", "M4"])
+
+        self.put(self.lines[5:] + [received, late_join], uuid="m1", from_index=5)
+        meeting = models.Meeting.objects.get(uuid="m1")
+        self.assertTrue(meeting.header_complete)
+
+        # listings don't need the log any more
+        os.remove(meeting.log_file.path)
+        meta = meeting.get_meta()
+        self.assertEqual(meta["members"], ["M{}".format(i) for i in range(1, 20)])
+        self.assertEqual(meta["type"], "meeting started")
+
+        # replacing the log replaces the header
+        self.put(self.lines[:3])
+        self.assertEqual(models.Meeting.objects.get(uuid="m1").get_meta()["members"], ["M1", "M2"])
+
+    def test_time_range_uses_index(self):
+        with override_settings(CHUNK_INDEX_INTERVAL=4):
+            self.put(self.lines[:10])
+            self.put(self.lines[10:], uuid="m1", from_index=10)
+
+        meeting = models.Meeting.objects.get(uuid="m1")
+        offset, ordered = chunkindex.lookup(meeting.log_file.path, 1012.0)
+        self.assertTrue(ordered)
+        self.assertEqual(offset, len("".join(self.lines[:8])))
+        self.assertEqual([chunk["log_index"] for chunk in meeting.get_chunks(1012.0, 1015.0)], [12, 13, 14, 15])
+        self.assertEqual([chunk["log_index"] for chunk in meeting.get_chunks(end=1002.0)], [1, 2])
+
+
+class TestMeetingListing(TestCase):
+    """
+    GET /:project/meetings streams its response and can be paged with X-PAGE-SIZE / X-CURSOR
+    """
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp() + "/"
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+        self.project = models.Project.objects.create(name="test-project")
+        self.hub = models.Hub.objects.create(name=_hub_name("one"), uuid=_hub_name("one"), project=self.project)
+        for n in range(5):
+            lines = [json.dumps({"type": "meeting started", "log_index": 0, "log_timestamp": 1000.0,
+                                 "data": {"uuid": "m{}".format(n), "log_version": "2.0", "start_time": 1000.0}})]
+            lines += [json.dumps({"type": "audio received", "log_index": i, "log_timestamp": 1000.0 + i,
+                                  "data": {"member": "M1"}}) for i in range(1, 4)]
+            upload = SimpleUploadedFile("log.txt", "\n".join(lines) + "\n")
+            self.client.generic('PUT', '/{}/meetings'.format(self.project.key),
+                                encode_multipart(BOUNDARY, {"file": upload}), content_type=MULTIPART_CONTENT,
+                                HTTP_X_HUB_UUID=self.hub.uuid, HTTP_X_APPKEY=APP_KEY)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def get(self, path="meetings", **headers):
+        response = self.client.get('/{}/{}'.format(self.project.key, path), HTTP_X_HUB_UUID=self.hub.uuid,
+                                   HTTP_X_APPKEY=APP_KEY, **headers)
+        self.assertTrue(response.streaming)
+        return response, json.loads(b"".join(response.streaming_content))
+
+    def test_same_as_to_object(self):
+        _, body = self.get(HTTP_X_GET_FILE="true")
+        # what the endpoint returned before it streamed
+        expected = json.loads(JsonResponse(self.project.get_meetings(True)).content)
+        self.assertEqual(body, expected)
+        self.assertEqual(len(body["meetings"]), 5)
+        self.assertEqual(len(list(body["meetings"].values())[0]["chunks"]), 3)
+
+        _, body = self.get()
+        self.assertEqual(body, json.loads(JsonResponse(self.project.get_meetings(False)).content))
+
+    def test_single_meeting(self):
+        meeting = models.Meeting.objects.get(uuid="m3")
+        _, body = self.get("meetings/m3", HTTP_X_GET_FILE="true")
+        self.assertEqual(list(body.keys()), [meeting.key])
+        self.assertEqual(len(body[meeting.key]["chunks"]), 3)
+
+        response = self.client.get('/{}/meetings/nope'.format(self.project.key), HTTP_X_APPKEY=APP_KEY)
+        self.assertEqual(response.status_code, 404)
+
+    def test_pages(self):
+        keys = []
+        cursor = ""
+        pages = 0
+        while True:
+            response, body = self.get(HTTP_X_PAGE_SIZE="2", HTTP_X_CURSOR=cursor)
+            pages += 1
+            keys.extend(body["meetings"].keys())
+            if not response.has_header("X-NEXT-CURSOR"):
+                break
+            cursor = response["X-NEXT-CURSOR"]
+
+        self.assertEqual(pages, 3)
+        self.assertEqual(sorted(keys), sorted(models.Meeting.objects.values_list("key", flat=True)))
+
+
+class TestMemberSync(TestCase):
+    """
+    GET /:project/hubs returns the members changed since the X-MEMBER-SYNC-TOKEN of the previous response
+    """
+
+    def setUp(self):
+        self.project = models.Project.objects.create(name="test-project")
+        self.hub = models.Hub.objects.create(name=_hub_name("one"), uuid=_hub_name("one"), project=self.project)
+        for n in range(3):
+            self.add_member(n)
+
+    def add_member(self, n):
+        return models.Member.objects.create(name="M{}".format(n), email="m{}@example.com".format(n),
+                                            badge="badge{}".format(n), project=self.project)
+
+    def get(self, **headers):
+        response = self.client.get('/{}/hubs'.format(self.project.key), HTTP_X_HUB_UUID=self.hub.uuid,
+                                   HTTP_X_APPKEY=APP_KEY, **headers)
+        return response.status_code, json.loads(response.content) if response.status_code == 200 else None
+
+    def test_sync(self):
+        _, body = self.get(HTTP_X_MEMBER_SYNC_TOKEN="0")
+        self.assertEqual(sorted(body["members"].keys()), ["M0", "M1", "M2"])
+        self.assertEqual(body["badge_map"]["badge1"]["name"], "M1")
+        token = body["member_sync_token"]
+
+        _, body = self.get(HTTP_X_MEMBER_SYNC_TOKEN=token)
+        self.assertEqual(body["members"], {})
+        self.assertEqual(body["member_sync_token"], token)
+
+        self.add_member(3)
+        member = models.Member.objects.get(name="M0")
+        member.badge = "new-badge"
+        member.save()
+        _, body = self.get(HTTP_X_MEMBER_SYNC_TOKEN=token)
+        self.assertEqual(sorted(body["members"].keys()), ["M0", "M3"])
+        self.assertEqual(body["badge_map"]["new-badge"]["name"], "M0")
+        self.assertGreater(long(body["member_sync_token"]), long(token))
+
+        self.assertEqual(self.get(HTTP_X_MEMBER_SYNC_TOKEN="soon")[0], 400)
+
+    def test_unchanged_poll_does_not_read_members(self):
+        _, body = self.get(HTTP_X_MEMBER_SYNC_TOKEN="0")
+        hub = models.Hub.objects.get(pk=self.hub.pk)
+        with self.assertNumQueries(2):
+            # the project's sync token and the completed meetings
+            hub.get_object(sync_token=long(body["member_sync_token"]))
+
+    def test_meeting_cursor(self):
+        meetings = [models.Meeting.objects.create(uuid="m{}".format(n), version=1, project=self.project,
+                                                  hub=self.hub, is_complete=n < 2, last_update_index=n)
+                    for n in range(4)]
+        _, body = self.get(HTTP_X_MEMBER_SYNC_TOKEN="0", HTTP_X_MEETING_CURSOR="0")
+        self.assertEqual(sorted(body["meetings"].keys()), sorted(m.key for m in meetings[:2]))
+        cursor = body["meeting_cursor"]
+
+        _, body = self.get(HTTP_X_MEMBER_SYNC_TOKEN="0", HTTP_X_MEETING_CURSOR=cursor)
+        self.assertEqual(body["meetings"], {})
+
+        meetings[3].is_complete = True
+        meetings[3].save()
+        _, body = self.get(HTTP_X_MEMBER_SYNC_TOKEN="0", HTTP_X_MEETING_CURSOR=cursor)
+        self.assertEqual(list(body["meetings"].keys()), [meetings[3].key])
+        self.assertEqual(body["meetings"][meetings[3].key]["last_log_serial"], 3)
+
+        # without a cursor, all of them
+        _, body = self.get(HTTP_X_MEMBER_SYNC_TOKEN="0")
+        self.assertEqual(len(body["meetings"]), 3)
+
+    def test_removed_meeting_resets_cursor(self):
+        meetings = [models.Meeting.objects.create(uuid="m{}".format(n), version=1, project=self.project,
+                                                  hub=self.hub, is_complete=True) for n in range(3)]
+        _, body = self.get(HTTP_X_MEMBER_SYNC_TOKEN="0", HTTP_X_MEETING_CURSOR="0")
+        self.assertFalse(body["meetings_reset"])
+        cursor = body["meeting_cursor"]
+
+        # reopened by a new upload
+        meetings[0].is_complete = False
+        meetings[0].save()
+        _, body = self.get(HTTP_X_MEMBER_SYNC_TOKEN="0", HTTP_X_MEETING_CURSOR=cursor)
+        self.assertTrue(body["meetings_reset"])
+        self.assertEqual(sorted(body["meetings"].keys()), sorted(m.key for m in meetings[1:]))
+        cursor = body["meeting_cursor"]
+        _, body = self.get(HTTP_X_MEMBER_SYNC_TOKEN="0", HTTP_X_MEETING_CURSOR=cursor)
+        self.assertEqual((body["meetings_reset"], body["meetings"]), (False, {}))
+
+        meetings[1].delete()
+        _, body = self.get(HTTP_X_MEMBER_SYNC_TOKEN="0", HTTP_X_MEETING_CURSOR=cursor)
+        self.assertTrue(body["meetings_reset"])
+        self.assertEqual(list(body["meetings"].keys()), [meetings[2].key])
+
+    def test_last_member_update_still_works(self):
+        _, body = self.get(HTTP_X_LAST_MEMBER_UPDATE="0")
+        self.assertEqual(len(body["members"]), 3)
+        _, body = self.get(HTTP_X_LAST_MEMBER_UPDATE=str(time.time() + 60))
+        self.assertEqual(body["members"], {})
+
+
+class TestRosterETags(TestCase):
+    """
+    GET /projects and GET /:project/hubs answer If-None-Match with a 304 until the project's roster changes
+    """
+
+    def setUp(self):
+        self.project = models.Project.objects.create(name="test-project")
+        self.hub = models.Hub.objects.create(name=_hub_name("one"), uuid=_hub_name("one"), project=self.project)
+        self.member = models.Member.objects.create(name="M0", email="m0@example.com", badge="badge0",
+                                                   project=self.project)
+
+    def get(self, path, **headers):
+        return self.client.get(path, HTTP_X_HUB_UUID=self.hub.uuid, HTTP_X_APPKEY=APP_KEY, **headers)
+
+    def assertCached(self, path, **headers):
+        response = self.get(path, **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.has_header("Last-Modified"))
+        etag = response["ETag"]
+        response = self.get(path, HTTP_IF_NONE_MATCH=etag, **headers)
+        self.assertEqual(response.status_code, 304)
+        return etag
+
+    def test_not_modified_until_roster_changes(self):
+        hubs_path = '/{}/hubs'.format(self.project.key)
+        for path in ('/projects', hubs_path):
+            etag = self.assertCached(path, HTTP_X_MEMBER_SYNC_TOKEN="0")
+
+            # badge status isn't part of the roster
+            self.member.last_voltage = 2.5
+            self.member.save()
+            self.assertEqual(self.get(path, HTTP_IF_NONE_MATCH=etag, HTTP_X_MEMBER_SYNC_TOKEN="0").status_code, 304)
+
+            self.member.name = "M0 " + path
+            self.member.save()
+            self.assertEqual(self.get(path, HTTP_IF_NONE_MATCH=etag, HTTP_X_MEMBER_SYNC_TOKEN="0").status_code, 200)
+
+        etag = self.assertCached(hubs_path, HTTP_X_MEMBER_SYNC_TOKEN="0")
+        # a different sync token gets a different body
+        self.assertEqual(self.get(hubs_path, HTTP_IF_NONE_MATCH=etag, HTTP_X_MEMBER_SYNC_TOKEN="1").status_code, 200)
+
+        self.hub.god = True
+        self.hub.save()
+        self.assertEqual(self.get(hubs_path, HTTP_IF_NONE_MATCH=etag, HTTP_X_MEMBER_SYNC_TOKEN="0").status_code, 200)
+
+    def test_renamed_project_changes_roster(self):
+        for path in ('/projects', '/{}/hubs'.format(self.project.key)):
+            etag = self.assertCached(path, HTTP_X_MEMBER_SYNC_TOKEN="0")
+            self.project.name = "renamed " + path
+            self.project.save()
+            self.assertEqual(self.get(path, HTTP_IF_NONE_MATCH=etag, HTTP_X_MEMBER_SYNC_TOKEN="0").status_code, 200)
+
+    def test_stale_cached_hub_does_not_match_newer_etag(self):
+        hubs_path = '/{}/hubs'.format(self.project.key)
+        stale = hubcache.get_hub(self.hub.uuid)
+        self.hub.name = _hub_name("renamed")
+        self.hub.save()
+        response = self.get(hubs_path, HTTP_X_MEMBER_SYNC_TOKEN="0")
+        self.assertEqual(json.loads(response.content)["name"], self.hub.name)
+
+        # another worker still caching the hub as it was
+        hubcache._cache().set(hubcache.cache_key(self.hub.uuid), stale)
+        response = self.get(hubs_path, HTTP_IF_NONE_MATCH=response["ETag"], HTTP_X_MEMBER_SYNC_TOKEN="0")
+        self.assertEqual(response.status_code, 200)
+
+    def test_saving_project_keeps_counters(self):
+        # read before the member's save, which saving it mustn't undo
+        project = models.Project.objects.get(pk=self.project.pk)
+        self.member.name = "M1"
+        self.member.save()
+        project.save()
+        saved = models.Project.objects.get(pk=project.pk)
+        self.assertEqual(saved.member_sync_seq, project.member_sync_seq + 1)
+        self.assertEqual(saved.roster_version, project.roster_version + 2)
+
+    def test_completed_meetings_change_roster(self):
+        etag = self.assertCached('/projects')
+        meeting = models.Meeting.objects.create(uuid="m1", version=1, project=self.project, hub=self.hub)
+        meeting.last_update_index = 5
+        meeting.save()
+        self.assertEqual(self.get('/projects', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        meeting = models.Meeting.objects.get(pk=meeting.pk)
+        meeting.is_complete = True
+        meeting.save()
+        self.assertEqual(self.get('/projects', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class TestBadgeStatus(TestCase):
+    """
+    POST /badges/status applies many badges' status reports at once, never moving a timestamp backwards
+    """
+
+    def setUp(self):
+        self.project = models.Project.objects.create(name="test-project")
+        self.hub = models.Hub.objects.create(name=_hub_name("one"), uuid=_hub_name("one"), project=self.project)
+        self.members = [models.Member.objects.create(name="M{}".format(n), email="m{}@example.com".format(n),
+                                                     badge="badge{}".format(n), project=self.project,
+                                                     last_seen_ts=1000, last_audio_ts=1000, last_proximity_ts=1000)
+                        for n in range(3)]
+        other = models.Project.objects.create(name="other-project")
+        self.stranger = models.Member.objects.create(name="S", email="s@example.com", badge="badgeS", project=other)
+
+    def post(self, badges):
+        response = self.client.post('/badges/status', json.dumps({"badges": badges}), content_type="application/json",
+                                    HTTP_X_HUB_UUID=self.hub.uuid, HTTP_X_APPKEY=APP_KEY)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)["badges"]
+
+    def test_bulk_update(self):
+        m0, m1, m2 = self.members
+        with self.assertNumQueries(7):
+            # hub, heartbeat, savepoint around the view, then one SELECT, one UPDATE and one INSERT of telemetry
+            # samples for all the badges
+            results = self.post([
+                {"key": m0.key, "last_seen_ts": "1100.5", "last_voltage": "2.9", "last_audio_ts": "900"},
+                {"key": m1.key, "last_audio_ts": "1200", "last_audio_ts_fract": "250", "last_proximity_ts": "1300"},
+                {"key": m2.key, "last_seen_ts": "999", "last_voltage": "1.0"},
+                {"key": self.stranger.key, "last_seen_ts": "2000"},
+                {"key": "NOSUCHKEY", "last_seen_ts": "2000"},
+            ])
+        self.assertEqual(results, [
+            {"key": m0.key, "status": "updated", "updated": ["last_seen_ts"]},
+            {"key": m1.key, "status": "updated", "updated": ["last_audio_ts", "last_proximity_ts"]},
+            {"key": m2.key, "status": "unchanged", "updated": []},
+            {"key": self.stranger.key, "status": "not_found"},
+            {"key": "NOSUCHKEY", "status": "not_found"},
+        ])
+
+        m0, m1, m2 = [models.Member.objects.get(pk=m.pk) for m in self.members]
+        self.assertEqual((m0.last_seen_ts, m0.last_voltage, m0.last_audio_ts),
+                         (Decimal("1100.5"), Decimal("2.9"), 1000))
+        self.assertEqual((m1.last_audio_ts, m1.last_audio_ts_fract, m1.last_proximity_ts), (1200, 250, 1300))
+        self.assertEqual((m2.last_seen_ts, m2.last_voltage), (1000, 0))
+        self.assertEqual(models.Member.objects.get(pk=self.stranger.pk).last_seen_ts, 0)
+
+    def test_single_update_only_moves_forward(self):
+        m0 = self.members[0]
+
+        def patch(**status):
+            response = self.client.patch('/badges/{}'.format(m0.key), json.dumps(status),
+                                         content_type="application/json",
+                                         HTTP_X_HUB_UUID=self.hub.uuid, HTTP_X_APPKEY=APP_KEY)
+            self.assertEqual(response.status_code, 200)
+            return json.loads(response.content)
+
+        body = patch(last_seen_ts="1500", last_voltage="2.5", last_proximity_ts="900")
+        self.assertEqual((body["last_seen_ts"], body["last_voltage"], body["last_proximity_ts"]),
+                         ("1500.000", "2.500", "1000.000"))
+        # a slower hub reporting an older sighting
+        body = patch(last_seen_ts="1400", last_voltage="2.9", last_audio_ts="1100", last_audio_ts_fract="5")
+        self.assertEqual((body["last_seen_ts"], body["last_voltage"], body["last_audio_ts"],
+                          body["last_audio_ts_fract"]), ("1500.000", "2.500", "1100.000", "5.000"))
+
+    def test_single_update_is_one_guarded_update(self):
+        first, second = [models.Member.objects.get(pk=self.members[0].pk) for _ in range(2)]
+        with self.assertNumQueries(2):
+            # the UPDATE and its telemetry sample
+            self.assertEqual(first.apply_status({"key": first.key, "last_seen_ts": Decimal("1500"),
+                                                 "last_voltage": Decimal("2.5")}), ["last_seen_ts"])
+        self.assertEqual((first.last_seen_ts, first.last_voltage), (1500, Decimal("2.5")))
+        # another hub with the same sighting, read before the first one's UPDATE
+        self.assertEqual(second.apply_status({"key": second.key, "last_seen_ts": Decimal("1500")}), [])
+        self.assertEqual(models.BadgeSample.objects.filter(member=first).count(), 1)
+
+    def test_latest_report_wins(self):
+        m0 = self.members[0]
+        results = self.post([{"key": m0.key, "last_seen_ts": "1500", "last_voltage": "3.0"},
+                             {"key": m0.key, "last_seen_ts": "1200", "last_voltage": "2.0"},
+                             {"key": m0.key, "last_seen_ts": "bad"}])
+        self.assertEqual([result["status"] for result in results], ["updated", "updated", "invalid"])
+        m0 = models.Member.objects.get(pk=m0.pk)
+        self.assertEqual((m0.last_seen_ts, m0.last_voltage), (1500, Decimal("3.0")))
+
+
+class TestCompressedUploads(TestCase):
+    """
+    Content-Encoding: gzip/deflate request bodies are decompressed by DecompressRequestMiddleware
+    """
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp() + "/"
+        self.settings_override = override_settings(DATA_DIR=self.data_dir)
+        self.settings_override.enable()
+
+        self.project = models.Project.objects.create(name="test-project")
+        self.hub = models.Hub.objects.create(name=_hub_name("one"), uuid=_hub_name("one"),
+                                             project=self.project)
+        with open(os.path.join(TESTDATA_DIR, "multi_audio_entry.txt"), "rb") as f:
+            self.body = f.read()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.data_dir)
+
+    def post(self, body, **headers):
+        return self.client.post('/{}/datafiles?data_type=audio'.format(self.project.key), body,
+                                content_type="application/x-ndjson",
+                                HTTP_X_HUB_UUID=self.hub.uuid, HTTP_X_APPKEY=APP_KEY, **headers)
+
+    def read_datafile(self):
+        datafile = models.DataFile.objects.get(uuid=self.hub.uuid + "_audio")
+        return b"".join(open(segment.filepath, "rb").read() for segment in datafile.get_segments())
+
+    def test_gzip(self):
+        buf = io.BytesIO()
+        with gzip.GzipFile(fileobj=buf, mode="wb") as f:
+            f.write(self.body)
+        resp = self.post(buf.getvalue(), HTTP_CONTENT_ENCODING="gzip")
+
+        self.assertEqual(json.loads(resp.content)["status"], "success")
+        self.assertEqual(self.read_datafile(), self.body)
+
+    def test_deflate(self):
+        resp = self.post(zlib.compress(self.body), HTTP_CONTENT_ENCODING="deflate")
+
+        self.assertEqual(json.loads(resp.content)["status"], "success")
+        self.assertEqual(self.read_datafile(), self.body)
+
+    def test_uncompressed(self):
+        resp = self.post(self.body)
+
+        self.assertEqual(json.loads(resp.content)["status"], "success")
+        self.assertEqual(self.read_datafile(), self.body)
+
+    def test_size_limit(self):
+        with override_settings(MAX_DECOMPRESSED_REQUEST_SIZE=1024 * 1024):
+            resp = self.post(zlib.compress(b"\n" * (50 * 1024 * 1024)), HTTP_CONTENT_ENCODING="deflate")
+        self.assertEqual(resp.status_code, 413)
+
+    def test_bad_body(self):
+        self.assertEqual(self.post(b"not compressed", HTTP_CONTENT_ENCODING="gzip").status_code, 400)
+        self.assertEqual(self.post(self.body, HTTP_CONTENT_ENCODING="br").status_code, 415)
+
+    def test_zstd_without_zstandard(self):
+        zstandard, middleware.zstandard = middleware.zstandard, None
+        self.addCleanup(setattr, middleware, "zstandard", zstandard)
+        self.assertEqual(self.post(self.body, HTTP_CONTENT_ENCODING="zstd").status_code, 415)
@@ -14,6 +14,10 @@ badges_details = views.MemberViewSet.as_view({
     #'post': 'create',
 })
 
+badges_status = views.MemberViewSet.as_view({
+    'post': 'bulk_status',
+})
+
 hubs_list = views.HubViewSet.as_view({
     'get': 'list',
     # 'post': 'create',
@@ -39,8 +43,10 @@ urlpatterns = [
     url(r'^(?P<project_key>\w+)/hubs$', views.hubs, name='hubs'),
     url(r'^(?P<project_key>\w+)/members', views.members, name='members'),
     url(r'^(?P<project_key>\w+)/datafiles', views.datafiles, name='datafiles'),
+    url(r'^(?P<project_key>\w+)/telemetry$', views.badge_telemetry, name='telemetry'),
 
     url(r'^badges/$', badges_list, name='badge-list'),
+    url(r'^badges/status$', badges_status, name='badge-status'),
     url(r'badges/(?P<key>\w+)', badges_details, name='badge-details'),
 
     url(r'^hubs/$', hubs_list, name='hub-list'),
@@ -1,4 +1,6 @@
+from calendar import timegm
 from functools import wraps
+import hashlib
 import time
 import sys
 import os
@@ -6,19 +8,28 @@ import simplejson
 
 from dateutil.parser import parse as parse_date
 from django.conf import settings
-from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseNotFound, JsonResponse
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseNotFound, JsonResponse, \
+    StreamingHttpResponse
 from django.shortcuts import render
+from django.utils.http import http_date
+from django.views.decorators.http import condition
 
 from rest_framework.decorators import api_view
 from rest_framework import viewsets
 from rest_framework.response import Response
 from rest_framework import status
 
+from . import datastore, jsonstream, telemetry
+from .chunklog import ChunkError, is_ndjson, iter_lines, scan_chunk
 from .decorators import app_view, is_god, is_own_project, require_hub_uuid
+from .hubcache import get_request_hub, http_request
+from .ingest import append_meeting_chunks, decode_datafile_chunks, decode_meeting_chunks, get_ingest_queue, \
+    get_or_init_datafile, queue_datafile_chunks, queue_meeting_chunks
 from .models import Meeting, Project, Hub, DataFile  # Chunk  # ActionDataChunk, SamplesDataChunk
 
 from .models import Member
-from .serializers import MemberSerializer, HubSerializer
+from .serializers import BadgeStatusSerializer, MemberSerializer, HubSerializer
 from .permissions import AppkeyRequired, HubUuidRequired
 
 
@@ -50,8 +61,7 @@ class MemberViewSet(viewsets.ModelViewSet):
         """
 
         # hub information is validated in the permission class
-        hub_uuid = self.request.META.get("HTTP_X_HUB_UUID")
-        hub = Hub.objects.prefetch_related("project").get(uuid=hub_uuid)
+        hub = get_request_hub(self.request)
         project = hub.project
 
         # Return only badges from the relevant project
@@ -71,8 +81,7 @@ class MemberViewSet(viewsets.ModelViewSet):
         """
         Creates a new member under the call hub project
         """
-        hub_uuid = request.META.get("HTTP_X_HUB_UUID")
-        hub = Hub.objects.prefetch_related("project").get(uuid=hub_uuid)
+        hub = get_request_hub(request)
         project = hub.project
 
         # request.data is from the POST object. Adding the project id
@@ -86,6 +95,33 @@ class MemberViewSet(viewsets.ModelViewSet):
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    def bulk_status(self, request, *args, **kwargs):
+        """
+        Applies the status reports of many badges at once, a list of {"key", "last_seen_ts", "last_voltage", ...}
+        either as the body or as its "badges". Returns a result for each report, in order.
+        """
+        reports = request.data.get("badges") if isinstance(request.data, dict) else request.data
+        if not isinstance(reports, list):
+            return Response({"detail": "Expected a list of badge statuses"}, status=status.HTTP_400_BAD_REQUEST)
+
+        checked = [BadgeStatusSerializer(data=report) for report in reports]
+        valid = [serializer.validated_data for serializer in checked if serializer.is_valid()]
+        moved = Member.apply_statuses(valid, project_id=get_request_hub(request).project_id)
+
+        results = []
+        for serializer in checked:
+            if serializer.errors:
+                results.append({"key": serializer.initial_data.get("key"), "status": "invalid",
+                                "errors": serializer.errors})
+                continue
+            key = serializer.validated_data["key"]
+            if key not in moved:
+                results.append({"key": key, "status": "not_found"})
+            else:
+                results.append({"key": key, "status": "updated" if moved[key] else "unchanged",
+                                "updated": moved[key]})
+        return Response({"badges": results})
+
 
 class HubViewSet(viewsets.ModelViewSet):
     queryset = Hub.objects.all()
@@ -141,6 +177,52 @@ def projects(request):
 def put_project(request):
     return json_response(status="Not Implemented")
 
+
+def get_roster(request):
+    """(project id, roster_version, roster_updated) of the requesting hub's project, read once per request"""
+    request = http_request(request)
+    if not hasattr(request, "roster"):
+        hub = get_request_hub(request)
+        request.roster = None
+        if hub is not None and hub.project_id is not None:
+            request.roster = Project.objects.values_list("id", "roster_version", "roster_updated").get(
+                pk=hub.project_id)
+    return request.roster
+
+
+def roster_response(request, obj):
+    response = JsonResponse(obj)
+    # informational only, conditional requests go by the ETag as Last-Modified has only second resolution
+    response["Last-Modified"] = http_date(timegm(get_roster(request)[2].utctimetuple()))
+    return response
+
+
+def project_roster_etag(request):
+    roster = get_roster(request)
+    if roster is None:
+        return None
+    # the project's name and key come from the (maybe cached) hub the body is built from
+    project = get_request_hub(request).project
+    shown = u"{}|{}".format(project.name, project.key)
+    return "project-{}-{}-{}".format(roster[0], roster[1], hashlib.md5(shown.encode("utf-8")).hexdigest()[:12])
+
+
+def hub_roster_etag(request, project_key):
+    roster = get_roster(request)
+    if roster is None:
+        return None
+    # the members sent depend on what the hub says it already has, its name and god from the (maybe cached) hub
+    # the body is built from: a worker with an older copy mustn't answer a 304 for the newer one's ETag
+    hub = get_request_hub(request)
+    since = u"{}|{}|{}|{}|{}|{}".format(request.META.get("HTTP_X_MEMBER_SYNC_TOKEN", ""),
+                                        request.META.get("HTTP_X_LAST_MEMBER_UPDATE", ""),
+                                        request.META.get("HTTP_X_MEETING_CURSOR", ""),
+                                        hub.project_id, hub.name, hub.god)
+    return "hub-{}-{}-{}-{}".format(roster[0], roster[1], hub.pk,
+                                    hashlib.md5(since.encode("utf-8")).hexdigest()[:12])
+
+
+@condition(etag_func=project_roster_etag)
 @api_view(['GET'])
 def get_project(request):
     hub_uuid = request.META.get("HTTP_X_HUB_UUID")
@@ -148,14 +230,13 @@ def get_project(request):
 
     if not hub_uuid:
         return HttpResponseBadRequest()
-    try:
-        hub = Hub.objects.prefetch_related("project").get(uuid=hub_uuid)
-    except Hub.DoesNotExist:
+    hub = get_request_hub(request)
+    if hub is None:
         return HttpResponseNotFound()
 
     project = hub.project  # type: Project
 
-    return JsonResponse(project.to_object())
+    return roster_response(request, project.to_object())
 
 
 ###########################
@@ -163,15 +244,20 @@ def get_project(request):
 ###########################
 
 
+@transaction.non_atomic_requests
 @app_view
 @api_view(['PUT', 'GET', 'POST'])
 def meetings(request, project_key):
-    if request.method == 'PUT':
-        return put_meeting(request, project_key)
-    elif request.method == 'GET':
-        return get_meetings(request, project_key)
-    elif request.method == 'POST':
+    # queued POSTs push once their transaction has committed, see ingest.queue_meeting_chunks
+    if request.method == 'POST' and get_ingest_queue() is not None:
         return post_meeting(request, project_key)
+    with transaction.atomic():
+        if request.method == 'PUT':
+            return put_meeting(request, project_key)
+        elif request.method == 'GET':
+            return get_meetings(request, project_key)
+        elif request.method == 'POST':
+            return post_meeting(request, project_key)
     return HttpResponseNotFound()
 
 
@@ -183,6 +269,9 @@ def put_meeting(request, project_key):
 
     hub_uuid = request.META.get("HTTP_X_HUB_UUID")
 
+    if "from_index" in request.data or "from_offset" in request.data:
+        return put_meeting_delta(request, project_key, log_file, hub_uuid)
+
     meeting_meta = simplejson.loads(log_file.readline())
     log_file.seek(0)
 
@@ -217,41 +306,179 @@ def put_meeting(request, project_key):
 
     meeting.log_file = log_file
 
-    meeting.hub = Hub.objects.get(uuid=hub_uuid)
+    meeting.hub = get_request_hub(request)
 
     meeting.start_time = meeting_data["start_time"]
 
-    meeting.is_complete = request.data["is_complete"] == 'true' if 'is_complete' in request.data else False
+    set_meeting_completion(request, meeting)
 
-    if meeting.is_complete:
-        meeting.ending_method = request.data['ending_method']
-        meeting.end_time = meeting.last_update_timestamp
+    # the log now holds everything the hub had, anything still queued is either in it or will mismatch
+    meeting.queued_index = None
+    meeting.save()
+
+    # the whole log was replaced
+    datastore.build_index(meeting.log_file.path, datastore.FORMAT_JSON)
+    meeting.parse_header()
+    meeting.save(update_fields=["header", "header_complete"])
+
+    response = {'detail': 'meeting created', "meeting_key": meeting.key}
+    response.update(meeting.get_high_water_mark())
+    return JsonResponse(response)
+
+
+def put_meeting_delta(request, project_key, log_file, hub_uuid):
+    """
+    Appends the tail of a meeting log to an existing meeting instead of replacing the whole file.
+    The upload carries the meeting's `uuid` and either
 
+    * `from_index` - the log_index of the first chunk in the file. Chunks the server already has
+      (log_index <= last_update_index) are skipped; a gap after last_update_index is a mismatch.
+    * `from_offset` - the byte offset in the server's log the file starts at. Bytes the server
+      already has are skipped; an offset past the end of the server's log is a mismatch.
+
+    Either way the response carries the server's high-water mark so the hub knows what to send next.
+    """
+    try:
+        meeting = Meeting.objects.select_for_update().get(uuid=request.data.get("uuid"), project__key=project_key)
+    except Meeting.DoesNotExist:
+        return HttpResponseNotFound()
+
+    if meeting.hub.uuid != hub_uuid:
+        return HttpResponseUnauthorized()
+
+    try:
+        from_index = int(request.data["from_index"]) if "from_index" in request.data else None
+        from_offset = int(request.data["from_offset"]) if "from_offset" in request.data else None
+    except ValueError:
+        return HttpResponseBadRequest()
+
+    high_water = meeting.get_high_water_mark()
+    if not meeting.log_file or log_file is None:
+        mismatch = True
+    elif from_offset is not None:
+        mismatch = from_offset > high_water["log_size"] or from_offset < 0
+    else:
+        mismatch = meeting.last_update_index is not None and from_index > meeting.last_update_index + 1
+
+    if mismatch:
+        response = {"status": "log mismatch", "meeting_key": meeting.key}
+        response.update(high_water)
+        return JsonResponse(response)
+
+    skip_through_index = None
+    if from_offset is not None:
+        log_file.read(high_water["log_size"] - from_offset)
+    else:
+        skip_through_index = meeting.last_update_index
+
+    chunks_appended = 0
+    index = datastore.open_index(meeting.log_file.path, datastore.FORMAT_JSON)
+    with open(meeting.log_file.path, 'ab') as f:
+        f.seek(0, 2)
+        if high_water["log_size"]:
+            with open(meeting.log_file.path, 'rb') as existing:
+                existing.seek(-1, 2)
+                if existing.read(1) != b"\n":
+                    f.write(b"\n")
+
+        for line in iter_lines(log_file, settings.MAX_CHUNK_SIZE):
+            try:
+                log_timestamp, log_index = scan_chunk(line)
+            except ChunkError:
+                continue
+            if log_index is not None and skip_through_index is not None and log_index <= skip_through_index:
+                continue
+
+            if not line.endswith(b"\n"):
+                line += b"\n"
+            index.add(f.tell(), log_timestamp, log_index)
+            f.write(line)
+            chunks_appended += 1
+
+            if meeting.header is not None and not meeting.header_complete:
+                try:
+                    meeting.update_header([simplejson.loads(line)])
+                except ValueError:
+                    pass
+
+            if log_index is not None:
+                meeting.last_update_index = log_index
+                meeting.last_update_timestamp = log_timestamp
+
+    index.close(os.path.getsize(meeting.log_file.path))
+
+    set_meeting_completion(request, meeting)
+
+    # the log now holds everything the hub had, anything still queued is either in it or will mismatch
+    meeting.queued_index = None
     meeting.save()
 
+    response = {'detail': 'meeting updated', "meeting_key": meeting.key, "chunks_appended": chunks_appended}
+    response.update(meeting.get_high_water_mark())
+    return JsonResponse(response)
 
-    return JsonResponse({'detail': 'meeting created', "meeting_key": meeting.key})
+
+def set_meeting_completion(request, meeting):
+    """marks a meeting as complete (or not) from the is_complete/ending_method fields of a PUT"""
+    meeting.is_complete = request.data["is_complete"] == 'true' if 'is_complete' in request.data else False
+
+    if meeting.is_complete:
+        meeting.ending_method = request.data['ending_method']
+        meeting.end_time = meeting.last_update_timestamp
 
 @app_view
 @api_view(['GET'])
 def get_meeting(request, project_key, meeting_key):
     try:
-        project = Project.objects.prefetch_related("meetings").get(key=project_key)
-        get_file = str(request.META.get("HTTP_X_GET_FILE")).lower() == "true"
-        return JsonResponse(project.get_meeting(get_file, meeting_key))
-    except Project.DoesNotExist:
+        meeting = Meeting.objects.select_related("project").get(project__key=project_key, uuid=meeting_key)
+    except Meeting.DoesNotExist:
         return HttpResponseNotFound()
 
+    get_file = str(request.META.get("HTTP_X_GET_FILE")).lower() == "true"
+    return StreamingHttpResponse(jsonstream.buffered(jsonstream.iter_meeting_map([meeting], get_file)),
+                                 content_type="application/json")
+
 @api_view(['GET'])
 def get_meetings(request, project_key):
+    """
+    Streams the project's meetings, oldest first, one meeting and one chunk at a time.
+    With X-PAGE-SIZE only that many meetings are returned, and X-NEXT-CURSOR in the response is passed
+    back as X-CURSOR to get the next page; it is left out on the last page.
+    """
     try:
-        project = Project.objects.prefetch_related("meetings").get(key=project_key)
-        get_file = str(request.META.get("HTTP_X_GET_FILE")).lower() == "true"
-        return JsonResponse(project.get_meetings(get_file))
-
+        project = Project.objects.get(key=project_key)
     except Project.DoesNotExist:
         return HttpResponseNotFound()
 
+    try:
+        cursor = int(request.META["HTTP_X_CURSOR"]) if request.META.get("HTTP_X_CURSOR") else None
+        page_size = int(request.META["HTTP_X_PAGE_SIZE"]) if request.META.get("HTTP_X_PAGE_SIZE") else None
+    except ValueError:
+        return HttpResponseBadRequest()
+    if page_size is not None and page_size < 1:
+        return HttpResponseBadRequest()
+
+    get_file = str(request.META.get("HTTP_X_GET_FILE")).lower() == "true"
+
+    meetings = project.meetings.order_by("id")
+    if cursor is not None:
+        meetings = meetings.filter(id__gt=cursor)
+
+    next_cursor = None
+    if page_size is None:
+        meetings = meetings.iterator()
+    else:
+        meetings = list(meetings[:page_size + 1])
+        if len(meetings) > page_size:
+            meetings = meetings[:page_size]
+            next_cursor = meetings[-1].id
+
+    response = StreamingHttpResponse(jsonstream.buffered(jsonstream.iter_meetings(meetings, get_file)),
+                                     content_type="application/json")
+    if next_cursor is not None:
+        response["X-NEXT-CURSOR"] = str(next_cursor)
+    return response
+
 
 @api_view(['POST'])
 @require_hub_uuid
@@ -260,9 +487,20 @@ def post_meeting(request, project_key):
 
     meeting = Meeting.objects.get(uuid=request.data.get('uuid'))
     chunks = request.data.get('chunks')
-    meeting.is_complete = False  # Make sure we always close a meeting with a PUT.
-    update_index = None
-    update_time = None
+
+    queue = get_ingest_queue()
+    if queue is not None:
+        if meeting.hub.uuid != request.META.get("HTTP_X_HUB_UUID"):
+            return HttpResponseUnauthorized()
+        try:
+            decoded = decode_meeting_chunks(chunks)
+        except ValueError:
+            return HttpResponseBadRequest()
+        # the continuity check the inline path does, against what is already queued too, so the hub still gets
+        # "log mismatch" (and resends with a PUT) instead of having its chunks dropped by the drainer
+        if not queue_meeting_chunks(queue, meeting, decoded):
+            return JsonResponse({"status": "log mismatch"})
+        return JsonResponse({"status": "queued", "meeting_key": meeting.key})
 
     print meeting.hub.name + " appending",
     chunks = simplejson.loads(chunks)
@@ -270,52 +508,77 @@ def post_meeting(request, project_key):
     if len(chunks) == 0:
         print " NO CHUNKS",
     else:
-        post_start_serial = simplejson.loads(chunks[0])['log_index']
-        if post_start_serial != meeting.last_update_index + 1:
-            #meeting.last_update_serial = -1
-            meeting.save()
-            return JsonResponse({"status": "log mismatch"})
         print "chunks",
 
-    log = meeting.log_file.file.name
-    with open(log, 'a') as f:
-        for chunk in chunks:
-            chunk_obj = simplejson.loads(chunk)
-            update_time = chunk_obj['log_timestamp']
-            update_index = chunk_obj['log_index']
-            f.write(chunk)
+    if not append_meeting_chunks(meeting, chunks):
+        return JsonResponse({"status": "log mismatch"})
 
     print "to", meeting
 
-
-    if update_time and update_index:
-        meeting.last_update_timestamp = update_time      # simplejson.loads(chunks[-1])['last_log_time']
-        meeting.last_update_index = update_index   # simplejson.loads(chunks[-1])['last_log_serial']
-
-    meeting.save()
-
     return JsonResponse({"status": "success", "meeting_key": meeting.key})
 
 ###########################
 # Data Log Level Endpoints #
 ###########################
 
-@is_own_project
-@require_hub_uuid
+@transaction.non_atomic_requests
 @app_view
-@api_view(['POST'])
+@api_view(['POST', 'GET'])
 def datafiles(request, project_key):
-    if request.method == 'POST':
+    # queued POSTs write nothing to the database, nor push inside a transaction that could still roll back
+    if request.method == 'POST' and get_ingest_queue() is not None:
         return post_datafile(request, project_key)
-    else:
-        return HttpResponseNotFound()
+    with transaction.atomic():
+        if request.method == 'POST':
+            return post_datafile(request, project_key)
+        elif request.method == 'GET':
+            return get_datafiles(request, project_key)
+    return HttpResponseNotFound()
+
+
+@api_view(['GET'])
+@is_own_project
+def get_datafiles(request, project_key):
+    """
+    Streams the project's DataFile chunks as newline-delimited JSON, oldest first within each DataFile.
+    Optional query parameters narrow it down: hub (hub uuid), data_type, start/end (log_timestamp)
+    and from_index/to_index (log_index). Each chunk gets the "hub" and "data_type" it came from.
+    """
+    params = request.query_params
+    try:
+        start = float(params["start"]) if params.get("start") else None
+        end = float(params["end"]) if params.get("end") else None
+        from_index = int(params["from_index"]) if params.get("from_index") else None
+        to_index = int(params["to_index"]) if params.get("to_index") else None
+    except ValueError:
+        return HttpResponseBadRequest()
+
+    matching = DataFile.objects.filter(project__key=project_key).select_related("hub").order_by("id")
+    if params.get("hub"):
+        matching = matching.filter(hub__uuid=params["hub"])
+    if params.get("data_type"):
+        matching = matching.filter(data_type=params["data_type"])
+
+    def stream():
+        for datafile in matching:
+            for chunk in datafile.get_chunks(start, end, from_index, to_index):
+                chunk["hub"] = datafile.hub.uuid
+                chunk["data_type"] = datafile.data_type
+                yield simplejson.dumps(chunk) + "\n"
+
+    return StreamingHttpResponse(stream(), content_type="application/x-ndjson")
+
 
 @api_view(['POST'])
+@is_own_project
+@require_hub_uuid
 def post_datafile(request, project_key):
     
     # using this header for consistency with meeting api
-    hub_uuid = request.META.get("HTTP_X_HUB_UUID")
-    hub = Hub.objects.get(uuid=hub_uuid)
+    hub = get_request_hub(request)
+
+    if is_ndjson(request.META.get("CONTENT_TYPE")):
+        return post_datafile_stream(request, project_key, hub)
 
     if not request.data.get("chunks"):
         return JsonResponse({
@@ -325,45 +588,49 @@ def post_datafile(request, project_key):
             "chunks_received": 0
         })
 
-    chunks = request.data.get("chunks")
     # I don't like this but it works for now
     # sometimes we don't get json objects from the request object
     # (with tests, but I don't know if it happens anywhere else?)
-    if not isinstance(chunks, dict) and not isinstance(chunks, list):
-        chunks = simplejson.loads(chunks)
+    try:
+        chunks = decode_datafile_chunks(request.data.get("chunks"))
+    except ValueError as e:
+        return JsonResponse({
+            "status": "failed",
+            "details": str(e),
+            "chunks_written": 0,
+            "chunks_received": 0
+        })
 
     data_type = request.data.get("data_type")
     chunks_received = len(chunks)
-    datafile_uuid = hub.uuid + "_" + data_type
 
-    try:
-        datafile = DataFile.objects.get(uuid=datafile_uuid)
-        if datafile.hub.uuid != hub_uuid:
-            # a hub cannot post data to another hub's file
+    queue = get_ingest_queue()
+    if queue is not None:
+        if get_or_init_datafile(hub, project_key, data_type) is None:
             return HttpResponseUnauthorized()
-    except DataFile.DoesNotExist:
-        datafile = DataFile()
-        datafile.uuid = datafile_uuid
-        datafile.data_type = data_type
-        datafile.hub = Hub.objects.get(uuid=hub_uuid)
-        datafile.project = Project.objects.get(key=project_key)
-        # check if file destination exists, create if not
-        folder = "".join((settings.DATA_DIR, hub.project.key))
-        if not os.path.exists(folder):
-            os.makedirs(folder)
-        datafile.filepath = "{}/{}.txt".format(folder, datafile_uuid)
+        queue_datafile_chunks(queue, hub, project_key, data_type, chunks=chunks)
+        return JsonResponse({
+            "status": "queued",
+            "chunks_queued": chunks_received,
+            "chunks_received": chunks_received
+        })
+
+    datafile = get_or_init_datafile(hub, project_key, data_type)
+    if datafile is None:
+        # a hub cannot post data to another hub's file
+        return HttpResponseUnauthorized()
     
     # we keep track of chunks written and received as a
     # very basic way to ensure data integrity
-    chunks_written = 0
-    with open(datafile.filepath, 'a') as f:
+    with datafile.open_writer() as writer:
         for chunk in chunks:
-            # storing this for the sake of if right now, 
-            # maybe useful in the future?
-            datafile.update_time = chunk['log_timestamp']
-            f.write(simplejson.dumps(chunk) + "\n")
-            chunks_written += 1
+            writer.write_chunk(chunk)
+    chunks_written = writer.chunks_written
 
+    # storing this for the sake of it right now,
+    # maybe useful in the future?
+    if writer.last_log_timestamp is not None:
+        datafile.last_update_timestamp = writer.last_log_timestamp
     datafile.save()
 
     return JsonResponse({
@@ -373,6 +640,113 @@ def post_datafile(request, project_key):
     })
 
 
+def post_datafile_stream(request, project_key, hub):
+    """
+    Streaming version of post_datafile, used when the body is newline-delimited chunks
+    (Content-Type: application/x-ndjson) and data_type is passed in the query string.
+
+    Chunks are never decoded: each line is checked for a log_timestamp / log_index with
+    scan_chunk and the original bytes are appended to the file as they are read, so memory
+    use stays flat no matter how large the upload is.
+    """
+    data_type = request.query_params.get("data_type")
+    if not data_type:
+        return HttpResponseBadRequest()
+
+    datafile = get_or_init_datafile(hub, project_key, data_type)
+    if datafile is None:
+        # a hub cannot post data to another hub's file
+        return HttpResponseUnauthorized()
+
+    queue = get_ingest_queue()
+    if queue is not None:
+        return queue_datafile_stream(request, project_key, hub, data_type, queue)
+
+    chunks_received = 0
+    writer = datafile.open_writer()
+    try:
+        with writer:
+            for line in iter_lines(request.stream, settings.MAX_CHUNK_SIZE):
+                chunks_received += 1
+                try:
+                    log_timestamp, log_index = scan_chunk(line)
+                    writer.write_line(line, log_timestamp, log_index)
+                except ValueError:
+                    # not a chunk (or, for packed files, not valid JSON); counted as received only
+                    continue
+    except ChunkError as e:
+        # whatever made it to disk before the oversized chunk is kept, the hub can tell from
+        # chunks_written where to resume
+        if writer.chunks_written:
+            datafile.last_update_timestamp = writer.last_log_timestamp
+            datafile.save()
+        return JsonResponse({
+            "status": "failed",
+            "details": str(e),
+            "chunks_written": writer.chunks_written,
+            "chunks_received": chunks_received
+        })
+
+    if not chunks_received:
+        return JsonResponse({
+            "status": "failed",
+            "details": "No data provided!",
+            "chunks_written": 0,
+            "chunks_received": 0
+        })
+
+    if writer.last_log_timestamp is not None:
+        datafile.last_update_timestamp = writer.last_log_timestamp
+    datafile.save()
+
+    return JsonResponse({
+        "status": "success",
+        "chunks_written": writer.chunks_written,
+        "chunks_received": chunks_received
+    })
+
+
+def queue_datafile_stream(request, project_key, hub, data_type, queue):
+    """
+    Write-behind version of post_datafile_stream, checks each line and pushes them onto the
+    ingest queue in batches of settings.INGEST_QUEUE_BATCH lines.
+    """
+    lines = []
+    chunks_queued = 0
+    chunks_received = 0
+
+    try:
+        for line in iter_lines(request.stream, settings.MAX_CHUNK_SIZE):
+            chunks_received += 1
+            try:
+                scan_chunk(line)
+            except ChunkError:
+                continue
+            # queue items are JSON, the odd byte that isn't UTF-8 becomes U+FFFD rather than failing the batch
+            lines.append(line.decode("utf-8", "replace"))
+            if len(lines) >= settings.INGEST_QUEUE_BATCH:
+                queue_datafile_chunks(queue, hub, project_key, data_type, lines=lines)
+                chunks_queued += len(lines)
+                lines = []
+    except ChunkError as e:
+        return JsonResponse({
+            "status": "failed",
+            "details": str(e),
+            "chunks_queued": chunks_queued,
+            "chunks_received": chunks_received
+        })
+
+    if lines:
+        queue_datafile_chunks(queue, hub, project_key, data_type, lines=lines)
+        chunks_queued += len(lines)
+
+    return JsonResponse({
+        "status": "queued",
+        "chunks_queued": chunks_queued,
+        "chunks_received": chunks_received
+    })
+
+
 #######################
 # Hub Level Endpoints #
 #######################
@@ -405,19 +779,29 @@ def put_hubs(request, project_key):
 
 @is_own_project
 @require_hub_uuid
+@condition(etag_func=hub_roster_etag)
 @api_view(['GET'])
 def get_hubs(request, project_key):
     hub_uuid = request.META.get("HTTP_X_HUB_UUID")
     last_update = request.META.get("HTTP_X_LAST_MEMBER_UPDATE")
+    sync_token = request.META.get("HTTP_X_MEMBER_SYNC_TOKEN")
     if not hub_uuid:
         return HttpResponseBadRequest()
-    try:
-        hub = Hub.objects.get(uuid=hub_uuid)
-    except Hub.DoesNotExist:
+    hub = get_request_hub(request)
+    if hub is None:
         return HttpResponseNotFound()
+    meeting_cursor = request.META.get("HTTP_X_MEETING_CURSOR")
+    try:
+        meeting_cursor = long(meeting_cursor) if meeting_cursor else None
+        if sync_token:
+            return roster_response(request, hub.get_object(sync_token=long(sync_token),
+                                                           meeting_cursor=meeting_cursor))
+    except ValueError:
+        return HttpResponseBadRequest()
     if not last_update:
-        return JsonResponse(hub.get_object(0))
-    return JsonResponse(hub.get_object(float(last_update)-10)) # account for some amount of async behaviour
+        return roster_response(request, hub.get_object(0, meeting_cursor=meeting_cursor))
+    # account for some amount of async behaviour
+    return roster_response(request, hub.get_object(float(last_update)-10, meeting_cursor=meeting_cursor))
 
 
 @is_own_project
@@ -464,6 +848,40 @@ def post_members(request, project_key):
     return JsonResponse({"status": "Not Implemented"})
 
 
+@app_view
+@api_view(['GET'])
+@is_own_project
+def badge_telemetry(request, project_key):
+    """
+    The voltage / last seen history of the project's badges between start and end (epoch seconds, the last day by
+    default), from the 1-minute or 1-hour rollups depending on the window unless resolution (raw|minute|hour) says
+    otherwise. badges narrows it down to some badge keys, comma-separated.
+    """
+    params = request.query_params
+    try:
+        end = float(params["end"]) if params.get("end") else time.time()
+        start = float(params["start"]) if params.get("start") else end - telemetry.DAY
+    except ValueError:
+        return HttpResponseBadRequest()
+    if params.get("resolution"):
+        if params["resolution"] not in telemetry.RESOLUTIONS:
+            return HttpResponseBadRequest()
+        resolution = telemetry.RESOLUTIONS[params["resolution"]]
+    else:
+        resolution = telemetry.choose_resolution(start, end)
+
+    members = Member.objects.filter(project__key=project_key)
+    if params.get("badges"):
+        members = members.filter(key__in=params["badges"].split(","))
+
+    return JsonResponse({
+        "start": start,
+        "end": end,
+        "resolution": resolution,
+        "badges": telemetry.history(members, start, end, resolution),
+    })
+
+
 #########################
 # Test #
 #########################